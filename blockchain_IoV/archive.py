@@ -0,0 +1,187 @@
+from array import array
+from bisect import bisect_right
+import os
+import struct
+import threading
+import zlib
+
+from codec import Decoder, Encoder, encode_frames, iter_frames
+from config import ARCHIVE_SEGMENT_BLOCKS
+
+
+class BlockArchive:
+    """
+        Compressed storage of the old blocks of a pruned node
+
+        Blocks leave the block log a segment at a time, every segment is one file
+        (segment-<index of its first block>.bin) which is never changed afterwards:
+
+            header:         magic, first index, number of blocks, bytes and crc32 of the headers
+            headers:        zlib of the framed block headers with their hashes (codec HEADER)
+            offsets:        where every block starts in the bodies, and where they end ('I' each)
+            bodies:         every block on its own as [crc32: 4 bytes][zlib of the raw block]
+                            (codec RAW_BLOCK, as in the block log)
+
+        The headers are a small part of a segment, so the header chain of the archived
+        blocks is read without touching their transactions, and a block is read and
+        decompressed on its own when it is used. A segment is written to a temporary
+        file first and then renamed, so a crash leaves either the whole segment or none of it.
+
+        self.path:              directory of the segments
+        self.segment_blocks:    blocks per segment
+        self.count:             number of archived blocks, they are the blocks [0, count)
+        self.size:              bytes of the segment files
+    """
+
+    MAGIC = b'IOVSEG1\x00'
+    HEADER = struct.Struct('<8sQIII')
+    CHECKSUM = struct.Struct('<I')
+
+    def __init__(self, path, segment_blocks=ARCHIVE_SEGMENT_BLOCKS):
+        self.path = path
+        self.segment_blocks = segment_blocks
+        self.count = 0
+        self.size = 0
+        self.__firsts = []
+        self.__offsets = {}
+        self.__lock = threading.Lock()
+
+
+    def open(self):
+        """
+            Find the segments, they must follow each other from block 0 on: a segment
+            after a missing or broken one is ignored. Returns the number of archived blocks.
+        """
+
+        self.count = 0
+        self.size = 0
+        self.__firsts = []
+        self.__offsets = {}
+        if not os.path.isdir(self.path):
+            return 0
+        firsts = []
+        for name in os.listdir(self.path):
+            if name.startswith('segment-') and name.endswith('.bin'):
+                try:
+                    firsts.append(int(name[len('segment-'):-len('.bin')]))
+                except ValueError:
+                    pass
+        for first in sorted(firsts):
+            if first != self.count:
+                print('Archive segment {} does not follow block {}, ignoring it'.format(first, self.count))
+                break
+            try:
+                start, offsets = self.__body_offsets(first)
+                if os.path.getsize(self.__segment_path(first)) != start + offsets[-1]:
+                    raise ValueError('wrong size')
+            except (IOError, ValueError, IndexError, struct.error) as e:
+                print('Archive segment {} is broken, ignoring it: {}'.format(first, e))
+                self.__offsets.pop(first, None)
+                break
+            self.__firsts.append(first)
+            self.count += len(offsets) - 1
+            self.size += start + offsets[-1]
+        return self.count
+
+
+    def append(self, blocks):
+        """ Archive the given blocks as one segment, they are the next blocks after the archived ones """
+
+        if len(blocks) == 0:
+            return
+        if blocks[0].index != self.count:
+            raise ValueError('Block {} does not follow the archive ({} blocks)'.format(blocks[0].index, self.count))
+        os.makedirs(self.path, exist_ok=True)
+        headers = zlib.compress(b''.join(encode_frames(Encoder.encode_header(block) for block in blocks)))
+        bodies = []
+        offsets = array('I', [0])
+        for block in blocks:
+            body = zlib.compress(Encoder.encode_raw_block(block))
+            bodies.append(self.CHECKSUM.pack(zlib.crc32(body)) + body)
+            offsets.append(offsets[-1] + len(bodies[-1]))
+        header = self.HEADER.pack(self.MAGIC, self.count, len(blocks), len(headers), zlib.crc32(headers))
+        path = self.__segment_path(self.count)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, mode='wb') as f:
+            f.write(header)
+            f.write(headers)
+            f.write(offsets.tobytes())
+            f.write(b''.join(bodies))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        start = len(header) + len(headers) + len(offsets) * offsets.itemsize
+        with self.__lock:
+            self.__offsets[self.count] = (start, offsets)
+        self.__firsts.append(self.count)
+        self.count += len(blocks)
+        self.size += start + offsets[-1]
+
+
+    def read(self, index):
+        """ the archived block `index`, its transactions stay encoded """
+
+        first = self.__segment_of(index)
+        start, offsets = self.__body_offsets(first)
+        position = index - first
+        with open(self.__segment_path(first), mode='rb') as f:
+            f.seek(start + offsets[position])
+            data = f.read(offsets[position + 1] - offsets[position])
+        body = data[self.CHECKSUM.size:]
+        if len(data) < self.CHECKSUM.size or zlib.crc32(body) != self.CHECKSUM.unpack_from(data)[0]:
+            raise ValueError('Archived block {} is broken'.format(index))
+        return Decoder().decode_block(zlib.decompress(body))
+
+
+    def headers(self, index):
+        """ (first index, header-only blocks) of the segment holding block `index` """
+
+        first = self.__segment_of(index)
+        _, _, _, headers_size, headers_crc = self.__read_header(first)
+        with open(self.__segment_path(first), mode='rb') as f:
+            f.seek(self.HEADER.size)
+            data = f.read(headers_size)
+        if zlib.crc32(data) != headers_crc:
+            raise ValueError('Archive segment {} is broken'.format(first))
+        return first, [Decoder.decode_header(message) for message in iter_frames([zlib.decompress(data)])]
+
+
+    def __segment_of(self, index):
+        """ first index of the segment holding block `index` """
+
+        if not 0 <= index < self.count:
+            raise IndexError('block {} is not archived'.format(index))
+        return self.__firsts[bisect_right(self.__firsts, index) - 1]
+
+
+    def __body_offsets(self, first):
+        """ (file offset of the bodies, offset of every body in them) of a segment, read once """
+
+        offsets = self.__offsets.get(first)
+        if offsets is None:
+            _, _, count, headers_size, _ = self.__read_header(first)
+            table = array('I')
+            with open(self.__segment_path(first), mode='rb') as f:
+                f.seek(self.HEADER.size + headers_size)
+                table.frombytes(f.read((count + 1) * table.itemsize))
+            if len(table) != count + 1:
+                raise ValueError('Archive segment {} is too short'.format(first))
+            offsets = (self.HEADER.size + headers_size + len(table) * table.itemsize, table)
+            with self.__lock:
+                self.__offsets[first] = offsets
+        return offsets
+
+
+    def __read_header(self, first):
+        with open(self.__segment_path(first), mode='rb') as f:
+            data = f.read(self.HEADER.size)
+        if len(data) != self.HEADER.size:
+            raise ValueError('Archive segment {} is too short'.format(first))
+        header = self.HEADER.unpack(data)
+        if header[0] != self.MAGIC or header[1] != first:
+            raise ValueError('Archive segment {} has a wrong header'.format(first))
+        return header
+
+
+    def __segment_path(self, first):
+        return os.path.join(self.path, 'segment-{:010d}.bin'.format(first))
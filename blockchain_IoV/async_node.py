@@ -0,0 +1,876 @@
+"""
+    The node of node.py on an asyncio event loop (aiohttp), for many clients at once
+
+        python async_node.py [-p 5000]
+
+    It serves the same routes as node.py, except the ui pages. Needs aiohttp (pip install aiohttp).
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, wait
+from itertools import islice
+import json
+import threading
+import uuid
+
+import aiohttp
+from aiohttp import web
+
+from block import Block
+from blockchain import Blockchain
+from broadcast import Broadcaster
+from codec import MIMETYPE, Encoder, encode_frames, loads_block, loads_transaction, loads_transactions
+from config import MAX_HEADERS, MAX_BLOCKS, MAX_PAGE_TRANSACTIONS, INGEST_FILE, BLOCK_PRODUCER, BROADCAST_TIMEOUT, \
+    BROADCAST_WORKERS, BROADCAST_QUEUE_SIZE, ASYNC_WORKERS, ASYNC_STREAM_BATCH, PRUNE_KEEP_BLOCKS
+from ingest import FileIngestor
+from metrics import registry, BROADCAST_SECONDS, BROADCAST_RESPONSES, HTTP_RESPONSES
+from producer import BlockProducer
+from profiler import SamplingProfiler
+from wallet import Wallet
+
+
+class AsyncBroadcaster(Broadcaster):
+    """
+        Broadcaster whose posts to the peer nodes run on the event loop (aiohttp)
+
+        The blockchain calls it from executor threads, never from the loop itself:
+        broadcast(), query() and ask() wait for the loop, enqueue() only schedules the
+        broadcast and waits when BROADCAST_QUEUE_SIZE broadcasts are still in flight.
+        Chain downloads still use self.session (requests) in the executor threads.
+
+        self.loop:              event loop of the node
+        self.client:            aiohttp session, created by open() on the loop
+    """
+
+    def __init__(self, loop, timeout=BROADCAST_TIMEOUT, queue_size=BROADCAST_QUEUE_SIZE):
+        super().__init__(timeout)
+        self.loop = loop
+        self.client = None
+        self.__slots = threading.BoundedSemaphore(queue_size)
+        self.__in_flight = set()
+        self.__lock = threading.Lock()
+
+
+    async def open(self):
+        self.client = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout),
+                                            connector=aiohttp.TCPConnector(limit_per_host=BROADCAST_WORKERS))
+
+
+    async def close(self):
+        await self.client.close()
+
+
+    def broadcast(self, nodes, path, payload, data=None):
+        return asyncio.run_coroutine_threadsafe(self.broadcast_async(nodes, path, payload, data), self.loop).result()
+
+
+    def query(self, nodes, path):
+        return asyncio.run_coroutine_threadsafe(self.query_async(nodes, path), self.loop).result()
+
+
+    def ask(self, nodes, path, payload):
+        return asyncio.run_coroutine_threadsafe(self.ask_async(nodes, path, payload), self.loop).result()
+
+
+    def enqueue(self, nodes, path, payload, callback=None, data=None):
+        nodes = list(nodes)
+        if len(nodes) == 0:
+            return
+        self.__slots.acquire()
+        future = asyncio.run_coroutine_threadsafe(self.__send(nodes, path, payload, callback, data), self.loop)
+        with self.__lock:
+            self.__in_flight.add(future)
+        future.add_done_callback(self.__done)
+
+
+    def join(self):
+        with self.__lock:
+            in_flight = list(self.__in_flight)
+        wait(in_flight)
+
+
+    def pending(self):
+        return len(self.__in_flight)
+
+
+    async def broadcast_async(self, nodes, path, payload, data=None):
+        """ node -> response status code, None when the node could not be reached """
+        nodes = list(nodes)
+        results = await asyncio.gather(*(self.__post(node, path, payload, data) for node in nodes))
+        return dict(zip(nodes, results))
+
+
+    async def query_async(self, nodes, path):
+        """ node -> decoded json, None when the node could not be reached """
+        nodes = list(nodes)
+        results = await asyncio.gather(*(self.__get(node, path) for node in nodes))
+        return dict(zip(nodes, results))
+
+
+    async def ask_async(self, nodes, path, payload):
+        """ node -> decoded json answer to the posted payload, None when the node could not be reached """
+        nodes = list(nodes)
+        results = await asyncio.gather(*(self.__ask(node, path, payload) for node in nodes))
+        return dict(zip(nodes, results))
+
+
+    async def __send(self, nodes, path, payload, callback, data):
+        try:
+            results = await self.broadcast_async(nodes, path, payload, data)
+            if callback is not None:
+                callback(results)
+        except Exception as e:
+            print('Broadcasting FAILED: {}'.format(e))
+
+
+    def __done(self, future):
+        with self.__lock:
+            self.__in_flight.discard(future)
+        self.__slots.release()
+
+
+    async def __post(self, node, path, payload, data=None):
+        with BROADCAST_SECONDS.labels(node, path).time():
+            status = await self.__send_one(node, path, payload, data)
+        BROADCAST_RESPONSES.labels(path, status if status is not None else 'unreachable').inc()
+        return status
+
+
+    async def __send_one(self, node, path, payload, data=None):
+        url = 'http://{}/{}'.format(node, path)
+        try:
+            if data is not None:
+                async with self.client.post(url, data=data, headers={'Content-Type': MIMETYPE}) as response:
+                    if response.status != 415:
+                        return response.status
+            async with self.client.post(url, json=payload) as response:
+                return response.status
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            print('Error occurred when Broadcasting to {}'.format(node))
+            return None
+
+
+    async def __ask(self, node, path, payload):
+        url = 'http://{}/{}'.format(node, path)
+        try:
+            with BROADCAST_SECONDS.labels(node, path).time():
+                async with self.client.post(url, json=payload) as response:
+                    BROADCAST_RESPONSES.labels(path, response.status).inc()
+                    if response.status != 200:
+                        return None
+                    return await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            BROADCAST_RESPONSES.labels(path, 'unreachable').inc()
+            return None
+
+
+    async def __get(self, node, path):
+        url = 'http://{}/{}'.format(node, path)
+        try:
+            async with self.client.get(url) as response:
+                if response.status != 200:
+                    return None
+                return await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            return None
+
+
+class AsyncNode:
+    """
+        The routes of node.py as aiohttp handlers
+
+        A handler never blocks the event loop: reads of the published chain state
+        (head, peers, open transactions) are answered on the loop, everything which
+        signs, verifies, mines, touches the disk or waits for the blockchain's writer
+        thread runs in self.executor. Streamed responses are encoded there as well,
+        ASYNC_STREAM_BATCH items at a time.
+
+        self.blockchain:        blockchain of the node
+        self.wallet:            wallet of the node
+        self.producer:          block producer
+        self.ingestor:          file ingestion service
+        self.profiler:          sampling profiler of the /profiler routes
+        self.executor:          threads for the blocking calls
+        self.instance:          part of every ETag, so they never match after a restart
+    """
+
+    def __init__(self, blockchain, wallet, producer, workers=ASYNC_WORKERS):
+        self.blockchain = blockchain
+        self.wallet = wallet
+        self.producer = producer
+        self.executor = ThreadPoolExecutor(workers)
+        self.instance = uuid.uuid4().hex[:8]
+        self.profiler = SamplingProfiler()
+        # with the block producer on, it decides when the ingested rows are mined
+        self.ingestor = FileIngestor(INGEST_FILE, './db/ingest-{}.json'.format(blockchain.node_id), self.submit_rows,
+                                     None if BLOCK_PRODUCER else blockchain.mine_block)
+
+
+    def application(self):
+        app = web.Application(middlewares=[count_responses])
+        app.add_routes([
+            web.get('/transactions', self.get_open_transactions),
+            web.get('/chain', self.get_chain),
+            web.get('/chain/head', self.get_chain_head),
+            web.get('/headers', self.get_headers),
+            web.get('/blocks', self.get_blocks),
+            web.get('/proof/{tx_id}', self.get_transaction_proof),
+            web.get('/tx/{tx_id}', self.get_transaction),
+            web.get('/owner/{owner}/transactions', self.get_owner_transactions),
+            web.post('/node', self.add_node),
+            web.delete('/node/{node_url}', self.remove_node),
+            web.get('/nodes', self.get_nodes),
+            web.post('/wallet', self.create_keys),
+            web.get('/wallet', self.load_keys),
+            web.post('/broadcast-transaction', self.broadcast_transaction),
+            web.post('/broadcast-transactions', self.broadcast_transactions),
+            web.post('/broadcast-block', self.broadcast_block),
+            web.post('/inventory', self.inventory),
+            web.post('/transaction', self.add_transaction),
+            web.post('/transactions/batch', self.add_transactions),
+            web.post('/mine', self.mine),
+            web.get('/producer', self.get_producer_status),
+            web.post('/producer/start', self.start_producer),
+            web.post('/producer/stop', self.stop_producer),
+            web.post('/resolve-conflicts', self.resolve_conflicts),
+            web.post('/file-check', self.timed_check),
+            web.post('/ingest/start', self.start_ingest),
+            web.post('/ingest/stop', self.stop_ingest),
+            web.get('/ingest/status', self.get_ingest_status),
+            web.get('/metrics', self.get_metrics),
+            web.get('/profiler', self.get_profiler_status),
+            web.post('/profiler/start', self.start_profiler),
+            web.post('/profiler/stop', self.stop_profiler),
+            web.get('/profiler/stacks', self.get_profiler_stacks)
+        ])
+        app.on_startup.append(self.on_startup)
+        app.on_cleanup.append(self.on_cleanup)
+        return app
+
+
+    async def on_startup(self, app):
+        broadcaster = AsyncBroadcaster(asyncio.get_running_loop())
+        await broadcaster.open()
+        self.blockchain.broadcaster = broadcaster
+        if BLOCK_PRODUCER:
+            self.producer.start()
+
+
+    async def on_cleanup(self, app):
+        await self.run_blocking(self.producer.stop)
+        await self.run_blocking(self.ingestor.stop)
+        await self.run_blocking(self.profiler.stop)
+        await self.blockchain.broadcaster.close()
+        self.executor.shutdown(wait=False)
+
+
+    async def run_blocking(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+
+    # transaction and chain
+    async def get_open_transactions(self, request):
+        """ open transactions, paginated with ?cursor=&limit= and streamed (json array or ?format=ndjson) """
+        page = page_range(request, MAX_PAGE_TRANSACTIONS)
+        if page is None:
+            return invalid_limit()
+        start, end = page
+        tag = '{}-{}-{}-{}-{}'.format(self.instance, self.blockchain.head()['hash'],
+                                      self.blockchain.open_transactions_version(), start, end)
+        transactions = self.blockchain.get_open_transactions(start, end)
+        items = (tx.to_dict() for tx in transactions)
+        return await self.stream_items(request, items, tag, end if end is not None and len(transactions) == end - start else None)
+
+
+    async def get_chain(self, request):
+        """ blocks, paginated with ?cursor=&limit= and streamed (json array, ?format=ndjson or binary) """
+        page = page_range(request, MAX_BLOCKS)
+        if page is None:
+            return invalid_limit()
+        start, end = page
+        head = self.blockchain.head()
+        height = head['height']
+        end = height + 1 if end is None else min(end, height + 1)
+        tag = '{}-{}-{}-{}'.format(self.instance, head['hash'], start, end)
+        # no cursor unless the page moved forward, a client following it always ends
+        next_cursor = end if start < end <= height else None
+        if wants_binary(request):
+            return await self.stream_blocks(request, self.blockchain.iter_blocks(start, end), tag, next_cursor)
+        items = (block.to_dict() for block in self.blockchain.iter_blocks(start, end))
+        return await self.stream_items(request, items, tag, next_cursor)
+
+
+    async def stream_items(self, request, items, tag, next_cursor):
+        """ the items as a chunked json array, or one json object per line (see node.stream_items) """
+
+        ndjson = request.query.get('format') == 'ndjson' or \
+            request.headers.get('Accept', '').startswith('application/x-ndjson')
+
+        def generate():
+            if ndjson:
+                for item in items:
+                    yield (json.dumps(item) + '\n').encode()
+                return
+            yield b'['
+            for count, item in enumerate(items):
+                yield ((',' if count else '') + json.dumps(item)).encode()
+            yield b']'
+
+        return await self.stream(request, generate(), tag, next_cursor,
+                                 'application/x-ndjson' if ndjson else 'application/json')
+
+
+    async def stream_blocks(self, request, blocks, tag, next_cursor):
+        """ the blocks in the binary encoding of codec.py, one Encoder for the whole response """
+
+        encoder = Encoder()
+        chunks = encode_frames(encoder.encode_block(block) for block in blocks)
+        return await self.stream(request, chunks, tag + '-bin', next_cursor, MIMETYPE, vary='Accept')
+
+
+    async def stream(self, request, chunks, tag, next_cursor, content_type, vary=None):
+        """ Send the byte chunks, encoded in the executor; an unchanged ETag gets an empty 304 """
+
+        headers = {'ETag': '"{}"'.format(tag)}
+        if vary is not None:
+            headers['Vary'] = vary
+        if etag_matches(request, tag):
+            return web.Response(status=304, headers=headers)
+        if next_cursor is not None:
+            headers['X-Next-Cursor'] = str(next_cursor)
+
+        response = web.StreamResponse(status=200, headers=headers)
+        response.content_type = content_type
+        response.enable_chunked_encoding()
+        await response.prepare(request)
+        while True:
+            data = await self.run_blocking(take, chunks, ASYNC_STREAM_BATCH)
+            if len(data) == 0:
+                break
+            await response.write(data)
+        await response.write_eof()
+        return response
+
+
+    async def get_chain_head(self, request):
+        return web.json_response(self.blockchain.head(), status=200)
+
+
+    async def get_headers(self, request):
+        start, end = block_range(request, MAX_HEADERS)
+        headers = await self.run_blocking(self.blockchain.get_headers, start, end)
+        return web.json_response(headers, status=200)
+
+
+    async def get_blocks(self, request):
+        start, end = block_range(request, MAX_BLOCKS)
+        if wants_binary(request):
+            encoder = Encoder()
+            blocks = self.blockchain.iter_blocks(start, end)
+            data = await self.run_blocking(lambda: b''.join(encode_frames(encoder.encode_block(block) for block in blocks)))
+            return web.Response(body=data, status=200, content_type=MIMETYPE)
+        blocks = await self.run_blocking(self.blockchain.get_blocks, start, end)
+        return web.json_response(blocks, status=200)
+
+
+    async def get_transaction_proof(self, request):
+        """ merkle branch of a mined transaction, check it with utility.merkle.verify_inclusion """
+        proof = await self.run_blocking(self.blockchain.get_transaction_proof, request.match_info['tx_id'])
+        if proof is None:
+            response = {'message': 'Transaction not found in a block.'}
+            return web.json_response(response, status=404)
+        return web.json_response(proof, status=200)
+
+
+    async def get_transaction(self, request):
+        transaction = await self.run_blocking(self.blockchain.get_transaction, request.match_info['tx_id'])
+        if transaction is None:
+            response = {'message': 'Transaction not found in a block.'}
+            return web.json_response(response, status=404)
+        return web.json_response(transaction, status=200)
+
+
+    async def get_owner_transactions(self, request):
+        """ mined transactions of a dataOwner, paginated with ?cursor=&limit= (at most MAX_PAGE_TRANSACTIONS a page) """
+        page = page_range(request, MAX_PAGE_TRANSACTIONS)
+        if page is None:
+            return invalid_limit()
+        start, end = page
+        limit = MAX_PAGE_TRANSACTIONS if end is None else end - start
+        tag = '{}-{}-{}-{}'.format(self.instance, self.blockchain.head()['hash'], start, limit)
+        transactions, next_cursor = await self.run_blocking(self.blockchain.get_owner_transactions,
+                                                            request.match_info['owner'], start, limit)
+        return await self.stream_items(request, iter(transactions), tag, next_cursor)
+
+
+    # nodes
+    async def add_node(self, request):
+        values = await json_body(request)
+        if not values:
+            response = {'message': 'No data attached.'}
+            return web.json_response(response, status=400)
+        if 'node' not in values:
+            response = {'message': 'No node data found.'}
+            return web.json_response(response, status=400)
+        await self.run_blocking(self.blockchain.add_peer_node, values['node'])
+        response = {
+            'message': 'Node added successfully.',
+            'all_nodes': self.blockchain.get_peer_nodes()
+        }
+        return web.json_response(response, status=201)
+
+
+    async def remove_node(self, request):
+        node_url = request.match_info['node_url']
+        if node_url == '':
+            response = {'message': 'No node found.'}
+            return web.json_response(response, status=400)
+        await self.run_blocking(self.blockchain.remove_peer_node, node_url)
+        response = {
+            'message': 'Successfullt removed node.',
+            'all_nodes': self.blockchain.get_peer_nodes()
+        }
+        return web.json_response(response, status=200)
+
+
+    async def get_nodes(self, request):
+        response = {
+            'message': 'Successfully get nodes',
+            'all_nodes': self.blockchain.get_peer_nodes()
+        }
+        return web.json_response(response, status=200)
+
+
+    # keys
+    async def create_keys(self, request):
+        await self.run_blocking(self.wallet.create_keys)
+        if await self.run_blocking(self.wallet.save_keys):
+            self.blockchain.public_key = self.wallet.public_key
+            response = {
+                'message': 'Keys created successfully',
+                'public_key': self.wallet.public_key,
+                'private_key': self.wallet.private_key
+            }
+            return web.json_response(response, status=201)
+        response = {'message': 'Saving the keys failed.'}
+        return web.json_response(response, status=500)
+
+
+    async def load_keys(self, request):
+        if await self.run_blocking(self.wallet.load_keys):
+            self.blockchain.public_key = self.wallet.public_key
+            response = {
+                'message': 'Keys loaded successfully',
+                'public_key': self.wallet.public_key,
+                'private_key': self.wallet.private_key
+            }
+            return web.json_response(response, status=201)
+        response = {'message': 'Loading the keys failed.'}
+        return web.json_response(response, status=500)
+
+
+    # broadcast
+    async def broadcast_transaction(self, request):
+        if request.content_type == MIMETYPE:
+            try:
+                values = loads_transaction(await request.read()).to_dict()
+            except (ValueError, IndexError):
+                values = None
+        else:
+            values = await json_body(request)
+
+        if not values:
+            response = {'message': 'No data found.'}
+            return web.json_response(response, status=400)
+        required = ['dataOwner', 'signature', 'hop_count']
+        if not all(key in values for key in required):
+            response = {'message': 'Some data is missing.'}
+            return web.json_response(response, status=400)
+
+        success = await self.run_blocking(self.blockchain.add_transaction, values['dataOwner'],
+                                          values['signature'], values['hop_count'], True)
+        if success:
+            response = {
+                'message': 'Successfully added transaction.',
+                'transaction': {
+                    'dataOwner': values['dataOwner'],
+                    'signature': values['signature'],
+                    'hop_count': values['hop_count']
+                }
+            }
+            return web.json_response(response, status=201)
+        response = {'message': 'Creating a transaction failed.'}
+        return web.json_response(response, status=500)
+
+
+    async def broadcast_transactions(self, request):
+        if request.content_type == MIMETYPE:
+            try:
+                transactions = [tx.to_dict() for tx in loads_transactions(await request.read())]
+            except (ValueError, IndexError):
+                transactions = None
+        else:
+            values = await json_body(request)
+            transactions = values.get('transactions') if isinstance(values, dict) else None
+
+        required = ['dataOwner', 'signature', 'hop_count']
+        if not isinstance(transactions, list) or \
+                not all(isinstance(values, dict) and all(key in values for key in required) for values in transactions):
+            response = {'message': 'Some data is missing.'}
+            return web.json_response(response, status=400)
+
+        added = await self.run_blocking(self.add_received, transactions)
+        if added == len(transactions):
+            response = {'message': 'Successfully added transactions.', 'added': added}
+            return web.json_response(response, status=201)
+        response = {'message': 'Creating a transaction failed.', 'added': added}
+        return web.json_response(response, status=500)
+
+
+    def add_received(self, transactions):
+        """ add the transactions of a peer, returns how many were added """
+        return sum(1 for values in transactions if self.blockchain.add_transaction(
+            values['dataOwner'], values['signature'], values['hop_count'], True))
+
+
+    async def broadcast_block(self, request):
+        if request.content_type == MIMETYPE:
+            try:
+                values = {'block': loads_block(await request.read())}
+            except (ValueError, IndexError):
+                values = None
+        else:
+            values = await json_body(request)
+        if not values:
+            response = {'message': 'No data found.'}
+            return web.json_response(response, status=400)
+        if 'block' not in values:
+            response = {'message': 'Some data is missing.'}
+            return web.json_response(response, status=400)
+        try:
+            block = values['block'] if isinstance(values['block'], Block) else Block.from_dict(values['block'])
+        except (KeyError, TypeError):
+            response = {'message': 'Some data is missing.'}
+            return web.json_response(response, status=400)
+        # relayed by several peers, only the first copy is looked at
+        if not self.blockchain.gossip.new_block(block):
+            response = {'message': 'Block already known.'}
+            return web.json_response(response, status=200)
+        local_height = self.blockchain.head()['height']
+        if block.index == local_height + 1:
+            if await self.run_blocking(self.blockchain.add_block, block):
+                response = {'message': 'Successflly added block'}
+                return web.json_response(response, status=201)
+            response = {'message': 'Block seems invalid.'}
+            return web.json_response(response, status=409)
+        elif block.index > local_height:
+            response = {'message': 'Blockchain seems to differ from local blockchain, syncing.'}
+            self.blockchain.resolve_conflicts = True
+            self.blockchain.sync.trigger()
+            return web.json_response(response, status=200)
+        response = {'message': 'Blockchain seems to be shorter, block not added'}
+        return web.json_response(response, status=409)
+
+
+    async def inventory(self, request):
+        values = await json_body(request)
+        if not values:
+            response = {'message': 'No data found.'}
+            return web.json_response(response, status=400)
+        return web.json_response(await self.run_blocking(self.blockchain.gossip.wanted, values))
+
+
+    async def add_transaction(self, request):
+        if self.wallet.public_key == None:
+            response = {'message': 'No wallet set up.'}
+            return web.json_response(response, status=400)
+        values = await json_body(request)
+        if not values:
+            response = {'message': 'No data found.'}
+            return web.json_response(response, status=400)
+        if 'hop_count' not in values:
+            response = {'message': 'Required data is missing.'}
+            return web.json_response(response, status=400)
+
+        hop_count = values['hop_count']
+        signature = await self.run_blocking(self.wallet.sign_transaction, self.wallet.public_key, hop_count)
+        success = await self.run_blocking(self.blockchain.add_transaction, self.wallet.public_key, signature, hop_count)
+        if success:
+            response = {
+                'message': 'Successfully added transaction.',
+                'transaction': {
+                    'dataOwner': self.wallet.public_key,
+                    'signature': signature,
+                    'hop_count': hop_count
+                }
+            }
+            return web.json_response(response, status=201)
+        response = {'message': 'Creating a transaction failed.'}
+        return web.json_response(response, status=500)
+
+
+    async def add_transactions(self, request):
+        if self.wallet.public_key == None:
+            response = {'message': 'No wallet set up.'}
+            return web.json_response(response, status=400)
+        values = await json_body(request)
+        if not values or not isinstance(values.get('hop_counts'), list):
+            response = {'message': 'Required data is missing.'}
+            return web.json_response(response, status=400)
+
+        hop_counts = values['hop_counts']
+        added = await self.run_blocking(self.add_txs_backend, hop_counts)
+        transactions = [{
+            'dataOwner': self.wallet.public_key,
+            'signature': signature,
+            'hop_count': hop_count
+        } for hop_count, signature in added]
+        if len(added) == len(hop_counts):
+            response = {
+                'message': 'Successfully added transactions.',
+                'transactions': transactions
+            }
+            return web.json_response(response, status=201)
+        response = {
+            'message': 'Creating a transaction failed.',
+            'transactions': transactions
+        }
+        return web.json_response(response, status=500)
+
+
+    async def mine(self, request):
+        if self.blockchain.resolve_conflicts:
+            response = {'message': 'Resolve conflicts first, block not added!'}
+            return web.json_response(response, status=409)
+        block = await self.run_blocking(self.blockchain.mine_block)
+        if block is not None:
+            response = {
+                'message': 'Block added successfully.',
+                'block': block.to_dict()
+            }
+            return web.json_response(response, status=201)
+        response = {
+            'message': 'Adding a block failed.',
+            'wallet_set_up': self.wallet.public_key != None
+        }
+        return web.json_response(response, status=500)
+
+
+    async def get_producer_status(self, request):
+        return web.json_response(self.producer.status(), status=200)
+
+
+    async def start_producer(self, request):
+        self.producer.start()
+        return web.json_response(self.producer.status(), status=200)
+
+
+    async def stop_producer(self, request):
+        await self.run_blocking(self.producer.stop)
+        return web.json_response(self.producer.status(), status=200)
+
+
+    async def resolve_conflicts(self, request):
+        replaced = await self.run_blocking(self.blockchain.resolve)
+        if replaced:
+            response = {'message': 'Chain was replaced!'}
+        else:
+            response = {'message': 'Local chain kept!'}
+        return web.json_response(response, status=200)
+
+
+    # local file check
+    async def timed_check(self, request):
+        if self.wallet.public_key == None:
+            response = {'message': 'No wallet set up.'}
+            return web.json_response(response, status=400)
+        self.ingestor.start()
+        response = {
+            'message': 'Successfully get checked',
+            'status': self.ingestor.status()
+        }
+        return web.json_response(response, status=200)
+
+
+    async def start_ingest(self, request):
+        if self.wallet.public_key == None:
+            response = {'message': 'No wallet set up.'}
+            return web.json_response(response, status=400)
+        started = self.ingestor.start()
+        response = {
+            'message': 'Ingestion started.' if started else 'Ingestion is already running.',
+            'status': self.ingestor.status()
+        }
+        return web.json_response(response, status=200)
+
+
+    async def stop_ingest(self, request):
+        await self.run_blocking(self.ingestor.stop)
+        response = {
+            'message': 'Ingestion stopped.',
+            'status': self.ingestor.status()
+        }
+        return web.json_response(response, status=200)
+
+
+    async def get_ingest_status(self, request):
+        return web.json_response(self.ingestor.status(), status=200)
+
+
+    # instrumentation
+    async def get_metrics(self, request):
+        return web.Response(text=registry.render(), status=200, headers={'Content-Type': 'text/plain; version=0.0.4'})
+
+
+    async def get_profiler_status(self, request):
+        return web.json_response(self.profiler.status(), status=200)
+
+
+    async def start_profiler(self, request):
+        interval = request.query.get('interval')
+        try:
+            self.profiler.start(float(interval) if interval is not None else None)
+        except ValueError:
+            self.profiler.start()
+        return web.json_response(self.profiler.status(), status=200)
+
+
+    async def stop_profiler(self, request):
+        await self.run_blocking(self.profiler.stop)
+        return web.json_response(self.profiler.status(), status=200)
+
+
+    async def get_profiler_stacks(self, request):
+        return web.Response(text=self.profiler.report(query_int(request, 'limit')), status=200)
+
+
+    def submit_rows(self, rows):
+        """ add the rows as transactions, returns how many were added before the first failure """
+        added = self.add_txs_backend(rows)
+        if len(added) != len(rows):
+            print('Error occurred in add_txs_backend')
+        return len(added)
+
+
+    def add_txs_backend(self, hop_counts):
+        """ sign the hop counts as one batch, returns (hop_count, signature) of the added ones up to the first failure """
+        if self.wallet.public_key == None or any(hop_count == None for hop_count in hop_counts):
+            return []
+        signatures = self.wallet.sign_many(hop_counts)
+        added = []
+        for hop_count, signature in zip(hop_counts, signatures):
+            if not self.blockchain.add_transaction(self.wallet.public_key, signature, hop_count):
+                break
+            added.append((hop_count, signature))
+        return added
+
+
+@web.middleware
+async def count_responses(request, handler):
+    """ count the responses per route and status, like node.count_response """
+
+    resource = request.match_info.route.resource
+    rule = resource.canonical if resource is not None else 'unknown'
+    try:
+        response = await handler(request)
+    except web.HTTPException as e:
+        HTTP_RESPONSES.labels(rule, e.status).inc()
+        raise
+    HTTP_RESPONSES.labels(rule, response.status).inc()
+    return response
+
+
+def take(chunks, count):
+    """ the next `count` byte chunks joined, b'' when there are none left """
+    return b''.join(islice(chunks, count))
+
+
+async def json_body(request):
+    """ the json body of the request, None when it has none """
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+def query_int(request, name, default=None):
+    try:
+        return int(request.query[name])
+    except (KeyError, ValueError):
+        return default
+
+
+def page_range(request, max_limit):
+    """ [cursor, cursor + limit) of the request, limit is optional and at most max_limit; None when it is below 1 """
+    start = max(0, query_int(request, 'cursor', 0))
+    limit = query_int(request, 'limit')
+    if limit is None:
+        return start, None
+    if limit < 1:
+        return None
+    return start, start + min(limit, max_limit)
+
+
+def invalid_limit():
+    response = {'message': 'limit must be at least 1.'}
+    return web.json_response(response, status=400)
+
+
+def block_range(request, limit):
+    """ [from, to) of the request, at most `limit` blocks """
+    start = max(0, query_int(request, 'from', 0))
+    end = query_int(request, 'to', start + limit)
+    return start, min(end, start + limit)
+
+
+def accept_quality(request, mimetype):
+    """ quality the Accept header gives the mimetype, the most specific match counts """
+
+    accept = request.headers.get('Accept')
+    if accept is None:
+        return 1.0
+    main_type = mimetype.split('/')[0]
+    best = None
+    for entry in accept.split(','):
+        parts = [part.strip() for part in entry.split(';')]
+        quality = 1.0
+        for param in parts[1:]:
+            if param.startswith('q='):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        specificity = {mimetype: 2, main_type + '/*': 1, '*/*': 0}.get(parts[0])
+        if specificity is not None and (best is None or specificity > best[0]):
+            best = (specificity, quality)
+    return best[1] if best is not None else 0.0
+
+
+def wants_binary(request):
+    """ the client asked for the binary encoding (json wins when both are equally accepted) """
+    return accept_quality(request, MIMETYPE) > accept_quality(request, 'application/json')
+
+
+def etag_matches(request, tag):
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is None:
+        return False
+    tags = [value.strip() for value in if_none_match.split(',')]
+    return '*' in tags or any(value.replace('W/', '', 1).strip('"') == tag for value in tags)
+
+
+def main():
+    from argparse import ArgumentParser
+    parser = ArgumentParser()
+    parser.add_argument('-p', '--port', type=int, default=5000)
+    parser.add_argument('--prune', type=int, default=PRUNE_KEEP_BLOCKS, help='full blocks kept, the older ones are archived')
+    args = parser.parse_args()
+    port = args.port
+    wallet = Wallet(port)
+    blockchain = Blockchain(wallet.public_key, port, args.prune)
+    producer = BlockProducer(lambda: blockchain)
+    node = AsyncNode(blockchain, wallet, producer)
+    web.run_app(node.application(), host='0.0.0.0', port=port)
+
+
+if __name__ == '__main__':
+    main()
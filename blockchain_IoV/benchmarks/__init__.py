@@ -0,0 +1,7 @@
+"""
+    Benchmarks for the blockchain core
+
+    Run them from the blockchain_IoV folder, e.g.
+
+        python -m benchmarks.block_log
+"""
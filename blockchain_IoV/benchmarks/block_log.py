@@ -0,0 +1,62 @@
+"""
+    Cost of persisting one new block through Blockchain.save_data
+    at different chain heights.
+
+        python -m benchmarks.block_log [--heights 10 100 1000 10000 100000]
+"""
+import os
+import tempfile
+import time
+from argparse import ArgumentParser
+
+from block import Block
+from block_log import BlockLog
+from blockchain import Blockchain
+from transaction import Transaction
+
+
+def make_block(index):
+    transactions = [Transaction('owner-{}'.format(i), 'signature-{}'.format(i), str(i)) for i in range(3)]
+    return Block(index, 'hash-{}'.format(index - 1), transactions, index, float(index))
+
+
+def measure(height, appends):
+    """ return the mean time (seconds) of save_data for one new block at the given height """
+
+    node_id = 'bench-{}'.format(height)
+    log = BlockLog('./db/blocklog-{}.bin'.format(node_id), fsync_every=1024)
+    log.append_many([make_block(index) for index in range(height)])
+    log.close()
+
+    blockchain = Blockchain(None, node_id)
+    chain = list(blockchain.chain)
+    elapsed = 0.0
+    for index in range(height, height + appends):
+        chain.append(make_block(index))
+        blockchain.chain = chain
+        start = time.perf_counter()
+        blockchain.save_data(save_chain=True)
+        elapsed += time.perf_counter() - start
+    return elapsed / appends
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--heights', type=int, nargs='+', default=[10, 100, 1000, 10000, 100000])
+    parser.add_argument('--appends', type=int, default=200)
+    args = parser.parse_args()
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        os.mkdir('db')
+        try:
+            print('{:>10} {:>16}'.format('height', 'us / block'))
+            for height in args.heights:
+                print('{:>10} {:>16.1f}'.format(height, measure(height, args.appends) * 1e6))
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+    Broadcast latency against the number of peers, using local stub peers.
+
+        python -m benchmarks.broadcast [--peers 1 2 4 8 16] [--delay 0.05]
+"""
+import json
+import threading
+import time
+from argparse import ArgumentParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from broadcast import Broadcaster
+
+
+def start_stub(delay):
+    """ a peer which answers every post with 201 after `delay` seconds """
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            time.sleep(delay)
+            body = json.dumps({'message': 'ok'}).encode()
+            self.send_response(201)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def sequential(nodes, payload):
+    """ the old loop: one fresh requests.post per peer, one after another """
+    for node in nodes:
+        requests.post('http://{}/broadcast-transaction'.format(node), json=payload)
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--peers', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--delay', type=float, default=0.05, help='seconds every stub peer takes to answer')
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    servers = [start_stub(args.delay) for _ in range(max(args.peers))]
+    all_nodes = ['127.0.0.1:{}'.format(server.server_address[1]) for server in servers]
+    payload = {'dataOwner': 'owner' * 60, 'signature': 'signature' * 28, 'hop_count': '1\n'}
+    broadcaster = Broadcaster()
+
+    print('{:>6} {:>16} {:>16}'.format('peers', 'sequential (ms)', 'parallel (ms)'))
+    for peers in args.peers:
+        nodes = all_nodes[:peers]
+        start = time.perf_counter()
+        for _ in range(args.rounds):
+            sequential(nodes, payload)
+        old = (time.perf_counter() - start) / args.rounds
+        start = time.perf_counter()
+        for _ in range(args.rounds):
+            broadcaster.broadcast(nodes, 'broadcast-transaction', payload)
+        new = (time.perf_counter() - start) / args.rounds
+        print('{:>6} {:>16.1f} {:>16.1f}'.format(peers, old * 1000, new * 1000))
+
+    for server in servers:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
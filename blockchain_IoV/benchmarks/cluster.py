@@ -0,0 +1,369 @@
+"""
+    Local multi-node harness: nodes which are Blockchain objects in the same process,
+    connected by an in-memory network instead of HTTP.
+
+    Broadcasts (the /inventory and /broadcast-* posts), head queries and the chain sync downloads
+    (/headers, /blocks, /chain) all go through Network, which can delay, drop and
+    partition messages. The nodes answer them like the routes of node.py.
+
+    The nodes store their files under ./db like real nodes, run it in a scratch directory.
+"""
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+import heapq
+import json
+import random
+import threading
+import time
+from urllib.parse import urlsplit, parse_qsl
+
+import requests
+
+from block import Block
+from blockchain import Blockchain
+from broadcast import Broadcaster
+from codec import MIMETYPE, Encoder, encode_frames, loads_block, loads_transaction, loads_transactions
+from config import MAX_HEADERS, MAX_BLOCKS
+
+
+class Network:
+    """
+        In-memory transport between the nodes of a LocalCluster
+
+        A message is delivered after latency + uniform(0, jitter) seconds, unless it
+        is lost (probability `loss`) or its two nodes are in different partitions;
+        the sender then sees the node as unreachable. Delivery runs in a pool of
+        threads, a scheduler thread hands the messages over when they are due,
+        so a broadcast to hundreds of nodes takes one latency, not hundreds.
+
+        self.latency:           one-way delay in seconds
+        self.jitter:            random extra delay in seconds
+        self.loss:              probability that a message is dropped
+        self.partitions:        address -> partition number, nodes missing from it reach every node
+        self.sent:              messages sent
+        self.dropped:           messages lost or sent across partitions
+        self.closed:            True once close() was called, every message is dropped
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, loss=0.0, workers=32, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.partitions = {}
+        self.sent = 0
+        self.dropped = 0
+        self.closed = False
+        self.__random = random.Random(seed)
+        self.__executor = ThreadPoolExecutor(workers)
+        self.__queue = []
+        self.__order = 0
+        self.__condition = threading.Condition()
+        self.__thread = None
+
+
+    def partition(self, *groups):
+        """ Split the nodes into the given groups of addresses """
+        self.partitions = {address: number for number, group in enumerate(groups) for address in group}
+
+
+    def heal(self):
+        self.partitions = {}
+
+
+    def close(self):
+        """ Drop every message from now on, the nodes stay as they are """
+        self.closed = True
+        self.__executor.shutdown(wait=False)
+
+
+    def reachable(self, source, target):
+        return self.partitions.get(source, -1) == self.partitions.get(target, -1) or \
+            source not in self.partitions or target not in self.partitions
+
+
+    def delay(self):
+        return self.latency + (self.__random.random() * self.jitter if self.jitter else 0.0)
+
+
+    def dropped_message(self, source, target):
+        """ True (and counted) when the message from source to target does not arrive """
+
+        self.sent += 1
+        if self.closed or not self.reachable(source, target) or (self.loss and self.__random.random() < self.loss):
+            self.dropped += 1
+            return True
+        return False
+
+
+    def send(self, source, target, function, *args):
+        """ Future of function(*args) run after the delay, of None when the message is dropped """
+
+        future = Future()
+        if self.dropped_message(source, target):
+            function, args = None, ()
+        self.__schedule(time.perf_counter() + self.delay(), future, function, args)
+        return future
+
+
+    def call(self, source, target, function, *args):
+        """ Run function(*args) in the calling thread after a round trip, like a blocking request """
+
+        if self.dropped_message(source, target):
+            time.sleep(2 * self.delay())
+            raise requests.exceptions.ConnectionError('{} cannot reach {}'.format(source, target))
+        delay = 2 * self.delay()
+        if delay > 0:
+            time.sleep(delay)
+        return function(*args)
+
+
+    def __schedule(self, due, future, function, args):
+        with self.__condition:
+            if self.__thread is None:
+                self.__thread = threading.Thread(target=self.__run, daemon=True)
+                self.__thread.start()
+            self.__order += 1
+            heapq.heappush(self.__queue, (due, self.__order, future, function, args))
+            self.__condition.notify()
+
+
+    def __run(self):
+        while True:
+            with self.__condition:
+                while len(self.__queue) == 0 or self.__queue[0][0] > time.perf_counter():
+                    timeout = self.__queue[0][0] - time.perf_counter() if len(self.__queue) != 0 else None
+                    self.__condition.wait(timeout)
+                _, _, future, function, args = heapq.heappop(self.__queue)
+            if function is None or self.closed:
+                future.set_result(None)
+            else:
+                self.__executor.submit(self.__deliver, future, function, args)
+
+
+    @staticmethod
+    def __deliver(future, function, args):
+        try:
+            future.set_result(function(*args))
+        except Exception as e:
+            print('Delivering a message FAILED: {}'.format(e))
+            future.set_result(500)
+
+
+class LocalResponse:
+    """ The parts of requests.Response which the chain sync uses """
+
+    def __init__(self, status_code, content_type, content):
+        self.status_code = status_code
+        self.headers = {'Content-Type': content_type}
+        self.content = content
+
+
+    def json(self):
+        return json.loads(self.content.decode())
+
+
+    def iter_content(self, chunk_size=65536):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start:start + chunk_size]
+
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError('{} status'.format(self.status_code))
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        return False
+
+
+class LocalSession:
+    """ Stands in for the requests session of a node's broadcaster, for GET requests """
+
+    def __init__(self, cluster, address):
+        self.cluster = cluster
+        self.address = address
+
+
+    def get(self, url, params=None, headers=None, timeout=None, stream=False):
+        parts = urlsplit(url)
+        query = dict(parse_qsl(parts.query))
+        query.update({key: str(value) for key, value in (params or {}).items()})
+        accept = (headers or {}).get('Accept', '')
+        return self.cluster.network.call(self.address, parts.netloc, self.cluster.serve,
+                                         parts.netloc, parts.path.lstrip('/'), query, accept)
+
+
+class LocalBroadcaster(Broadcaster):
+    """
+        Broadcaster of a cluster node, sends through the network of the cluster.
+        enqueue() still sends from the background thread of Broadcaster.
+
+        self.cluster:           the LocalCluster of the node
+        self.address:           address of the node
+    """
+
+    def __init__(self, cluster, address):
+        super().__init__()
+        self.cluster = cluster
+        self.address = address
+        self.session = LocalSession(cluster, address)
+
+
+    def broadcast(self, nodes, path, payload, data=None):
+        network = self.cluster.network
+        futures = {node: network.send(self.address, node, self.cluster.post, node, path, payload, data) for node in nodes}
+        wait(futures.values())
+        return {node: future.result() for node, future in futures.items()}
+
+
+    def query(self, nodes, path):
+        network = self.cluster.network
+        futures = {node: network.send(self.address, node, self.cluster.get, node, path) for node in nodes}
+        wait(futures.values())
+        return {node: future.result() for node, future in futures.items()}
+
+
+    def ask(self, nodes, path, payload):
+        network = self.cluster.network
+        futures = {node: network.send(self.address, node, self.cluster.answer, node, path, payload) for node in nodes}
+        wait(futures.values())
+        return {node: future.result() for node, future in futures.items()}
+
+
+class LocalCluster:
+    """
+        Nodes connected by a Network, by default every one a peer of all the others
+
+        self.nodes:             address -> Blockchain
+        self.addresses:         addresses in creation order
+        self.network:           transport between the nodes
+    """
+
+    def __init__(self, size, public_key=None, prefix='node', network=None, peers=None, seed=None):
+        """
+            peers:              number of random peers of each node, all the other nodes when None
+        """
+
+        self.addresses = ['{}-{}'.format(prefix, index) for index in range(size)]
+        self.network = network if network is not None else Network()
+        self.nodes = {}
+        for address in self.addresses:
+            node = Blockchain(public_key, address)
+            node.broadcaster = LocalBroadcaster(self, address)
+            self.nodes[address] = node
+
+        choose = random.Random(seed)
+        for address, node in self.nodes.items():
+            others = [peer for peer in self.addresses if peer != address]
+            if peers is not None and peers < len(others):
+                others = choose.sample(others, peers)
+            node.add_peer_nodes(others)
+
+
+    def __getitem__(self, index):
+        return self.nodes[self.addresses[index]]
+
+
+    def __len__(self):
+        return len(self.addresses)
+
+
+    def post(self, address, path, payload, data=None):
+        """ what the /broadcast-* routes of node.py answer, None when there is no such node """
+
+        node = self.nodes.get(address)
+        if node is None:
+            return None
+        if path == 'broadcast-transaction':
+            values = loads_transaction(data).to_dict() if data is not None else payload
+            added = node.add_transaction(values['dataOwner'], values['signature'], values['hop_count'], is_receiving=True)
+            return 201 if added else 500
+        if path == 'broadcast-transactions':
+            transactions = [tx.to_dict() for tx in loads_transactions(data)] if data is not None else payload['transactions']
+            added = sum(1 for values in transactions if node.add_transaction(
+                values['dataOwner'], values['signature'], values['hop_count'], is_receiving=True))
+            return 201 if added == len(transactions) else 500
+        if path == 'broadcast-block':
+            block = loads_block(data) if data is not None else Block.from_dict(payload['block'])
+            if not node.gossip.new_block(block):
+                return 200
+            height = node.head()['height']
+            if block.index == height + 1:
+                return 201 if node.add_block(block) else 409
+            if block.index > height:
+                node.resolve_conflicts = True
+                node.sync.trigger()
+                return 200
+            return 409
+        return 404
+
+
+    def answer(self, address, path, payload):
+        """ what the node answers to a posted json payload (/inventory), None when there is no such node """
+
+        node = self.nodes.get(address)
+        if node is None or path != 'inventory':
+            return None
+        return node.gossip.wanted(payload)
+
+
+    def get(self, address, path):
+        node = self.nodes.get(address)
+        if node is None or path != 'chain/head':
+            return None
+        return node.head()
+
+
+    def serve(self, address, path, query, accept=''):
+        """ a LocalResponse to a GET of /chain/head, /headers, /blocks or /chain """
+
+        node = self.nodes.get(address)
+        if node is None:
+            raise requests.exceptions.ConnectionError('no node {}'.format(address))
+        if path == 'chain/head':
+            return self.__json(node.head())
+        if path in ('headers', 'blocks'):
+            limit = MAX_HEADERS if path == 'headers' else MAX_BLOCKS
+            start = max(0, int(query.get('from', 0)))
+            end = min(int(query.get('to', start + limit)), start + limit)
+        elif path == 'chain':
+            start, end = 0, None
+        else:
+            return LocalResponse(404, 'application/json', b'{}')
+
+        if path == 'headers':
+            return self.__json(node.get_headers(start, end))
+        if MIMETYPE in accept:
+            encoder = Encoder()
+            data = b''.join(encode_frames(encoder.encode_block(block) for block in node.iter_blocks(start, end)))
+            return LocalResponse(200, MIMETYPE, data)
+        return self.__json([block.to_dict() for block in node.iter_blocks(start, end)])
+
+
+    @staticmethod
+    def __json(value):
+        return LocalResponse(200, 'application/json', json.dumps(value).encode())
+
+
+    def heads(self):
+        """ hash of the tip of every node """
+        return [node.head()['hash'] for node in self.nodes.values()]
+
+
+    def converged(self):
+        """ True when every node has the same tip """
+        return len(set(self.heads())) == 1
+
+
+    def join(self):
+        """ Wait until every queued broadcast is delivered """
+        for node in self.nodes.values():
+            node.broadcaster.join()
+
+
+    def close(self):
+        """ Disconnect the nodes, e.g. before the next cluster of a benchmark starts """
+        self.network.close()
@@ -0,0 +1,95 @@
+"""
+    Size and speed of the json and the binary (codec.py) encoding of blocks
+    of signed transactions.
+
+        python -m benchmarks.codec [--blocks 20] [--transactions 500] [--owners 1 10]
+"""
+import json
+import time
+from argparse import ArgumentParser
+
+from block import Block
+from codec import Decoder, Encoder, dumps_transaction
+from transaction import Transaction
+from utility.hash_util import hash_block, hash_transaction
+from utility.merkle import merkle_root
+from wallet import Wallet
+
+
+def make_chain(blocks, transactions, owners):
+    """ blocks of real 1024 bit RSA keys / signatures, the owners take turns """
+
+    wallets = []
+    for _ in range(owners):
+        wallet = Wallet('bench')
+        wallet.private_key, wallet.public_key = wallet.generate_keys()
+        wallets.append(wallet)
+    signatures = {}
+    chain = []
+    previous_hash = ''
+    for index in range(blocks):
+        txs = []
+        for position in range(transactions):
+            wallet = wallets[position % owners]
+            hop_count = '{}\n'.format(position % 15)
+            key = (wallet.public_key, hop_count)
+            if key not in signatures:
+                signatures[key] = wallet.sign_transaction(wallet.public_key, hop_count)
+            txs.append(Transaction(wallet.public_key, signatures[key], hop_count))
+        root = merkle_root([hash_transaction(tx) for tx in txs])
+        block = Block(index, previous_hash, txs, index * 7, time.time(), 12, root)
+        previous_hash = hash_block(block)
+        chain.append(block)
+    return chain
+
+
+def measure(chain):
+    """ (bytes per transaction, encoded transactions / s, decoded transactions / s) of json and binary """
+
+    transactions = sum(len(block.transactions) for block in chain)
+    results = {}
+
+    start = time.perf_counter()
+    payloads = [json.dumps(block.to_dict()).encode() for block in chain]
+    encode = time.perf_counter() - start
+    start = time.perf_counter()
+    decoded = [Block.from_dict(json.loads(payload.decode())) for payload in payloads]
+    decode = time.perf_counter() - start
+    size = sum(len(payload) for payload in payloads)
+    results['json'] = (size / transactions, transactions / encode, transactions / decode)
+
+    start = time.perf_counter()
+    encoder = Encoder()
+    payloads = [encoder.encode_block(block) for block in chain]
+    encode = time.perf_counter() - start
+    start = time.perf_counter()
+    decoder = Decoder()
+    decoded = [decoder.decode_block(payload) for payload in payloads]
+    decode = time.perf_counter() - start
+    size = sum(len(payload) for payload in payloads)
+    results['binary'] = (size / transactions, transactions / encode, transactions / decode)
+
+    assert [hash_block(block) for block in decoded] == [hash_block(block) for block in chain]
+    return results
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--blocks', type=int, default=20)
+    parser.add_argument('--transactions', type=int, default=500)
+    parser.add_argument('--owners', type=int, nargs='+', default=[1, 10])
+    args = parser.parse_args()
+
+    for owners in args.owners:
+        chain = make_chain(args.blocks, args.transactions, owners)
+        tx = chain[0].transactions[0]
+        print('{} owner(s), {} blocks of {} transactions'.format(owners, args.blocks, args.transactions))
+        print('    one transaction on its own: {} bytes json, {} bytes binary'.format(
+            len(json.dumps(tx.to_dict()).encode()), len(dumps_transaction(tx))))
+        print('    {:>8} {:>12} {:>14} {:>14}'.format('', 'bytes / tx', 'encode tx/s', 'decode tx/s'))
+        for name, (size, encode, decode) in measure(chain).items():
+            print('    {:>8} {:>12.1f} {:>14.0f} {:>14.0f}'.format(name, size, encode, decode))
+
+
+if __name__ == '__main__':
+    main()
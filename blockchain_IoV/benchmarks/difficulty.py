@@ -0,0 +1,46 @@
+"""
+    Simulated block intervals under difficulty retargeting while miners join and leave.
+
+    No hashing is done: with n miners of `rate` hashes per second, a block at
+    difficulty d takes an exponential time with mean 2**d / (n * rate).
+
+        python -m benchmarks.difficulty [--rate 50000] [--miners 1 8 32 4] [--blocks 200]
+"""
+import random
+from argparse import ArgumentParser
+
+from block import Block
+from config import TARGET_BLOCK_TIME
+from utility.difficulty import next_difficulty
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--rate', type=float, default=50000, help='hashes per second of one miner')
+    parser.add_argument('--miners', type=int, nargs='+', default=[1, 8, 32, 4])
+    parser.add_argument('--blocks', type=int, default=200, help='blocks per phase')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    chain = [Block(0, '', [], 100, 0)]
+    now = 0.0
+    print('target block time: {}s'.format(TARGET_BLOCK_TIME))
+    print('{:>7} {:>18} {:>18} {:>11}'.format('miners', 'first 20 avg (s)', 'last 50 avg (s)', 'difficulty'))
+    for miners in args.miners:
+        intervals = []
+        for _ in range(args.blocks):
+            difficulty = next_difficulty(chain)
+            interval = rng.expovariate(miners * args.rate / 2 ** difficulty)
+            now += interval
+            intervals.append(interval)
+            chain.append(Block(len(chain), '', [], 0, now, difficulty))
+        print('{:>7} {:>18.2f} {:>18.2f} {:>11}'.format(
+            miners,
+            sum(intervals[:20]) / 20,
+            sum(intervals[-50:]) / 50,
+            chain[-1].difficulty))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+    Memory held by a loaded chain, per 100k transactions: blocks keeping
+    transaction objects against blocks keeping their encoded transactions,
+    and how long loading the block log takes.
+
+        python -m benchmarks.memory [--transactions 200000] [--block-size 500]
+"""
+import os
+import tempfile
+import time
+import tracemalloc
+from argparse import ArgumentParser
+
+from block import Block
+from block_log import BlockLog
+from transaction import Transaction
+from utility.hash_util import hash_transaction
+from utility.merkle import merkle_root
+
+
+def make_blocks(transactions, block_size, owners):
+    """ blocks with the sizes of 1024 bit RSA keys and signatures (random hex, they are not verified) """
+
+    keys = [os.urandom(162).hex() for _ in range(owners)]
+    blocks = []
+    for index in range(1, transactions // block_size + 1):
+        txs = [Transaction(keys[position % owners], os.urandom(128).hex(), '{}\n'.format(position % 15))
+               for position in range(block_size)]
+        blocks.append(Block(index, os.urandom(32).hex(), txs, index, float(index), 12,
+                            merkle_root([hash_transaction(tx) for tx in txs])))
+    return blocks
+
+
+def measure(load):
+    """ (allocated bytes of what load() returns, seconds load() took) """
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    chain = load()
+    elapsed = time.perf_counter() - start
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del chain
+    return size, elapsed
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--transactions', type=int, default=200000)
+    parser.add_argument('--block-size', type=int, default=500)
+    parser.add_argument('--owners', type=int, default=1)
+    args = parser.parse_args()
+
+    blocks = make_blocks(args.transactions, args.block_size, args.owners)
+    count = len(blocks) * args.block_size
+    with tempfile.TemporaryDirectory() as tmp:
+        log = BlockLog(os.path.join(tmp, 'blocklog.bin'))
+        log.rewrite(blocks)
+        del blocks
+
+        def load_objects():
+            # every transaction built, as the chain was held before
+            chain = BlockLog(log.path).load()
+            for block in chain:
+                block._transactions = block.transactions
+            return chain
+
+        def load_encoded():
+            return BlockLog(log.path).load()
+
+        print('{} transactions in blocks of {}, {} owner(s)'.format(count, args.block_size, args.owners))
+        print('{:>12} {:>22} {:>12}'.format('', 'bytes / 100k tx', 'load s'))
+        for name, load in (('objects', load_objects), ('encoded', load_encoded)):
+            size, elapsed = measure(load)
+            print('{:>12} {:>22,.0f} {:>12.2f}'.format(name, size * 100000 / count, elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+    Load test of a node: requests per second and latency percentiles of the Flask node
+    (node.py) and the asyncio node (async_node.py) under many concurrent clients.
+
+    Every server runs as its own process in a scratch directory, with a fresh wallet.
+
+        python -m benchmarks.node_load [--servers flask asyncio] [--concurrency 1 16 64]
+                                       [--scenarios head chain transaction] [--requests 2000]
+"""
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+
+import aiohttp
+
+
+SERVERS = {
+    'flask': 'node.py',
+    'asyncio': 'async_node.py'
+}
+
+# name -> (method, path, json body)
+SCENARIOS = {
+    'head': ('GET', '/chain/head', None),
+    'chain': ('GET', '/chain?limit=20', None),
+    'transaction': ('POST', '/transaction', {'hop_count': '3\n'})
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(script, directory):
+    """ the server process and its address, once it answers """
+
+    port = free_port()
+    os.mkdir(os.path.join(directory, 'db'))
+    env = dict(os.environ, PYTHONPATH=os.getcwd())
+    process = subprocess.Popen([sys.executable, os.path.abspath(script), '-p', str(port)], cwd=directory, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    address = 'http://127.0.0.1:{}'.format(port)
+    asyncio.run(wait_until_up(address, process))
+    return process, address
+
+
+async def wait_until_up(address, process, timeout=30):
+    deadline = time.time() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.time() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError('the server exited with {}'.format(process.returncode))
+            try:
+                async with session.get(address + '/chain/head') as response:
+                    if response.status == 200:
+                        # the transactions are signed with the wallet of the node
+                        async with session.post(address + '/wallet') as created:
+                            await created.read()
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError('the server did not start')
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+async def run_load(address, scenario, concurrency, total):
+    """ (requests per second, p50 seconds, p99 seconds, failed requests) of `total` requests """
+
+    method, path, body = SCENARIOS[scenario]
+    url = address + path
+    latencies = []
+    failed = 0
+    remaining = iter(range(total))
+
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=concurrency)) as session:
+        async def client():
+            nonlocal failed
+            for _ in remaining:
+                start = time.perf_counter()
+                try:
+                    async with session.request(method, url, json=body) as response:
+                        await response.read()
+                        if response.status >= 400:
+                            failed += 1
+                except aiohttp.ClientError:
+                    failed += 1
+                latencies.append(time.perf_counter() - start)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return len(latencies) / elapsed, percentile(latencies, 50), percentile(latencies, 99), failed
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--servers', nargs='+', choices=sorted(SERVERS), default=['flask', 'asyncio'])
+    parser.add_argument('--scenarios', nargs='+', choices=sorted(SCENARIOS), default=['head', 'chain', 'transaction'])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 16, 64])
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    print('{:>8} {:>12} {:>8} {:>10} {:>10} {:>10} {:>8}'.format(
+        'server', 'scenario', 'clients', 'req/s', 'p50 ms', 'p99 ms', 'failed'))
+    for server in args.servers:
+        with tempfile.TemporaryDirectory() as tmp:
+            process, address = start_server(SERVERS[server], tmp)
+            try:
+                for scenario in args.scenarios:
+                    for concurrency in args.concurrency:
+                        rate, p50, p99, failed = asyncio.run(run_load(address, scenario, concurrency, args.requests))
+                        print('{:>8} {:>12} {:>8} {:>10.0f} {:>10.1f} {:>10.1f} {:>8}'.format(
+                            server, scenario, concurrency, rate, p50 * 1e3, p99 * 1e3, failed))
+            finally:
+                process.terminate()
+                process.wait()
+
+
+if __name__ == '__main__':
+    main()
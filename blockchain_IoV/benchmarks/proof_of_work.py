@@ -0,0 +1,56 @@
+"""
+    Hash rate of the proof of work engine against the old `proof += 1` loop.
+
+        python -m benchmarks.proof_of_work [--difficulty 18] [--blocks 5]
+"""
+import os
+import time
+from argparse import ArgumentParser
+
+from miner import ProofOfWork, search, proof_prefix
+from transaction import Transaction
+from utility.hash_util import hash_transaction, header_prefix
+from utility.merkle import merkle_root
+from utility.verification import Verification
+
+
+def make_transactions(count):
+    return [Transaction('owner-{}'.format(i) * 20, 'signature-{}'.format(i), str(i)) for i in range(count)]
+
+
+def naive_rate(transactions, tries):
+    """ the old loop (blocks without merkle root): valid_proof re-serializes every transaction on every try """
+
+    start = time.perf_counter()
+    for proof in range(tries):
+        Verification.valid_proof(transactions, 'last-hash', proof)
+    return tries / (time.perf_counter() - start)
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--difficulty', type=int, default=18)
+    parser.add_argument('--blocks', type=int, default=5)
+    parser.add_argument('--transactions', type=int, default=50)
+    args = parser.parse_args()
+
+    transactions = make_transactions(args.transactions)
+    print('valid_proof loop:        {:>12.0f} H/s'.format(naive_rate(transactions, 20000)))
+
+    start = time.perf_counter()
+    _, tries = search(proof_prefix(transactions, 'last-hash'), 0, 200000, 256)
+    print('prefix copy, 1 process:  {:>12.0f} H/s'.format(tries / (time.perf_counter() - start)))
+
+    for processes in sorted(set([1, 2, os.cpu_count() or 1])):
+        engine = ProofOfWork(processes)
+        for block in range(args.blocks):
+            prefix = header_prefix(block + 1, 'last-hash', merkle_root([hash_transaction(tx) for tx in transactions]), 0.0, args.difficulty)
+            proof = engine.find(prefix, args.difficulty)
+            assert search(prefix, 0, proof + 1, args.difficulty)[0] == proof
+        rate, per_core = engine.hash_rate()
+        print('engine, {:>2} processes:   {:>12.0f} H/s  {:>12.0f} H/s per core'.format(processes, rate, per_core))
+        engine.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+    Memory and disk of a node with and without pruning, and the cost of reading
+    an archived block.
+
+    The memory is what the chain holds after every block was read once (a node
+    which served its whole chain), the disk is the block log plus the archive.
+
+        python -m benchmarks.pruning [--height 5000] [--block-size 100] [--keep 500]
+"""
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from argparse import ArgumentParser
+
+from block import Block
+from block_log import BlockLog
+from blockchain import Blockchain
+from benchmarks.memory import make_blocks
+
+
+def measure(height, block_size, keep, reads=200):
+    """ (bytes held by the chain, bytes on disk, seconds per read of a random archived block, None without) """
+
+    node_id = 'bench-prune-{}'.format(keep)
+    log = BlockLog('./db/blocklog-{}.bin'.format(node_id), fsync_every=1024)
+    log.append_many([Block(0, '', [], 100, 0)] + make_blocks(height * block_size, block_size, 4))
+    log.close()
+    # the first load archives the old blocks
+    Blockchain(None, node_id, keep)
+
+    tracemalloc.start()
+    blockchain = Blockchain(None, node_id, keep)
+    for _ in blockchain.iter_blocks():
+        pass
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    disk = 0
+    for root, _, files in os.walk('./db'):
+        disk += sum(os.path.getsize(os.path.join(root, name)) for name in files if node_id in root or node_id in name)
+
+    archived = blockchain.archived_blocks()
+    read = None
+    if archived != 0:
+        choose = random.Random(0)
+        start = time.perf_counter()
+        for _ in range(reads):
+            blockchain.get_block(choose.randrange(archived))
+        read = (time.perf_counter() - start) / reads
+    return held, disk, read
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--height', type=int, default=5000)
+    parser.add_argument('--block-size', type=int, default=100)
+    parser.add_argument('--keep', type=int, default=500)
+    args = parser.parse_args()
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        os.mkdir('db')
+        try:
+            print('{} blocks of {} transactions'.format(args.height, args.block_size))
+            print('{:>12} {:>14} {:>14} {:>18}'.format('', 'memory KB', 'disk KB', 'archived read us'))
+            for name, keep in (('full', None), ('keep {}'.format(args.keep), args.keep)):
+                held, disk, read = measure(args.height, args.block_size, keep)
+                print('{:>12} {:>14,.0f} {:>14,.0f} {:>18}'.format(name, held / 1024, disk / 1024,
+                                                                 '{:.0f}'.format(read * 1e6) if read is not None else '-'))
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == '__main__':
+    main()
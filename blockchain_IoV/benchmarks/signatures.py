@@ -0,0 +1,60 @@
+"""
+    Signature verifications per second, with and without the caches.
+
+        python -m benchmarks.signatures [--transactions 400]
+"""
+import binascii
+import time
+from argparse import ArgumentParser
+
+from Crypto.Hash import SHA256
+from Crypto.PublicKey import RSA
+from Crypto.Signature import PKCS1_v1_5
+
+from transaction import Transaction
+from wallet import Wallet, _verifier
+
+
+def uncached(transaction):
+    """ the old Wallet.verify_transaction: parse the key on every call """
+
+    verifier = PKCS1_v1_5.new(RSA.importKey(binascii.unhexlify(transaction.dataOwner)))
+    h = SHA256.new((str(transaction.dataOwner) + str(transaction.hop_count)).encode('utf8'))
+    return verifier.verify(h, binascii.unhexlify(transaction.signature))
+
+
+def rate(name, count, function):
+    start = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - start
+    print('{:<34} {:>12.0f} verifications/s'.format(name, count / elapsed))
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--transactions', type=int, default=400)
+    args = parser.parse_args()
+
+    wallet = Wallet('bench')
+    wallet.create_keys()
+    transactions = [Transaction(wallet.public_key, wallet.sign_transaction(wallet.public_key, i), i)
+                    for i in range(args.transactions)]
+    count = len(transactions)
+
+    rate('no cache', count, lambda: [uncached(tx) for tx in transactions])
+
+    def key_cache_only():
+        for tx in transactions:
+            Wallet.signatures.clear()
+            assert Wallet.verify_transaction(tx)
+    _verifier.cache_clear()
+    rate('public key cache', count, key_cache_only)
+
+    Wallet.signatures.clear()
+    rate('public key cache, batch', count, lambda: Wallet.verify_transactions(transactions))
+    rate('signature cache hits', count, lambda: [Wallet.verify_transaction(tx) for tx in transactions])
+    rate('signature cache hits, batch', count, lambda: Wallet.verify_transactions(transactions))
+
+
+if __name__ == '__main__':
+    main()
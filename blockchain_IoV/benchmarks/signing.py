@@ -0,0 +1,52 @@
+"""
+    Signatures per second: the old sign_transaction, the cached key, and sign_many.
+
+        python -m benchmarks.signing [--transactions 1000]
+"""
+import binascii
+import time
+from argparse import ArgumentParser
+
+from Crypto.Hash import SHA256
+from Crypto.PublicKey import RSA
+from Crypto.Signature import PKCS1_v1_5
+
+from wallet import Wallet
+
+
+def uncached(wallet, hop_count):
+    """ the old Wallet.sign_transaction: parse the private key on every call """
+
+    signer = PKCS1_v1_5.new(RSA.importKey(binascii.unhexlify(wallet.private_key)))
+    h = SHA256.new((str(wallet.public_key) + str(hop_count)).encode('utf8'))
+    return binascii.hexlify(signer.sign(h)).decode('ascii')
+
+
+def rate(name, count, function):
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    print('{:<28} {:>12.0f} signatures/s'.format(name, count / elapsed))
+    return result
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--transactions', type=int, default=1000)
+    args = parser.parse_args()
+
+    wallet = Wallet('bench')
+    wallet.create_keys()
+    hop_counts = ['{}\n'.format(i % 10) for i in range(args.transactions)]
+    count = len(hop_counts)
+
+    old = rate('parse key every time', count, lambda: [uncached(wallet, h) for h in hop_counts])
+    single = rate('cached key', count, lambda: [wallet.sign_transaction(wallet.public_key, h) for h in hop_counts])
+    # the first batch also starts the signing processes
+    wallet.sign_many(hop_counts[:100])
+    batch = rate('sign_many', count, lambda: wallet.sign_many(hop_counts))
+    assert old == single == batch
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,272 @@
+"""
+    Simulation of a network of nodes in one process.
+
+    Every node is a Blockchain of a LocalCluster (benchmarks.cluster), the messages
+    between them go through an in-memory Network with the given latency, jitter and
+    loss, and the network can be split in two for a part of the run. The workload is
+    the hop_count stream of the tictoc simulation (INGEST_FILE), replayed in a loop
+    at --rate transactions per second on random nodes, signed by --wallets vehicles;
+    --miners nodes mine one block every --block-interval seconds between them. The
+    nodes gossip to --fanout random peers of the --peers they know (all by default).
+
+    When the workload stops the miners stop too, then one miner mines a block now and
+    then until every node has the same tip: the convergence time is how long that takes.
+
+        python -m benchmarks.simulate --nodes 4 16 64 256 --duration 30
+        python -m benchmarks.simulate --nodes 32 --latency 0.05 --jitter 0.05 --loss 0.05
+        python -m benchmarks.simulate --nodes 32 --partition 0.5 --output partition.json
+        python -m benchmarks.simulate --nodes 256 --peers 16 --fanout 4
+
+    A few hundred nodes make a few thousand threads and share one interpreter, so the
+    numbers tell how the protocol scales (messages, forks, convergence), not how fast
+    one node is. The signature cache of Wallet is shared by the nodes as well, so a
+    transaction is really verified once in the whole cluster.
+"""
+import json
+import os
+import platform
+import random
+import sys
+import threading
+import time
+from argparse import ArgumentParser
+
+from config import DIFFICULTY, INGEST_FILE
+from metrics import BLOCKS, BLOCK_REJECTIONS, CHAIN_REPLACEMENTS, GOSSIP_DUPLICATES
+from utility import difficulty
+from wallet import Wallet
+from benchmarks.cluster import LocalCluster, Network
+from benchmarks.suite import scratch
+
+
+def load_workload(path):
+    """ hop_count of every row of the tictoc output, like the ingestor reads them """
+
+    with open(path, mode='rb') as f:
+        rows = [row.rstrip(b'\r').decode('utf8') + '\n' for row in f.read().split(b'\n') if row.strip()]
+    if len(rows) == 0:
+        raise ValueError('no rows in {}'.format(path))
+    return rows
+
+
+def sign_workload(rows, wallets, count):
+    """
+        (dataOwner, signature, hop_count) of `count` transactions, the rows replayed in a loop
+        and taking the wallets in turn. The hop counts are numbered ('17:3\n'), or every pass
+        over the rows would repeat the same transactions, which the gossip drops as duplicates.
+    """
+
+    hop_counts = ['{}:{}'.format(position, rows[position % len(rows)]) for position in range(count)]
+    workload = [None] * count
+    for number, wallet in enumerate(wallets):
+        positions = range(number, count, len(wallets))
+        signatures = wallet.sign_many([hop_counts[position] for position in positions])
+        for position, signature in zip(positions, signatures):
+            workload[position] = (wallet.public_key, signature, hop_counts[position])
+    return workload
+
+
+def submit(cluster, workload, rate, stop, counts, seed):
+    """ add the workload transactions to random nodes, `rate` per second, until stop is set """
+
+    choose = random.Random(seed)
+    started = time.perf_counter()
+    position = 0
+    while not stop.is_set():
+        delay = started + position / rate - time.perf_counter()
+        if delay > 0 and stop.wait(delay):
+            break
+        dataOwner, signature, hop_count = workload[position % len(workload)]
+        if cluster[choose.randrange(len(cluster))].add_transaction(dataOwner, signature, hop_count):
+            counts['submitted'] += 1
+        position += 1
+
+
+def mine(node, interval, stop, seed):
+    """ mine a block after exponentially distributed waits of `interval` seconds on average """
+
+    choose = random.Random(seed)
+    while not stop.wait(choose.expovariate(1 / interval)):
+        mine_once(node)
+
+
+def mine_once(node):
+    # like a node operator, resolve the conflicts reported by the peers before mining
+    if node.resolve_conflicts:
+        node.resolve()
+    return node.mine_block()
+
+
+def counters():
+    return {
+        'mined': BLOCKS.labels('mined').value,
+        'replacements': CHAIN_REPLACEMENTS.value,
+        'stale': BLOCK_REJECTIONS.labels('stale').value + BLOCK_REJECTIONS.labels('previous_hash').value,
+        'duplicates': GOSSIP_DUPLICATES.labels('transaction').value + GOSSIP_DUPLICATES.labels('block').value
+    }
+
+
+def simulate(size, args, wallets, workload):
+    """ run the workload on a cluster of `size` nodes, returns its results """
+
+    network = Network(args.latency, args.jitter, args.loss, args.network_workers, args.seed)
+    started = time.perf_counter()
+    cluster = LocalCluster(size, wallets[0].public_key, network=network, peers=args.peers, seed=args.seed)
+    setup = time.perf_counter() - started
+    if args.fanout is not None:
+        for node in cluster.nodes.values():
+            node.gossip.fanout = args.fanout or None
+    miners = [cluster[index * size // args.miners] for index in range(min(args.miners, size))]
+    before = counters()
+    counts = {'submitted': 0}
+
+    stop = threading.Event()
+    threads = [threading.Thread(target=submit, args=(cluster, workload, args.rate, stop, counts, args.seed), daemon=True)]
+    threads += [threading.Thread(target=mine, args=(node, args.block_interval * len(miners), stop, args.seed + position),
+                                 daemon=True) for position, node in enumerate(miners)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+
+    if args.partition > 0:
+        # split in two halves in the middle of the run, so the halves grow chains of their own
+        split_at = args.duration * (1 - args.partition) / 2
+        time.sleep(split_at)
+        network.partition(cluster.addresses[:size // 2], cluster.addresses[size // 2:])
+        time.sleep(args.duration * args.partition)
+        network.heal()
+        time.sleep(max(0.0, args.duration - (time.perf_counter() - started)))
+    else:
+        time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    workload_end = time.time()
+
+    # every node ends on the same tip once a block (or two, after a fork) reaches them all,
+    # another block is only mined when no node moved for a block interval
+    settle_started = time.perf_counter()
+    converged = False
+    heads = None
+    changed = settle_started
+    while time.perf_counter() - settle_started < args.settle:
+        current = cluster.heads()
+        if len(set(current)) == 1:
+            converged = True
+            break
+        if current != heads:
+            heads, changed = current, time.perf_counter()
+        elif time.perf_counter() - changed > args.block_interval:
+            mine_once(miners[0])
+            changed = time.perf_counter()
+        time.sleep(0.01)
+    convergence = time.perf_counter() - settle_started
+    cluster.join()
+    heads = cluster.heads()
+    agreement = max(heads.count(head) for head in set(heads)) / size
+    cluster.close()
+
+    after = counters()
+    node = miners[0]
+    height = node.head()['height']
+    confirmed = sum(len(block.transactions) for block in node.iter_blocks(1) if block.timestamp <= workload_end)
+    mined = after['mined'] - before['mined']
+    return {
+        'nodes': size,
+        'peers': args.peers if args.peers is not None else size - 1,
+        'fanout': cluster[0].gossip.fanout,
+        'miners': len(miners),
+        'setup_s': setup,
+        'duration_s': elapsed,
+        'submitted': counts['submitted'],
+        'submitted_per_s': counts['submitted'] / elapsed,
+        'confirmed': confirmed,
+        'confirmed_per_s': confirmed / elapsed,
+        'blocks_mined': mined,
+        'blocks_in_chain': height,
+        'blocks_per_s': height / (elapsed + convergence),
+        'orphan_rate': (mined - height) / mined if mined else 0.0,
+        'chain_replacements': after['replacements'] - before['replacements'],
+        'stale_blocks': after['stale'] - before['stale'],
+        'messages': network.sent,
+        'messages_dropped': network.dropped,
+        'duplicates_dropped': after['duplicates'] - before['duplicates'],
+        'converged': converged,
+        'agreement': agreement,
+        'convergence_s': convergence if converged else None
+    }
+
+
+def print_result(result):
+    if result['converged']:
+        convergence = '{:.2f}s'.format(result['convergence_s'])
+    else:
+        convergence = 'not converged, {:.0%} on one tip'.format(result['agreement'])
+    print('{:>5} nodes  {:>7.1f} tx/s confirmed of {:>7.1f}  {:>3} blocks / {:>3} mined  orphans {:>5.1%}  '
+          'replacements {:>4}  messages {:>8} ({} dropped)  convergence {}'.format(
+              result['nodes'], result['confirmed_per_s'], result['submitted_per_s'], result['blocks_in_chain'],
+              result['blocks_mined'], result['orphan_rate'], result['chain_replacements'], result['messages'],
+              result['messages_dropped'], convergence), file=sys.stderr)
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--nodes', type=int, nargs='+', default=[4, 16, 64], help='cluster sizes to run, one run each')
+    parser.add_argument('--peers', type=int, help='random peers of every node, all the other nodes when not given')
+    parser.add_argument('--fanout', type=int, help='peers a new item is gossiped to, 0 for all of them (GOSSIP_FANOUT by default)')
+    parser.add_argument('--miners', type=int, default=2)
+    parser.add_argument('--rate', type=float, default=20, help='transactions per second')
+    parser.add_argument('--block-interval', type=float, default=2, help='seconds between two blocks of the network')
+    parser.add_argument('--duration', type=float, default=20, help='seconds of workload')
+    parser.add_argument('--settle', type=float, default=60, help='seconds to wait for convergence')
+    parser.add_argument('--latency', type=float, default=0.0, help='one-way delay of a message in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='random extra delay in seconds')
+    parser.add_argument('--loss', type=float, default=0.0, help='probability that a message is lost')
+    parser.add_argument('--partition', type=float, default=0.0, help='part of the run the network is split in two')
+    parser.add_argument('--workload', default=INGEST_FILE, help='tictoc output replayed as the transactions')
+    parser.add_argument('--wallets', type=int, default=4)
+    parser.add_argument('--network-workers', type=int, default=32, help='threads delivering the messages')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--dir', help='where the nodes store their files, e.g. /dev/shm')
+    parser.add_argument('--output', help='json file of the results, printed when not given')
+    args = parser.parse_args()
+
+    workload_path = os.path.abspath(args.workload)
+    results = []
+    # blocks come much faster than TARGET_BLOCK_TIME, keep the difficulty at the default
+    max_difficulty = difficulty.MAX_DIFFICULTY
+    difficulty.MAX_DIFFICULTY = DIFFICULTY
+    try:
+        with scratch(args.dir):
+            wallets = []
+            for index in range(args.wallets):
+                wallet = Wallet('vehicle-{}'.format(index))
+                wallet.create_keys()
+                wallets.append(wallet)
+            workload = sign_workload(load_workload(workload_path), wallets, max(1, int(args.rate * args.duration)))
+        for size in args.nodes:
+            with scratch(args.dir):
+                results.append(simulate(size, args, wallets, workload))
+            print_result(results[-1])
+    finally:
+        difficulty.MAX_DIFFICULTY = max_difficulty
+
+    document = {
+        'meta': {
+            'created': time.time(),
+            'python': platform.python_version(),
+            'cpu_count': os.cpu_count(),
+            'arguments': {name: value for name, value in vars(args).items() if name not in ('output', 'dir')}
+        },
+        'results': results
+    }
+    if args.output is not None:
+        with open(args.output, mode='w') as f:
+            json.dump(document, f, indent=2)
+    else:
+        print(json.dumps(document, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+    Time to construct a Blockchain (load a node) at different chain heights,
+    from a snapshot and the block log index, and from the block log alone.
+
+        python -m benchmarks.startup [--heights 1000 10000 100000]
+"""
+import os
+import tempfile
+import time
+from argparse import ArgumentParser
+
+from block_log import BlockLog
+from blockchain import Blockchain
+from benchmarks.block_log import make_block
+
+
+def measure(height, repeat):
+    """ return the mean load time (seconds) with and without a snapshot """
+
+    node_id = 'bench-{}'.format(height)
+    log = BlockLog('./db/blocklog-{}.bin'.format(node_id), fsync_every=1024)
+    log.append_many([make_block(index) for index in range(height)])
+    log.close()
+    # the first load indexes the transactions and writes the snapshot
+    Blockchain(None, node_id)
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        Blockchain(None, node_id)
+    with_snapshot = (time.perf_counter() - start) / repeat
+
+    snapshot_path = './db/snapshot-{}.bin'.format(node_id)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        os.remove(snapshot_path)
+        os.remove(log.index_path)
+        Blockchain(None, node_id)
+    without_snapshot = (time.perf_counter() - start) / repeat
+    return with_snapshot, without_snapshot
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--heights', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        os.mkdir('db')
+        try:
+            print('{:>10} {:>16} {:>16}'.format('height', 'snapshot ms', 'log only ms'))
+            for height in args.heights:
+                with_snapshot, without_snapshot = measure(height, args.repeat)
+                print('{:>10} {:>16.1f} {:>16.1f}'.format(height, with_snapshot * 1e3, without_snapshot * 1e3))
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,304 @@
+"""
+    Benchmark suite of the chain core, with machine-readable results.
+
+    Every case runs the real code in this process, the end-to-end case on a local
+    cluster of nodes (benchmarks.cluster) without any network. The results are one
+    json document, so two builds can be compared:
+
+        python -m benchmarks.suite --output before.json
+        python -m benchmarks.suite --output after.json --compare before.json
+
+    --compare prints the change of every metric and exits with 1 when one got worse
+    by more than --tolerance. Metrics ending in _per_s are better when higher, the
+    others (_us, _ms) when lower.
+
+        python -m benchmarks.suite [--only hash_block wallet] [--quick]
+"""
+from contextlib import contextmanager
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+
+from block import Block
+from config import DIFFICULTY, TARGET_BLOCK_TIME
+from miner import ProofOfWork, search
+from transaction import Transaction
+from utility import difficulty
+from utility.difficulty import next_difficulty
+from utility.hash_util import hash_block, hash_transaction, header_prefix
+from utility.merkle import merkle_root
+from utility.verification import Verification
+from wallet import Wallet, _verifier
+from benchmarks import block_log, startup
+from benchmarks.cluster import LocalCluster
+from benchmarks.proof_of_work import make_transactions, naive_rate
+
+
+# name -> function(args) returning {metric: value}, in the order they run
+CASES = {}
+
+
+def case(name):
+    def register(function):
+        CASES[name] = function
+        return function
+    return register
+
+
+def per_call(function, number, repeat=3):
+    """ median seconds one call of function takes, over `repeat` runs of `number` calls """
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        times.append((time.perf_counter() - start) / number)
+    return statistics.median(times)
+
+
+@contextmanager
+def scratch(directory=None):
+    """ run in an empty directory (made in `directory` when given) holding a db folder, like a fresh node """
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        os.chdir(tmp)
+        os.mkdir('db')
+        try:
+            yield tmp
+        finally:
+            os.chdir(cwd)
+
+
+def bench_wallet():
+    wallet = Wallet('bench')
+    wallet.create_keys()
+    return wallet
+
+
+def mine_chain(length, block_size, wallet):
+    """
+        A valid chain with proofs at the default difficulty: the blocks are stamped
+        TARGET_BLOCK_TIME apart so the retarget keeps the difficulty where it is.
+    """
+
+    engine = ProofOfWork(1)
+    hop_counts = ['{}\n'.format(position % 15) for position in range(block_size)]
+    signatures = wallet.sign_many(hop_counts)
+    chain = [Block(0, '', [], 100, 0)]
+    for index in range(1, length):
+        transactions = [Transaction(wallet.public_key, signature, hop_count)
+                        for hop_count, signature in zip(hop_counts, signatures)]
+        root = merkle_root([hash_transaction(tx) for tx in transactions])
+        timestamp = float(index * TARGET_BLOCK_TIME)
+        block_difficulty = next_difficulty(chain)
+        previous_hash = hash_block(chain[-1])
+        proof = engine.find(header_prefix(index, previous_hash, root, timestamp, block_difficulty), block_difficulty)
+        chain.append(Block(index, previous_hash, transactions, proof, timestamp, block_difficulty, root))
+    engine.close()
+    return chain
+
+
+@case('valid_proof')
+def valid_proof_case(args):
+    transactions = make_transactions(50)
+    tries = 2000 if args.quick else 20000
+    start = time.perf_counter()
+    _, searched = search(b'0:last-hash:root:0.0:12:', 0, tries * 10, 256)
+    return {
+        'valid_proof_hashes_per_s': naive_rate(transactions, tries),
+        'header_search_hashes_per_s': searched / (time.perf_counter() - start)
+    }
+
+
+@case('hash_block')
+def hash_block_case(args):
+    transactions = make_transactions(50)
+    block = Block(1, 'last-hash', transactions, 1, 0.0, DIFFICULTY, merkle_root([hash_transaction(tx) for tx in transactions]))
+    legacy = Block(1, 'last-hash', transactions, 1, 0.0)
+    number = 200 if args.quick else 2000
+
+    def uncached(block):
+        block._hash = None
+        hash_block(block)
+
+    return {
+        'header_us': per_call(lambda: uncached(block), number) * 1e6,
+        'cached_us': per_call(lambda: hash_block(block), number) * 1e6,
+        'legacy_50_tx_us': per_call(lambda: uncached(legacy), number // 10) * 1e6
+    }
+
+
+@case('wallet')
+def wallet_case(args):
+    wallet = bench_wallet()
+    count = 50 if args.quick else 300
+    signatures = [wallet.sign_transaction(wallet.public_key, index) for index in range(count)]
+    transactions = [Transaction(wallet.public_key, signature, index) for index, signature in enumerate(signatures)]
+    position = iter(range(10 ** 9))
+
+    def verify_uncached():
+        Wallet.signatures.clear()
+        Wallet.verify_transaction(transactions[next(position) % count])
+
+    _verifier.cache_clear()
+    return {
+        'sign_per_s': 1 / per_call(lambda: wallet.sign_transaction(wallet.public_key, '3\n'), count),
+        'verify_per_s': 1 / per_call(verify_uncached, count),
+        'verify_cached_per_s': 1 / per_call(lambda: Wallet.verify_transaction(transactions[0]), count * 10)
+    }
+
+
+@case('storage')
+def storage_case(args):
+    """ save_data of one block and load_data (a node start) at increasing heights """
+
+    results = {}
+    for height in ([100, 1000] if args.quick else [100, 1000, 10000]):
+        with scratch():
+            results['save_us_h{}'.format(height)] = block_log.measure(height, 20 if args.quick else 100) * 1e6
+        with scratch():
+            with_snapshot, without_snapshot = startup.measure(height, 2 if args.quick else 5)
+        results['load_snapshot_ms_h{}'.format(height)] = with_snapshot * 1e3
+        results['load_log_only_ms_h{}'.format(height)] = without_snapshot * 1e3
+    return results
+
+
+@case('verify_chain')
+def verify_chain_case(args):
+    length, block_size = (20, 10) if args.quick else (100, 50)
+    chain = mine_chain(length, block_size, bench_wallet())
+
+    def verify():
+        for block in chain:
+            block._hash = None
+        assert Verification.verify_chain(chain)
+
+    seconds = per_call(verify, 1)
+    return {
+        'blocks_per_s': (length - 1) / seconds,
+        'transactions_per_s': (length - 1) * block_size / seconds
+    }
+
+
+@case('end_to_end')
+def end_to_end_case(args):
+    """
+        Latency from add_transaction on one node until a block holding the transaction
+        is the tip of every node of a local cluster
+    """
+
+    nodes, rounds, batch = (3, 3, 10) if args.quick else (4, 10, 50)
+    wallet = bench_wallet()
+    # blocks mined back to back would raise the difficulty every block, keep it at the default
+    max_difficulty = difficulty.MAX_DIFFICULTY
+    difficulty.MAX_DIFFICULTY = DIFFICULTY
+    latencies = []
+    propagation = []
+    try:
+        with scratch():
+            cluster = LocalCluster(nodes, wallet.public_key)
+            origin = cluster[0]
+            for round_number in range(rounds):
+                hop_counts = ['{}-{}\n'.format(round_number, position) for position in range(batch)]
+                signatures = wallet.sign_many(hop_counts)
+                submitted = []
+                for hop_count, signature in zip(hop_counts, signatures):
+                    submitted.append(time.perf_counter())
+                    assert origin.add_transaction(wallet.public_key, signature, hop_count)
+                block = origin.mine_block()
+                mined = time.perf_counter()
+                tip = hash_block(block)
+                while any(head != tip for head in cluster.heads()):
+                    time.sleep(0.0005)
+                done = time.perf_counter()
+                latencies.extend(done - started for started in submitted)
+                propagation.append(done - mined)
+    finally:
+        difficulty.MAX_DIFFICULTY = max_difficulty
+
+    latencies.sort()
+    return {
+        'nodes': nodes,
+        'tx_to_block_p50_ms': latencies[len(latencies) // 2] * 1e3,
+        'tx_to_block_p99_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1e3,
+        'block_propagation_ms': statistics.mean(propagation) * 1e3
+    }
+
+
+def metadata(args):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'commit': commit,
+        'created': time.time(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'quick': args.quick
+    }
+
+
+def compare(results, baseline, tolerance):
+    """ print the change of every metric in both runs, return the names of the regressions """
+
+    regressions = []
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            old = baseline.get(name, {}).get(metric)
+            if not isinstance(old, (int, float)) or old == 0 or metric == 'nodes':
+                continue
+            change = (value - old) / old
+            worse = -change if metric.endswith('_per_s') else change
+            flag = ''
+            if worse > tolerance:
+                flag = 'REGRESSION'
+                regressions.append('{}.{}'.format(name, metric))
+            print('{:<14} {:<30} {:>14.2f} {:>14.2f} {:>+8.1%} {}'.format(name, metric, old, value, change, flag),
+                  file=sys.stderr)
+    return regressions
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--only', nargs='+', choices=list(CASES), default=list(CASES))
+    parser.add_argument('--quick', action='store_true', help='smaller sizes, for a smoke run')
+    parser.add_argument('--output', help='json file of the results, printed when not given')
+    parser.add_argument('--compare', help='json file of an earlier run')
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.only:
+        start = time.perf_counter()
+        results[name] = CASES[name](args)
+        print('{:<14} {:>6.1f}s  {}'.format(name, time.perf_counter() - start,
+                                             ', '.join('{} {:.2f}'.format(metric, value) for metric, value in results[name].items())),
+              file=sys.stderr)
+
+    document = {'meta': metadata(args), 'results': results}
+    if args.output is not None:
+        with open(args.output, mode='w') as f:
+            json.dump(document, f, indent=2)
+    else:
+        print(json.dumps(document, indent=2))
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f)['results'], args.tolerance)
+        if len(regressions) != 0:
+            print('Regressions: {}'.format(', '.join(regressions)), file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
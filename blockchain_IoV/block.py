@@ -1,17 +1,120 @@
-from time import time
+from time import time as current_time
+from utility.binary import encode_transactions, decode_transactions
+from utility.hash_util import hash_block
 from utility.printable import Printable
+from transaction import Transaction
 
 
 class Block(Printable):
     """
         Basic block for blockchain
+
+        difficulty:         leading zero bits of the proof, None for blocks mined before it was stored
+        merkle_root:        root of the merkle tree over the transaction ids, None for blocks mined
+                            before it was stored; the block hash and its proof of work only cover
+                            the header, see utility.hash_util.header_prefix
+
+        A block is never changed once created, so its hash is kept in self._hash
+        the first time utility.hash_util.hash_block computes it.
+
+        Blocks of the stored chain only hold their header and their transactions
+        encoded (self._raw, utility.binary.encode_transactions): the transaction
+        objects are built every time block.transactions is read and dropped after use.
+        A block made from transaction objects keeps them until compact() is called.
+        A header-only block (header_only()) has neither, it stands for a pruned block
+        whose transactions are in the archive (see stored_chain.StoredChain).
     """
-    
-    def __init__(self, index, previous_hash, transactions, proof, time=time()):
+
+    __slots__ = ('index', 'previous_hash', 'proof', 'timestamp', 'difficulty', 'merkle_root',
+                 '_transactions', '_raw', '_hash')
+
+    def __init__(self, index, previous_hash, transactions, proof, time=None, difficulty=None, merkle_root=None, raw=None):
         self.index = index
         self.previous_hash = previous_hash
-        self.transactions = transactions
+        self._transactions = transactions
+        self._raw = raw
         self.proof = proof
-        self.timestamp = time
+        self.timestamp = time if time is not None else current_time()
+        self.difficulty = difficulty
+        self.merkle_root = merkle_root
+        self._hash = None
+
+
+    @property
+    def transactions(self):
+        # compact() may run in another thread, _raw is always set before _transactions is dropped
+        transactions = self._transactions
+        if transactions is not None:
+            return transactions
+        raw = self._raw
+        if raw is None:
+            raise ValueError('Block {} only holds its header'.format(self.index))
+        return decode_transactions(raw)
+
+
+    def raw_transactions(self):
+        """ the transactions encoded on their own """
+
+        if self._raw is None:
+            self._raw = encode_transactions(self._transactions)
+        return self._raw
+
+
+    def compact(self):
+        """ Keep only the encoded transactions """
+
+        self.raw_transactions()
+        self._transactions = None
+
+
+    def header_only(self):
+        """ a copy without the transactions, its hash is computed first so it does not need them """
+
+        block = Block(self.index, self.previous_hash, None, self.proof, self.timestamp, self.difficulty, self.merkle_root)
+        block._hash = hash_block(self)
+        return block
+
+
+    def is_header(self):
+        """ True for a header-only block """
+        return self._transactions is None and self._raw is None
+
+
+    def to_dict(self):
+        """ return as a dictionary, transactions included """
+
+        dict_block = self.header()
+        dict_block['transactions'] = [tx.to_dict() for tx in self.transactions]
+        return dict_block
+
+
+    def header(self):
+        """ return as a dictionary without the transactions """
+
+        return {
+            'index': self.index,
+            'previous_hash': self.previous_hash,
+            'proof': self.proof,
+            'timestamp': self.timestamp,
+            'difficulty': self.difficulty,
+            'merkle_root': self.merkle_root
+        }
+
 
+    @staticmethod
+    def from_dict(block):
+        """ build a block from its dictionary form """
 
+        return Block(
+            block['index'],
+            block['previous_hash'],
+            [Transaction(
+                tx['dataOwner'],
+                tx['signature'],
+                tx['hop_count']
+            ) for tx in block['transactions']],
+            block['proof'],
+            block['timestamp'],
+            block.get('difficulty'),
+            block.get('merkle_root')
+        )
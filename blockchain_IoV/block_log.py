@@ -0,0 +1,407 @@
+from array import array
+import atexit
+import os
+import struct
+import weakref
+import zlib
+
+from codec import Decoder, Encoder
+
+
+class BlockLog:
+    """
+        Append-only storage for the blockchain
+
+        Every block is written once as a length-prefixed record:
+
+            [payload length: 4 bytes][crc32 of payload: 4 bytes][payload]
+
+        so persisting a new block costs the same no matter how long the chain is.
+        A record that was only partly written (e.g. the node crashed mid-write) is
+        detected by its length / checksum and cut off the next time the log is opened.
+
+        Payloads are raw blocks of codec.py: the header plus the transactions as
+        encoded by the block itself, so any block can be read on its own with read().
+
+        The offset of every record is appended to an index file next to the log
+        (`path`.idx, 'Q' each) after the record itself, so open() only scans the records
+        written after the last indexed one. Offsets past the end of the log are dropped.
+
+        A pruned node moves its old blocks to the archive (see archive.py) and drops
+        them from the front of the log (drop_before()), the log then starts at block
+        `base`. Blocks are always given by their index in the chain.
+
+        Blocks are read through a BlockLogView (see view()). truncate() cuts the file in place
+        and hands the bytes it cut to the views still reading them (only the tail is copied),
+        drop_before() writes the records which stay to a new file; both publish a new view,
+        a reader which still has an old view keeps reading the blocks it had.
+
+        self.path:              file of the log
+        self.index_path:        file of the offsets of the records
+        self.fsync_every:       number of appended records between two fsync calls
+        self.base:              index of the block of the first record
+        self.count:             index after the last stored block (base + number of records)
+        self.size:              bytes of the records
+        self.offsets:           file offset of every record (array of 'Q')
+        self.__views:           views published since the file was last replaced, they read this file
+    """
+
+    HEADER = struct.Struct('>II')
+
+    def __init__(self, path, fsync_every=32):
+        self.path = path
+        self.index_path = path + '.idx'
+        self.fsync_every = fsync_every
+        self.base = 0
+        self.count = 0
+        self.size = 0
+        self.offsets = array('Q')
+        self.__unsynced = 0
+        self.__file = None
+        self.__index_file = None
+        self.__views = weakref.WeakSet()
+        self.__view = BlockLogView(None, self.offsets, self.base)
+        atexit.register(self.close)
+
+
+    def open(self):
+        """
+            Find the records of the log, dropping a torn tail if there is one.
+            The offsets come from the index file, only the records written after its last one
+            are scanned (all of them when the index is missing or broken).
+            Returns the index after the last stored block.
+        """
+
+        self.close()
+        file_size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        self.offsets, stored = self.__load_index(file_size)
+        indexed = len(self.offsets)
+        offset = 0
+        if indexed != 0:
+            offset = self.__record_end(self.offsets[-1], file_size)
+            if self.offsets[0] != 0 or offset is None:
+                print('Block log index is broken, reading the whole log')
+                self.offsets = array('Q')
+                indexed = 0
+                offset = 0
+        if offset < file_size:
+            with open(self.path, mode='rb') as f:
+                f.seek(offset)
+                data = f.read()
+            position = 0
+            while position + self.HEADER.size <= len(data):
+                length, checksum = self.HEADER.unpack_from(data, position)
+                start = position + self.HEADER.size
+                payload = data[start:start + length]
+                if len(payload) != length or zlib.crc32(payload) != checksum:
+                    break
+                self.offsets.append(offset + position)
+                position = start + length
+            offset += position
+            if offset != file_size:
+                print('Block log has a broken tail, recovered {} records'.format(len(self.offsets)))
+                with open(self.path, mode='r+b') as f:
+                    f.truncate(offset)
+        if indexed * self.offsets.itemsize != stored or indexed != len(self.offsets):
+            self.__write_index(indexed)
+
+        # the first record tells where the log starts
+        base = 0
+        if len(self.offsets) != 0:
+            with open(self.path, mode='rb') as f:
+                base = BlockLogView(f, self.offsets, 0).read_record(self.offsets[0], 0).index
+        self.base = base
+        self.count = base + len(self.offsets)
+        self.size = offset
+        self.__views = weakref.WeakSet()
+        self.__publish()
+        return self.count
+
+
+    def load(self):
+        """ Read every block of the log """
+
+        if self.count == 0:
+            self.open()
+        decoder = Decoder()
+        return [self.read(index, decoder) for index in range(self.base, self.count)]
+
+
+    def read(self, index, decoder=None):
+        """ the block `index`, its transactions stay encoded """
+        return self.__view.read(index, decoder)
+
+
+    def view(self):
+        """ the records of the log as they are now, see BlockLogView """
+        return self.__view
+
+
+    def append(self, block):
+        self.append_many([block])
+
+
+    def append_many(self, blocks):
+        """ Append the given blocks, fsync only every self.fsync_every records """
+
+        if len(blocks) == 0:
+            return
+        f = self.__open()
+        records = [self.__record(block) for block in blocks]
+        f.write(b''.join(records))
+        f.flush()
+        # the records are in the file before a reader can find their offsets
+        indexed = len(self.offsets)
+        for record in records:
+            self.offsets.append(self.size)
+            self.size += len(record)
+        index_file = self.__open_index()
+        index_file.write(self.offsets[indexed:].tobytes())
+        index_file.flush()
+        self.count += len(blocks)
+        if self.__view.file is None:
+            self.__publish()
+        self.__unsynced += len(blocks)
+        if self.__unsynced >= self.fsync_every:
+            self.sync()
+
+
+    def rewrite(self, blocks):
+        """ Replace the whole log, used when the chain itself was replaced """
+
+        self.close()
+        tmp_path = self.path + '.tmp'
+        records = [self.__record(block) for block in blocks]
+        with open(tmp_path, mode='wb') as f:
+            f.write(b''.join(records))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self.base = blocks[0].index if len(blocks) != 0 else 0
+        self.count = self.base + len(blocks)
+        self.offsets = array('Q')
+        self.size = 0
+        for record in records:
+            self.offsets.append(self.size)
+            self.size += len(record)
+        self.__write_index(0)
+        self.__views = weakref.WeakSet()
+        self.__publish()
+
+
+    def truncate(self, count):
+        """
+            Keep only the first `count` records, used when the chain forks after them.
+            The file is cut in place, the views which still have the records cut get their bytes.
+        """
+
+        if count >= self.count:
+            return
+        if count < self.base:
+            raise ValueError('Block {} was dropped from the block log'.format(count))
+        self.close()
+        size = self.offsets[count - self.base]
+        with open(self.path, mode='r+b') as f:
+            f.seek(size)
+            cut = f.read(self.size - size)
+            # the readers find the cut bytes before they are gone from the file
+            for view in list(self.__views):
+                if view.count > count:
+                    view.keep_tail(size, cut)
+            f.truncate(size)
+            f.flush()
+            os.fsync(f.fileno())
+        self.offsets = self.offsets[:count - self.base]
+        self.__write_index(len(self.offsets))
+        self.size = size
+        self.count = count
+        self.__publish()
+
+
+    def drop_before(self, index):
+        """
+            Remove the blocks before `index` (they were archived), the rest of the log is copied once.
+            The last block always stays, the first record tells where the log starts.
+        """
+
+        index = min(index, self.count - 1)
+        if index <= self.base:
+            return
+        self.close()
+        start = self.offsets[index - self.base]
+        self.__replace_file(start, self.size)
+        self.offsets = array('Q', (offset - start for offset in self.offsets[index - self.base:]))
+        self.__write_index(0)
+        self.size -= start
+        self.base = index
+        self.__views = weakref.WeakSet()
+        self.__publish()
+
+
+    def sync(self):
+        if self.__file is not None and self.__unsynced > 0:
+            os.fsync(self.__file.fileno())
+            if self.__index_file is not None:
+                os.fsync(self.__index_file.fileno())
+        self.__unsynced = 0
+
+
+    def close(self):
+        """ Close the files appended to, the published view stays readable """
+        if self.__file is not None:
+            self.sync()
+            self.__file.close()
+            self.__file = None
+        if self.__index_file is not None:
+            self.__index_file.close()
+            self.__index_file = None
+
+
+    def __publish(self):
+        """ replace the view of the readers with one of the current file, offsets and base """
+        reader = open(self.path, mode='rb') if os.path.exists(self.path) else None
+        self.__view = BlockLogView(reader, self.offsets, self.base)
+        self.__views.add(self.__view)
+
+
+    def __replace_file(self, start, end):
+        """ Replace the file with the bytes [start, end) of it, the open views keep the old file """
+
+        tmp_path = self.path + '.tmp'
+        with open(self.path, mode='rb') as f:
+            f.seek(start)
+            data = f.read(end - start)
+        with open(tmp_path, mode='wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+
+    def __load_index(self, file_size):
+        """ (offsets of the index file which are inside the log, bytes of the file) """
+
+        offsets = array('Q')
+        data = b''
+        if os.path.exists(self.index_path):
+            with open(self.index_path, mode='rb') as f:
+                data = f.read()
+            offsets.frombytes(data[:len(data) - len(data) % offsets.itemsize])
+        end = len(offsets)
+        # written after the log, but not always synced after it
+        while end != 0 and offsets[end - 1] >= file_size:
+            end -= 1
+        return offsets[:end], len(data)
+
+
+    def __record_end(self, offset, file_size):
+        """ offset after the record at `offset`, None if there is no whole record there """
+
+        if offset + self.HEADER.size > file_size:
+            return None
+        with open(self.path, mode='rb') as f:
+            header = os.pread(f.fileno(), self.HEADER.size, offset)
+            length, checksum = self.HEADER.unpack(header)
+            payload = os.pread(f.fileno(), length, offset + self.HEADER.size)
+        if len(payload) != length or zlib.crc32(payload) != checksum:
+            return None
+        return offset + self.HEADER.size + length
+
+
+    def __write_index(self, keep):
+        """ Make the index file hold self.offsets, its first `keep` offsets are already the right ones """
+
+        if self.__index_file is not None:
+            self.__index_file.close()
+            self.__index_file = None
+        with open(self.index_path, mode='r+b' if os.path.exists(self.index_path) else 'wb') as f:
+            f.truncate(keep * self.offsets.itemsize)
+            f.seek(0, os.SEEK_END)
+            f.write(self.offsets[keep:].tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+
+    def __open_index(self):
+        if self.__index_file is None:
+            self.__index_file = open(self.index_path, mode='ab')
+        return self.__index_file
+
+
+    def __record(self, block):
+        payload = Encoder.encode_raw_block(block)
+        return self.HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+    def __open(self):
+        if self.__file is None:
+            self.__file = open(self.path, mode='ab')
+        return self.__file
+
+
+class BlockLogView:
+    """
+        The records of a BlockLog as a reader sees them, never changed after it is published:
+        the log only appends offsets to it, and publishes a new view when records are dropped
+        or the file is replaced. The file stays open as long as the view is used.
+        When the log cuts records of the view from its file, the view keeps their bytes in `tail`.
+
+        self.file:              the log file opened for reading, None while it does not exist
+        self.offsets:           file offset of every record (array of 'Q')
+        self.base:              index of the block of the first record
+        self.tail:              (file offset, bytes) of the records cut from the file, None if none were
+    """
+
+    def __init__(self, file, offsets, base):
+        self.file = file
+        self.offsets = offsets
+        self.base = base
+        self.tail = None
+
+
+    @property
+    def count(self):
+        """ index after the last block of the view """
+        return self.base + len(self.offsets)
+
+
+    def read(self, index, decoder=None):
+        """ the block `index`, its transactions stay encoded """
+
+        if not self.base <= index < self.count:
+            raise IndexError('block {} is not in the block log'.format(index))
+        return self.read_record(self.offsets[index - self.base], index, decoder)
+
+
+    def read_record(self, offset, index, decoder=None):
+        header = self.__read_bytes(offset, BlockLog.HEADER.size)
+        if len(header) != BlockLog.HEADER.size:
+            raise ValueError('Block log record {} is broken'.format(index))
+        length, checksum = BlockLog.HEADER.unpack(header)
+        payload = self.__read_bytes(offset + BlockLog.HEADER.size, length)
+        if len(payload) != length or zlib.crc32(payload) != checksum:
+            raise ValueError('Block log record {} is broken'.format(index))
+        return (decoder or Decoder()).decode_block(payload)
+
+
+    def keep_tail(self, offset, data):
+        """ The log cuts its file at `offset`, `data` are the bytes from there to its end """
+
+        tail = self.tail
+        if tail is None:
+            self.tail = (offset, data)
+        elif offset < tail[0]:
+            # the bytes before the old tail are still the ones of this view
+            self.tail = (offset, data[:tail[0] - offset] + tail[1])
+
+
+    def __read_bytes(self, offset, length):
+        tail = self.tail
+        if tail is None or offset < tail[0]:
+            data = os.pread(self.file.fileno(), length, offset)
+            # the tail is set before the file is cut, if it is there now the bytes read may be new ones
+            tail = self.tail
+            if tail is None or offset < tail[0]:
+                return data
+        start = offset - tail[0]
+        return tail[1][start:start + length]
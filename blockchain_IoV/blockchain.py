@@ -1,158 +1,575 @@
-from functools import reduce
-import hashlib as hl
-import json
-import pickle
+import codecs
+from collections import namedtuple
+from concurrent.futures import Future
+import os
+import queue
 import requests
-from tinydb import TinyDB, Query
-
-from utility.hash_util import hash_block
+import threading
+from time import time
+from tinydb import TinyDB
+
+from codec import MIMETYPE, Decoder, iter_frames
+from config import MAX_BLOCK_TRANSACTIONS, MAX_BLOCK_BYTES, BINARY_WIRE, SNAPSHOT_INTERVAL, PRUNE_KEEP_BLOCKS, \
+    RETARGET_WINDOW
+from utility.difficulty import next_difficulty, median_time, block_work, chain_work
+from utility.hash_util import hash_block, hash_transaction, header_prefix
+from utility.merkle import merkle_root, merkle_branch
+from utility.json_stream import iter_json_array
 from utility.verification import Verification
+from archive import BlockArchive
 from block import Block
+from block_log import BlockLog
+from broadcast import Broadcaster
+from gossip import Gossip
+from mempool import Mempool
+from metrics import TRANSACTIONS, TRANSACTION_REJECTIONS, BLOCKS, BLOCK_REJECTIONS, CHAIN_REPLACEMENTS, \
+    MINING_CANCELLED, POW_ATTEMPTS, CHAIN_HEIGHT, MEMPOOL_TRANSACTIONS, MEMPOOL_BYTES, WRITER_QUEUE, BROADCAST_QUEUE, \
+    ARCHIVED_BLOCKS, ARCHIVE_BYTES, \
+    ADD_TRANSACTION_SECONDS, ADD_BLOCK_SECONDS, MINE_BLOCK_SECONDS, PROOF_OF_WORK_SECONDS, SAVE_DATA_SECONDS, \
+    RESOLVE_SECONDS
+from miner import ProofOfWork
+from snapshot import Snapshot
+from stored_chain import StoredChain, ChainView
+from sync import ChainSync, ForkView
 from transaction import Transaction
+from tx_index import TransactionIndex
 from wallet import Wallet
 
 # print(__name__)
 
 
+# what readers see of a node, replaced as a whole after every batch of changes
+ChainState = namedtuple('ChainState', ['chain', 'length', 'head', 'transactions', 'transactions_version',
+                                       'transactions_bytes', 'oldest_arrival', 'peer_nodes'])
+
+
 class Blockchain:
     """
         Basic blockchain
 
-        genesis_block:              the first block for all the blockchains
-        self.__chain:               blockchain
-        self.__open_transactions:   the transactions that still waiting for writing into the blockchain
+        Every change (transactions, blocks, chain replacement, peers) is a command run by a
+        single writer thread, in the order the commands arrive. After each batch of commands
+        the writer publishes a new ChainState, which every read uses without taking a lock:
+        a reader keeps the state it started with, so it never sees half of a change.
+        The chain itself is only appended to, a state reads its first `length` blocks;
+        a replaced chain is a new StoredChain, older states keep the previous one.
+
+        A pruning node (keep_blocks) keeps the headers of all blocks but the transactions of the
+        last keep_blocks only, the older blocks are moved from the block log to compressed archive
+        segments and read from there when they are used. The archived blocks are final: a chain
+        which forks below them is refused.
+
+        self.__chain:               blockchain, its stored blocks are read from the block log when used
+        self.__work:                work of the chain (see utility.difficulty.chain_work), a fork wins with more work
+        self.__archive:             the blocks moved out of the block log by pruning
+        self.keep_blocks:           blocks kept whole below the tip, every block when None
+        self.__mempool:             the transactions that still waiting for writing into the blockchain
+        self.__tx_index:            where every mined transaction is, by id and by dataOwner
         self.__peer_nodes:          nodes that can interact with
+        self.gossip:                announces new transactions and blocks to the peers and drops duplicates
+        self.__snapshot:            state saved every SNAPSHOT_INTERVAL blocks, so loading reads only the newer blocks
+        self.__state:               the last published ChainState
+        self.__commands:            queue of (future, command, arguments) for the writer thread
+        self.__cancel_mining:       set when the tip changes, a running proof of work gives up
+        self.__mining:              one block of this node is mined at a time
+        miner:                      proof of work engine, shared by every Blockchain of the process
+        broadcaster:                sends transactions and blocks to the peer nodes, shared as well
+        WRITER_BATCH:               commands the writer runs before publishing a new state
     """
 
-    def __init__(self, public_key, node_id):
-        # the first block in the chain
-        genesis_block = Block(0, '', [], 100, 0)
-        # blockchain
-        self.__chain = [genesis_block]
+    miner = ProofOfWork(attempts=POW_ATTEMPTS)
+    broadcaster = Broadcaster()
+    WRITER_BATCH = 256
+
+    def __init__(self, public_key, node_id, keep_blocks=PRUNE_KEEP_BLOCKS):
+        # append-only storage of the chain, the pruned blocks go to the archive
+        self.__block_log = BlockLog('./db/blocklog-{}.bin'.format(node_id))
+        self.__archive = BlockArchive('./db/archive-{}'.format(node_id))
+        # the difficulty of the next block is computed from whole blocks
+        self.keep_blocks = max(keep_blocks, RETARGET_WINDOW + 1) if keep_blocks is not None else None
+        # blockchain, starting with the genesis block
+        self.__chain = StoredChain(self.__block_log, [Block(0, '', [], 100, 0)], self.__archive, self.keep_blocks)
+        self.__work = block_work(self.__chain[0])
         # pending
-        self.__open_transactions = []
+        self.__mempool = Mempool('./db/mempool-{}.log'.format(node_id))
         # peer nodes
         self.__peer_nodes = set()
+        self.__tx_index = TransactionIndex('./db/txindex-{}.sqlite'.format(node_id))
+        self.__snapshot = Snapshot('./db/snapshot-{}.bin'.format(node_id))
 
         # load blockchain
         self.public_key = public_key
         self.node_id = node_id
         self.resolve_conflicts = False
+        self.sync = ChainSync(self)
+        # new transactions and blocks go to a few random peers, which relay them
+        self.gossip = Gossip(self)
+        self.__mining = threading.Lock()
+        self.__cancel_mining = threading.Event()
+        self.__state = None
+        self.__writer = None
         self.load_data()
 
+        # from here on only the writer thread changes the node
+        self.__publish()
+        self.__commands = queue.Queue()
+        self.__writer = threading.Thread(target=self.__run_writer, name='writer-{}'.format(node_id), daemon=True)
+        self.__writer.start()
+        WRITER_QUEUE.set_function(self.__commands.qsize)
+        BROADCAST_QUEUE.set_function(lambda: self.broadcaster.pending())
+        ARCHIVED_BLOCKS.set_function(lambda: self.__archive.count)
+        ARCHIVE_BYTES.set_function(lambda: self.__archive.size)
+
 
     # blockchain: get / set
     @property
     def chain(self):
-        return self.__chain[:]
+        """ the blocks as a read-only list, the pruned ones are read when they are used """
+        state = self.__state
+        return ChainView(state.chain, state.length)
 
     @chain.setter
     def chain(self, val):
-        self.__chain = val
+        self.__execute(self.__set_chain, val)
+
+    def __set_chain(self, val):
+        self.__chain = val if isinstance(val, StoredChain) else \
+            StoredChain(self.__block_log, val, self.__archive, self.keep_blocks)
+        self.__work = chain_work(self.__chain.headers())
+
+
+    def head(self):
+        """ height (index of the last block), hash of the tip and work of the chain """
+        return dict(self.__state.head)
+
+
+    def get_block(self, index):
+        state = self.__state
+        if index < 0:
+            index += state.length
+        if not 0 <= index < state.length:
+            raise IndexError('block index out of range')
+        return state.chain[index]
+
+
+    def get_block_header(self, index):
+        """ the block at `index`, only its header if it is pruned (see StoredChain.header) """
+        state = self.__state
+        if index < 0:
+            index += state.length
+        if not 0 <= index < state.length:
+            raise IndexError('block index out of range')
+        return state.chain.header(index)
+
+
+    def iter_blocks(self, start=0, end=None):
+        """ blocks [start, end), one at a time, without copying the chain """
+        state = self.__state
+        end = state.length if end is None else min(end, state.length)
+        for index in range(start, end):
+            yield state.chain[index]
+
+
+    def get_blocks(self, start, end):
+        """ blocks [start, end) as dictionaries """
+        return [block.to_dict() for block in self.iter_blocks(start, end)]
+
+
+    def get_headers(self, start, end):
+        """ headers of the blocks [start, end), each with the hash of its block """
+        state = self.__state
+        end = state.length if end is None else min(end, state.length)
+        headers = []
+        for index in range(start, end):
+            block = state.chain.header(index)
+            header = block.header()
+            header['hash'] = hash_block(block)
+            headers.append(header)
+        return headers
+
+
+    def archived_blocks(self):
+        """ number of blocks moved to the archive, the chain cannot fork below them """
+        return self.__archive.count
+
+
+    def verify(self):
+        """ Check the whole local chain, the pruned blocks by their headers """
+        state = self.__state
+        return Verification.verify_chain(state.chain.headers(state.length))
+
+
+    def is_open_transaction(self, tx_id):
+        """ True if the transaction waits to be mined, without a lookup in the transaction index """
+        return tx_id in self.__mempool
+
+
+    def get_transaction(self, tx_id):
+        """ the mined transaction with where it is in the chain, None if it is not mined """
+
+        location = self.__locate(tx_id)
+        if location is None:
+            return None
+        block, transactions, position = location
+        return {
+            'tx_id': tx_id,
+            'block_index': block.index,
+            'position': position,
+            'confirmations': self.__state.length - block.index,
+            'transaction': transactions[position].to_dict()
+        }
+
+
+    def get_owner_transactions(self, owner, start=0, limit=100):
+        """
+            Mined transactions of a dataOwner in chain order, from cursor `start` on.
+            Returns (transactions, cursor of the next page or None), the cursor follows the
+            last transaction returned and is None when there is nothing after it.
+            A limit below 1 gives an empty page.
+        """
+
+        if limit < 1:
+            return [], None
+        state = self.__state
+        rows = self.__tx_index.owner_transactions(owner, start, limit)
+        transactions = []
+        block_index, block_transactions = None, None
+        for seq, index, position in rows:
+            try:
+                # rows of the same block follow each other, its transactions are built once
+                if index >= state.length:
+                    # mined after the state was published, or the chain was cut back after the lookup
+                    break
+                if index != block_index:
+                    block_index, block_transactions = index, state.chain[index].transactions
+                tx = block_transactions[position]
+            except IndexError:
+                break
+            transactions.append({
+                'tx_id': tx.tx_id(),
+                'block_index': index,
+                'position': position,
+                'transaction': tx.to_dict()
+            })
+        # rows which were not returned (not in the published chain yet) come with the next page
+        more = len(rows) == limit or len(transactions) < len(rows)
+        next_cursor = rows[len(transactions) - 1][0] + 1 if more and len(transactions) != 0 else None
+        return transactions, next_cursor
+
+
+    def get_transaction_proof(self, tx_id):
+        """
+            Merkle proof that the transaction is in the chain, None if it is not (or its block has no merkle root)
+        """
+
+        location = self.__locate(tx_id)
+        if location is None or location[0].merkle_root is None:
+            return None
+        block, transactions, position = location
+        tx_ids = [hash_transaction(tx) for tx in transactions]
+        return {
+            'tx_id': tx_id,
+            'block_index': block.index,
+            'position': position,
+            'block_hash': hash_block(block),
+            'header': block.header(),
+            'branch': merkle_branch(tx_ids, position)
+        }
+
+
+    def __locate(self, tx_id):
+        """ (block, its transactions, position) of a mined transaction from the index, None if it is not mined """
+
+        location = self.__tx_index.find(tx_id.lower())
+        if location is None:
+            return None
+        index, position = location
+        try:
+            block = self.get_block(index)
+        except IndexError:
+            return None
+        transactions = block.transactions
+        # the chain may have been replaced after the lookup
+        if position >= len(transactions) or transactions[position].tx_id() != tx_id.lower():
+            return None
+        return block, transactions, position
+
 
-    
     # open transaction: get
-    def get_open_transactions(self):
-        return self.__open_transactions[:]
+    def get_open_transactions(self, start=0, end=None):
+        return list(self.__state.transactions[start:end])
+
+
+    def open_transactions_version(self):
+        """ changes whenever the open transactions change """
+        return self.__state.transactions_version
+
+
+    def open_transactions_stats(self):
+        """ number, bytes and age (seconds) of the oldest of the open transactions """
+        state = self.__state
+        age = time() - state.oldest_arrival if state.oldest_arrival is not None else 0
+        return len(state.transactions), state.transactions_bytes, age
     
 
     # peer node: add / remove / get
     def add_peer_node(self, node):
-        self.__peer_nodes.add(node)
-        self.save_data(save_nodes=True)
+        self.add_peer_nodes([node])
+
+    def add_peer_nodes(self, nodes):
+        """ add several peers with a single write of the peer file """
+        self.__execute(self.__add_peer_nodes, list(nodes))
+
+    def __add_peer_nodes(self, nodes):
+        self.__peer_nodes.update(nodes)
+        self.__save_data(save_nodes=True)
 
     def remove_peer_node(self, node):
+        self.__execute(self.__remove_peer_node, node)
+
+    def __remove_peer_node(self, node):
         self.__peer_nodes.discard(node)
-        self.save_data(save_nodes=True)
+        self.__save_data(save_nodes=True)
 
     def get_peer_nodes(self):
-        return list(self.__peer_nodes)
+        return list(self.__state.peer_nodes)
+
+
+    # single writer
+    def __execute(self, command, *args):
+        """ Run a command on the writer thread, returns once its result is published """
+
+        # the writer itself, or the node is still loading
+        if self.__writer is None or threading.current_thread() is self.__writer:
+            return command(*args)
+        future = Future()
+        self.__commands.put((future, command, args))
+        return future.result()
+
+
+    def __run_writer(self):
+        while True:
+            batch = [self.__commands.get()]
+            while len(batch) < self.WRITER_BATCH:
+                try:
+                    batch.append(self.__commands.get_nowait())
+                except queue.Empty:
+                    break
+
+            results = []
+            for future, command, args in batch:
+                try:
+                    results.append((future, command(*args), None))
+                except Exception as error:
+                    results.append((future, None, error))
+            try:
+                self.__publish()
+            except Exception as error:
+                print('Publishing the chain state FAILED: {}'.format(error))
+
+            # a caller reads its own change as soon as it gets the result
+            for future, result, error in results:
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
 
 
-    def save_data(self, save_chain=False, save_opentx=False, save_nodes=False) :
+    def __publish(self):
+        """ Make the current chain, open transactions and peers what readers see """
+
+        previous = self.__state
+        last_block = self.__chain[-1]
+        if previous is not None and previous.transactions_version == self.__mempool.version:
+            transactions, oldest_arrival = previous.transactions, previous.oldest_arrival
+        else:
+            # the open transactions are only copied when they changed
+            transactions = tuple(self.__mempool.transactions())
+            oldest_arrival = time() - self.__mempool.oldest_age() if len(transactions) != 0 else None
+        self.__state = ChainState(
+            chain=self.__chain,
+            length=len(self.__chain),
+            head={'height': last_block.index, 'hash': hash_block(last_block), 'work': self.__work},
+            transactions=transactions,
+            transactions_version=self.__mempool.version,
+            transactions_bytes=self.__mempool.bytes,
+            oldest_arrival=oldest_arrival,
+            peer_nodes=frozenset(self.__peer_nodes)
+        )
+        CHAIN_HEIGHT.set(last_block.index)
+        MEMPOOL_TRANSACTIONS.set(len(transactions))
+        MEMPOOL_BYTES.set(self.__mempool.bytes)
+
+
+    def save_data(self, save_chain=False, save_opentx=False, save_nodes=False):
+        self.__execute(self.__save_data, save_chain, save_opentx, save_nodes)
+
+
+    @SAVE_DATA_SECONDS.timed
+    def __save_data(self, save_chain=False, save_opentx=False, save_nodes=False):
         try:
             if save_chain:
-                db_blockchain = TinyDB('./db/blockchain-{}.json'.format(self.node_id))
-                saveable_chain = [block.__dict__ for block in [
-                    Block(block.index, 
-                            block.previous_hash, 
-                            [tx.__dict__ for tx in block.transactions], 
-                            block.proof, 
-                            block.timestamp) 
-                for block in self.__chain]]
-                db_blockchain.truncate()
-                for block in saveable_chain:
-                    db_blockchain.insert(block)
+                # only the blocks which are not in the log yet are written
+                new_blocks = self.__chain[self.__block_log.count:]
+                self.__block_log.append_many(new_blocks)
+                self.__tx_index.update(self.__chain)
+                # stored blocks only keep their encoded transactions
+                for block in new_blocks:
+                    block.compact()
+                # a fork below the snapshot makes it useless as well, archiving changes the log it describes
+                archived = self.__prune()
+                height = self.__block_log.count
+                if archived or height - self.__snapshot.height >= SNAPSHOT_INTERVAL or height < self.__snapshot.height:
+                    self.__save_snapshot()
 
             if save_opentx:
-                db_opentx = TinyDB('./db/opentx-{}.json'.format(self.node_id))
-                saveable_tx = [tx.__dict__ for tx in self.__open_transactions]
-                db_opentx.truncate()
-                for tx in saveable_tx:
-                    db_opentx.insert(tx)
+                # every change is already in the mempool journal
+                self.__mempool.sync()
 
             if save_nodes:
                 db_nodes = TinyDB('./db/peernodes-{}.json'.format(self.node_id))
                 saveable_nodes = [{"node": node} for node in list(self.__peer_nodes)]
                 db_nodes.truncate()
-                for node in saveable_nodes:
-                    db_nodes.insert(node)
+                # one write of the file, not one per peer
+                db_nodes.insert_multiple(saveable_nodes)
 
         except IOError:
             print('Saving data FAILED')
 
 
     def load_data(self):
-        try: 
-            db_blockchain = TinyDB('./db/blockchain-{}.json'.format(self.node_id))
-            db_opentx = TinyDB('./db/opentx-{}.json'.format(self.node_id))
-            db_nodes = TinyDB('./db/peernodes-{}.json'.format(self.node_id))
+        """ Open the chain from the latest snapshot, only the blocks stored after it are read """
 
-            blockchain = db_blockchain.all()
-            open_transactions = db_opentx.all()
-            peer_nodes = db_nodes.all()
+        try: 
+            snapshot = self.__snapshot.load()
+            self.__block_log.open()
+            if snapshot is not None and not self.__snapshot_matches(snapshot):
+                print('Snapshot does not match the block log, reading the whole chain')
+                snapshot = None
+                self.__snapshot.height = 0
+            if self.__block_log.count == 0:
+                self.migrate_chain()
+
+            # the blocks archived before the node stopped may still be in the log as well
+            moved = False
+            archived = self.__archive.open()
+            if archived > self.__block_log.base:
+                self.__block_log.drop_before(archived)
+                moved = True
+            elif archived < self.__block_log.base:
+                print('Blocks {} to {} are missing from the archive'.format(archived, self.__block_log.base - 1))
 
             # save default value (genesis block in this case)
-            if len(blockchain) is not 0:
-                self.__chain = [Block(
-                    block['index'],
-                    block['previous_hash'],
-                    [Transaction(
-                        tx['dataOwner'], 
-                        tx['signature'], 
-                        tx['hop_count']
-                    ) for tx in block['transactions']],
-                    block['proof'],
-                    block['timestamp']
-                ) for block in blockchain]
+            if self.__block_log.count != 0:
+                self.__chain = StoredChain(self.__block_log, archive=self.__archive, keep=self.keep_blocks)
+            # only the headers after the snapshot are read to count the work
+            if snapshot is not None:
+                self.__work = snapshot['work'] + chain_work(self.__chain.headers()[snapshot['height']:])
+            else:
+                self.__work = chain_work(self.__chain.headers())
+
+            # the index may be behind (first start, crash) or ahead (torn block log) of the chain
+            self.__tx_index.catch_up(self.__chain)
+            # a node which just turned pruning on archives its old blocks right away
+            moved = self.__prune() or moved
+
+            self.__mempool.load(legacy_path='./db/opentx-{}.json'.format(self.node_id),
+                                snapshot=snapshot['mempool'] if snapshot is not None else None)
+
+            # the peers file is newer when a peer was added / removed after the snapshot
+            peers_path = './db/peernodes-{}.json'.format(self.node_id)
+            if snapshot is not None and (not os.path.exists(peers_path) or os.path.getmtime(peers_path) <= snapshot['created']):
+                peer_nodes = snapshot['peers']
+            else:
+                peer_nodes = [node['node'] for node in TinyDB(peers_path).all()]
 
             # save default value
-            if len(open_transactions) is not 0:
-                self.__open_transactions = [Transaction(
-                    tx['dataOwner'], 
-                    tx['signature'], 
-                    tx['hop_count']
-                ) for tx in open_transactions]
+            if len(peer_nodes) != 0:
+                self.__peer_nodes = set(peer_nodes)
 
-            # save default value
-            if len(peer_nodes) is not 0:
-                self.__peer_nodes = set([node['node'] for node in peer_nodes])
+            if moved or self.__block_log.count - self.__snapshot.height >= SNAPSHOT_INTERVAL:
+                self.__save_snapshot()
 
         except (IOError, IndexError):
             pass
 
 
-    def proof_of_work(self):
-        """ to get a string starts with 00 """
-        last_block = self.__chain[-1]
-        last_hash = hash_block(last_block)
-        proof = 0
+    def save_snapshot(self):
+        """ Save the state of the node at the last stored block """
+        self.__execute(self.__save_snapshot)
+
+
+    def __save_snapshot(self):
+        if self.__block_log.count == 0:
+            return
+        try:
+            self.__block_log.sync()
+            work = self.__work - chain_work(self.__chain.headers()[self.__block_log.count:])
+            self.__snapshot.write(hash_block(self.__chain.header(self.__block_log.count - 1)), self.__block_log.count,
+                                  self.__block_log.size, self.__mempool.snapshot(), self.__peer_nodes,
+                                  self.__block_log.base, work)
+        except IOError:
+            print('Saving the snapshot FAILED')
+
+
+    def __snapshot_matches(self, snapshot):
+        """ the block log still holds the blocks the snapshot was taken of """
+
+        height = snapshot['height']
+        if height == 0 or self.__block_log.count < height:
+            return False
+        try:
+            return hash_block(self.__block_log.read(height - 1)) == snapshot['tip_hash']
+        except (ValueError, IndexError):
+            return False
+
+
+    def __prune(self):
+        """
+            Keep the transactions of the last keep_blocks blocks only, and move the stored blocks
+            older than them to the archive, whole segments at a time. True if the block log was cut.
+        """
+
+        if self.keep_blocks is None:
+            return False
+        self.__chain.prune()
+        end = min(len(self.__chain) - self.keep_blocks, self.__block_log.count)
+        segment_blocks = self.__archive.segment_blocks
+        if self.__archive.count + segment_blocks > end:
+            return False
+        try:
+            while self.__archive.count + segment_blocks <= end:
+                first = self.__archive.count
+                self.__archive.append([self.__block_log.read(index) for index in range(first, first + segment_blocks)])
+        except IOError:
+            print('Archiving blocks FAILED')
+        # the log is cut once, after all the segments are written
+        self.__block_log.drop_before(self.__archive.count)
+        return True
+
+
+    def migrate_chain(self):
+        """ One-time copy of an old TinyDB chain file into the block log """
 
-        while not Verification.valid_proof(self.__open_transactions, last_hash, proof):
-            proof += 1
-        return proof
+        legacy_path = './db/blockchain-{}.json'.format(self.node_id)
+        if not os.path.exists(legacy_path):
+            return []
+        blockchain = [Block.from_dict(block) for block in TinyDB(legacy_path).all()]
+        if len(blockchain) != 0:
+            self.__block_log.rewrite(blockchain)
+            # an older snapshot does not match the new log
+            self.__snapshot.height = 0
+            print('Migrated {} blocks from {}'.format(len(blockchain), legacy_path))
+        return blockchain
 
 
+    def proof_of_work(self, prefix, difficulty, cancel=None):
+        """ to get a header hash (prefix + proof) starting with `difficulty` zero bits, None if cancelled """
+        with PROOF_OF_WORK_SECONDS.time():
+            return self.miner.find(prefix, difficulty, cancel)
+
+
+    @ADD_TRANSACTION_SECONDS.timed
     def add_transaction(self, dataOwner, signature, hop_count, is_receiving=False):
         """ 
             Append the transaction to the open_transaction list
@@ -164,140 +581,280 @@ class Blockchain:
         """
 
         transaction = Transaction(dataOwner, signature, hop_count)
+        # a transaction relayed by several peers is only taken (and verified) the first time
+        if is_receiving and not self.gossip.first_seen('transaction', transaction.tx_id()):
+            return True
+        # the signature is checked by the caller's thread, only adding it goes through the writer
         if Verification.verify_transaction(transaction):
-            self.__open_transactions.append(transaction)
-            self.save_data(save_opentx=True)
-
-            # Broadcasting
-            if not is_receiving:
-                for node in self.__peer_nodes:
-                    url = 'http://{}/broadcast-transaction'.format(node)
-                    try:
-                        response = requests.post(url, json={
-                            'dataOwner': dataOwner, 
-                            'signature': signature,
-                            'hop_count': hop_count
-                        })
-                        if response.status_code == 400 or response.status_code == 500:
-                            print('Transaction declined, needs resolving')
-                            return False
-                    except requests.exceptions.ConnectionError:
-                        print('Error occurred when Broadcasting Transaction')
-                        continue
+            if not self.__execute(self.__mempool.add, transaction):
+                # already pending, and already sent to the peers
+                TRANSACTION_REJECTIONS.labels('duplicate').inc()
+                return True
+            TRANSACTIONS.labels('peer' if is_receiving else 'local').inc()
+
+            # Broadcasting: the peers which get it relay it further
+            self.gossip.announce_transaction(transaction, self.__on_transaction_broadcast)
             return True
+        TRANSACTION_REJECTIONS.labels('invalid').inc()
         return False
 
 
+    def __on_transaction_broadcast(self, results):
+        if any(status == 400 or status == 500 for status in results.values()):
+            print('Transaction declined, needs resolving')
+
+
+    @MINE_BLOCK_SECONDS.timed
     def mine_block(self):
         """ 
             Add a new block to the current chain,
-            The tx in open_transaction will be added to this block
+            The oldest tx in open_transaction, up to the maximum block size, will be added to this block
+
+            The proof of work runs outside the writer, it is cancelled (None is returned) when
+            another block or chain is accepted meanwhile.
         """
 
         if self.public_key == None:
             return None
+        with self.__mining:
+            self.__cancel_mining.clear()
+            return self.__mine_block()
 
-        hashed_block = hash_block(self.__chain[-1])
-        proof = self.proof_of_work()
-        copied_transactions = self.__open_transactions[:]
-        for tx in copied_transactions:
-            if not Wallet.verify_transaction(tx):
-                return None
-        
-        block = Block(len(self.__chain), hashed_block, copied_transactions, proof)
-        self.__chain.append(block)
-        self.__open_transactions = []
-        self.save_data(save_chain=True, save_opentx=True)
+
+    def __mine_block(self):
+        index, hashed_block, copied_transactions, difficulty, earliest = self.__execute(self.__block_template)
+        if not Wallet.verify_transactions(copied_transactions):
+            return None
+        tx_root = merkle_root([hash_transaction(tx) for tx in copied_transactions])
+        # a clock behind the median of the last blocks still gives a valid block
+        timestamp = max(time(), earliest + 0.001)
+        prefix = header_prefix(index, hashed_block, tx_root, timestamp, difficulty)
+        proof = self.proof_of_work(prefix, difficulty, self.__cancel_mining)
+        if proof is None:
+            print('Mining cancelled, the chain changed')
+            MINING_CANCELLED.inc()
+            return None
+
+        block = Block(index, hashed_block, copied_transactions, proof, timestamp, difficulty, tx_root)
+        if not self.__execute(self.__append_block, block, copied_transactions):
+            MINING_CANCELLED.inc()
+            return None
+        BLOCKS.labels('mined').inc()
 
         # Broadcasting
-        for node in self.__peer_nodes:
-            url = 'http://{}/broadcast-block'.format(node)
-            converted_block = block.__dict__.copy()
-            converted_block['transactions'] = [tx.__dict__ for tx in converted_block['transactions']]
-            try:
-                response = requests.post(url, json={'block': converted_block})
-                if response.status_code == 400 or response.status_code == 500:
-                    print('Block declined, needs resolving')
-                if response.status_code == 409:
-                    self.resolve_conflicts = True
-            except requests.exceptions.ConnectionError:
-                print('Error occurred when Broadcasting Block')
-                continue
+        self.gossip.announce_block(block, self.__on_block_broadcast)
         return block
 
 
-    def add_block(self, block):
-        """ Create a new block, used for broadcasting"""
+    def __block_template(self):
+        """ (index, previous hash, transactions, difficulty, median time of the last blocks) of the next block """
+
+        return (len(self.__chain), hash_block(self.__chain[-1]),
+                self.__mempool.select(MAX_BLOCK_TRANSACTIONS, MAX_BLOCK_BYTES), next_difficulty(self.__chain),
+                median_time(self.__chain.headers()))
+
 
-        transactions = [Transaction(
-            tx['dataOwner'], 
-            tx['signature'], 
-            tx['hop_count']
-        ) for tx in block['transactions']]
+    def __append_block(self, block, transactions):
+        """ Append a verified block, unless the tip moved since it was verified """
 
-        proof_is_valid = Verification.valid_proof(transactions, block['previous_hash'], block['proof'])
-        hashes_match = hash_block(self.__chain[-1]) == block['previous_hash']
-        if not proof_is_valid or not hashes_match:
+        if block.index != len(self.__chain) or block.previous_hash != hash_block(self.__chain[-1]):
             return False
-        
-        converted_block = Block(block['index'], 
-                                block['previous_hash'], 
-                                transactions, 
-                                block['proof'], 
-                                block['timestamp']
-        )
-        self.__chain.append(converted_block)
-        stored_transactions = self.__open_transactions[:]
-
-        # check the open transaction when broadcasting
-        for itx in block['transactions']:
-            for opentx in stored_transactions:
-                if opentx.dataOwner == itx['dataOwner'] and opentx.signature == itx['signature'] and opentx.hop_count == itx['hop_count']:
-                    try:
-                        self.__open_transactions.remove(opentx)
-                    except ValueError:
-                        print('Opentx not found, maybe it is already removed')
-        self.save_data(save_chain=True, save_opentx=True)
+        self.__chain.append(block)
+        self.__work += block_work(block)
+        # drop the open transactions which are now in the block
+        self.__mempool.confirm(transactions)
+        self.gossip.mined(transactions)
+        self.__save_data(save_chain=True, save_opentx=True)
+        self.__cancel_mining.set()
         return True
+
+
+    def __on_block_broadcast(self, results):
+        for status in results.values():
+            if status == 400 or status == 500:
+                print('Block declined, needs resolving')
+            if status == 409:
+                self.resolve_conflicts = True
+
+
+    @ADD_BLOCK_SECONDS.timed
+    def add_block(self, block):
+        """ Append a block received from a peer node (a Block or its dictionary) """
+
+        converted_block = block if isinstance(block, Block) else Block.from_dict(block)
+        transactions = converted_block.transactions
+        state = self.__state
+        # only blocks stored before merkle roots existed may lack one
+        if converted_block.merkle_root is None:
+            return self.__reject_block(converted_block, 'merkle_root')
+        if converted_block.index != state.length:
+            return self.__reject_block(converted_block, 'index')
+
+        # verified against the published state, the writer only checks that the tip is still the same
+        if state.head['hash'] != converted_block.previous_hash:
+            return self.__reject_block(converted_block, 'previous_hash')
+        if converted_block.difficulty != next_difficulty(state.chain, state.length):
+            return self.__reject_block(converted_block, 'difficulty')
+        if not Verification.valid_timestamp(converted_block, state.chain.headers(state.length), state.length):
+            return self.__reject_block(converted_block, 'timestamp')
+        if not Verification.valid_merkle_root(converted_block):
+            return self.__reject_block(converted_block, 'merkle_root')
+        if not Verification.valid_block_proof(converted_block):
+            return self.__reject_block(converted_block, 'proof')
+        if not Verification.valid_block_size(transactions):
+            return self.__reject_block(converted_block, 'size')
+        if not Wallet.verify_transactions(transactions):
+            return self.__reject_block(converted_block, 'signature')
+
+        if not self.__execute(self.__append_block, converted_block, transactions):
+            # the tip moved while the block was verified
+            return self.__reject_block(converted_block, 'stale')
+        BLOCKS.labels('peer').inc()
+        # relayed to a few peers, like a mined block
+        self.gossip.announce_block(converted_block, self.__on_block_broadcast)
+        return True
+
+
+    def __reject_block(self, block, reason):
+        BLOCK_REJECTIONS.labels(reason).inc()
+        # another copy of the block may still come, it must not be dropped as a duplicate
+        self.gossip.rejected(hash_block(block))
+        return False
     
 
+    def fork_point(self, node_chain):
+        """
+            Index of the first block of node_chain which is not in the local chain.
+
+            Block i is shared when node_chain[i + 1] points to the hash of the local block i,
+            the last shared block is found by binary search so only O(log n) local hashes
+            are needed (and those are cached on the blocks).
+        """
+
+        state = self.__state
+        low, high = 0, min(state.length, len(node_chain) - 1) - 1
+        while low < high:
+            middle = (low + high + 1) // 2
+            if node_chain[middle + 1].previous_hash == hash_block(state.chain.header(middle)):
+                low = middle
+            else:
+                high = middle - 1
+        return low + 1
+
+
+    def fetch_chain(self, node):
+        """
+            Download the chain of a peer node, the new blocks are verified while they are parsed
+            so a bad chain is dropped at its first bad block.
+            Returns (fork, new blocks) if it is a valid chain which differs from the local one, else None;
+            replace_chain takes it only if it has more work.
+        """
+
+        url = 'http://{}/chain'.format(node)
+        local_chain_length = self.__state.length
+        node_chain = []
+        candidate = None
+        fork = None
+        headers = {'Accept': '{}, application/json;q=0.5'.format(MIMETYPE)} if BINARY_WIRE else None
+        try:
+            with self.broadcaster.session.get(url, stream=True, headers=headers, timeout=self.broadcaster.timeout) as response:
+                if response.status_code != 200:
+                    return None
+                chunks = response.iter_content(chunk_size=65536)
+                if response.headers.get('Content-Type', '').startswith(MIMETYPE):
+                    decoder = Decoder()
+                    blocks = (decoder.decode_block(message) for message in iter_frames(chunks))
+                else:
+                    text_decoder = codecs.getincrementaldecoder('utf-8')()
+                    text_chunks = (text_decoder.decode(chunk) for chunk in chunks)
+                    blocks = (Block.from_dict(block) for block in iter_json_array(text_chunks))
+                for count, block in enumerate(blocks):
+                    if block.index != count:
+                        return None
+                    if candidate is not None:
+                        candidate.blocks.append(block)
+                        if not Verification.verify_block(candidate, count):
+                            return None
+                        continue
+
+                    node_chain.append(block)
+                    if len(node_chain) > local_chain_length:
+                        # keep the shared part of the local chain, only the new blocks need checking
+                        fork = self.fork_point(node_chain)
+                        if fork < self.archived_blocks():
+                            return None
+                        candidate = ForkView(self, fork, node_chain[fork:])
+                        node_chain = None
+                        if not Verification.verify_chain(candidate, start=fork):
+                            return None
+        except (requests.exceptions.RequestException, ValueError, KeyError, IndexError, TypeError):
+            print('Error occurred when fetching the chain of {}'.format(node))
+            return None
+
+        # a chain which is not longer may still hold more work
+        if candidate is None and node_chain is not None and len(node_chain) > 1:
+            fork = self.fork_point(node_chain)
+            if fork >= len(node_chain) or fork < self.archived_blocks():
+                return None
+            candidate = ForkView(self, fork, node_chain[fork:])
+            if not Verification.verify_chain(candidate, start=fork):
+                return None
+        if candidate is None:
+            return None
+        return fork, candidate.blocks
+
+
+    @RESOLVE_SECONDS.timed
     def resolve(self):
-        """ resolve the blockchain conflicts, the longer one wins """
+        """ resolve the blockchain conflicts, the chain with the most work wins """
+
+        # ask every peer for its head first, only the chains with more work are downloaded
+        winner = None
+        for node, head in self.sync.candidates():
+            # fetch the missing blocks only, whole chain from nodes without the sync endpoints
+            winner = self.sync.fetch(node, head)
+            if winner is None:
+                winner = self.fetch_chain(node)
+            if winner is not None:
+                break
 
-        winner_chain = self.__chain
-        replace = False
-        for node in self.__peer_nodes:
-            url = 'http://{}/chain'.format(node)
-            try:
-                response = requests.get(url)
-                node_chain = response.json()
-                node_chain = [Block(
-                    block['index'], 
-                    block['previous_hash'], 
-                    [Transaction(
-                        tx['dataOwner'], 
-                        tx['signature'], 
-                        tx['hop_count']
-                    ) for tx in block['transactions']],
-                    block['proof'],
-                    block['timestamp']
-                ) for block in node_chain]
-
-                node_chain_length = len(node_chain)
-                local_chain_length = len(winner_chain)
-
-                # replace the BC if the received one is longer
-                if node_chain_length > local_chain_length and Verification.verify_chain(node_chain):
-                    winner_chain = node_chain
-                    replace = True
-            except requests.exceptions.ConnectionError:
-                continue
         self.resolve_conflicts = False
-        self.__chain = winner_chain
-        if replace:
-            self.__open_transactions = []
-        self.save_data(save_chain=True, save_opentx=True)
-        return replace
+        if winner is None:
+            return False
+        return self.replace_chain(*winner)
+
 
+    def replace_chain(self, fork, blocks):
+        """
+            Drop the local blocks from `fork` on and append the given (verified) blocks instead.
+            Nothing happens unless the new blocks hold more work than the dropped ones.
+        """
+        return self.__execute(self.__replace_chain, fork, blocks)
 
 
+    def __replace_chain(self, fork, blocks):
+        if fork < self.__archive.count:
+            print('Not replacing the chain, it forks at block {} below the archived blocks'.format(fork))
+            return False
+        # the blocks were verified against the chain up to `fork`, which may have forked since
+        if len(blocks) == 0 or not 0 < fork <= len(self.__chain) or \
+                blocks[0].previous_hash != hash_block(self.__chain.header(fork - 1)):
+            return False
+        dropped = chain_work(self.__chain.headers()[fork:])
+        if chain_work(blocks) <= dropped:
+            return False
+        # evict the open transactions which the new part of the chain already holds
+        for block in blocks:
+            self.__mempool.confirm(block.transactions)
+            self.gossip.mined(block.transactions)
+        # readers of the published state keep the old chain, and the block log it was read from
+        chain = self.__chain.fork(fork, blocks)
+        self.__tx_index.rollback(fork)
+        self.__block_log.truncate(fork)
+        self.__chain = chain
+        self.__work += chain_work(blocks) - dropped
+        self.__save_data(save_chain=True, save_opentx=True)
+        self.__cancel_mining.set()
+        CHAIN_REPLACEMENTS.inc()
+        BLOCKS.labels('sync').inc(len(blocks))
+        return True
@@ -0,0 +1,158 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+import queue
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from codec import MIMETYPE
+from config import BROADCAST_TIMEOUT, BROADCAST_WORKERS, BROADCAST_QUEUE_SIZE
+from metrics import BROADCAST_SECONDS, BROADCAST_RESPONSES
+
+
+class Broadcaster:
+    """
+        Sends transactions and blocks to the peer nodes
+
+        All peers are posted to at the same time over pooled keep-alive connections,
+        each with its own timeout. enqueue() hands the broadcast to a background
+        thread through a bounded queue, so the HTTP request which created the
+        transaction or block does not wait for the peers. A payload given in the
+        binary encoding as well is sent as such, and as json to the peers which
+        answer 415 (older nodes).
+
+        self.session:           requests session holding the connection pool
+        self.timeout:           seconds to wait for one peer
+    """
+
+    def __init__(self, timeout=BROADCAST_TIMEOUT, workers=BROADCAST_WORKERS, queue_size=BROADCAST_QUEUE_SIZE):
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.__executor = ThreadPoolExecutor(workers)
+        self.__queue = queue.Queue(queue_size)
+        self.__thread = None
+        self.__lock = threading.Lock()
+
+
+    def broadcast(self, nodes, path, payload, data=None):
+        """
+            Post the payload (or its binary encoding `data`) to every node and wait for all of them.
+            Returns node -> response status code, None when the node could not be reached.
+        """
+
+        futures = {node: self.__executor.submit(self.__post, node, path, payload, data) for node in nodes}
+        wait(futures.values())
+        return {node: future.result() for node, future in futures.items()}
+
+
+    def query(self, nodes, path):
+        """
+            GET the path from every node at the same time.
+            Returns node -> decoded json, None when the node could not be reached.
+        """
+
+        futures = {node: self.__executor.submit(self.__get, node, path) for node in nodes}
+        wait(futures.values())
+        return {node: future.result() for node, future in futures.items()}
+
+
+    def ask(self, nodes, path, payload):
+        """
+            Post the json payload to every node at the same time.
+            Returns node -> decoded json answer, None when the node could not be reached.
+        """
+
+        futures = {node: self.__executor.submit(self.__ask, node, path, payload) for node in nodes}
+        wait(futures.values())
+        return {node: future.result() for node, future in futures.items()}
+
+
+    def enqueue(self, nodes, path, payload, callback=None, data=None):
+        """
+            Broadcast in the background, callback (if any) gets the result of broadcast().
+            Waits when the queue is full, so a flood of broadcasts slows down the producer.
+        """
+
+        nodes = list(nodes)
+        if len(nodes) == 0:
+            return
+        self.__start()
+        self.__queue.put((nodes, path, payload, callback, data))
+
+
+    def join(self):
+        """ Wait until every queued broadcast is sent """
+        self.__queue.join()
+
+
+    def pending(self):
+        return self.__queue.qsize()
+
+
+    def __post(self, node, path, payload, data=None):
+        with BROADCAST_SECONDS.labels(node, path).time():
+            status = self.__send(node, path, payload, data)
+        BROADCAST_RESPONSES.labels(path, status if status is not None else 'unreachable').inc()
+        return status
+
+
+    def __send(self, node, path, payload, data=None):
+        url = 'http://{}/{}'.format(node, path)
+        try:
+            if data is not None:
+                response = self.session.post(url, data=data, headers={'Content-Type': MIMETYPE}, timeout=self.timeout)
+                if response.status_code != 415:
+                    return response.status_code
+            response = self.session.post(url, json=payload, timeout=self.timeout)
+            return response.status_code
+        except requests.exceptions.RequestException:
+            print('Error occurred when Broadcasting to {}'.format(node))
+            return None
+
+
+    def __ask(self, node, path, payload):
+        url = 'http://{}/{}'.format(node, path)
+        try:
+            with BROADCAST_SECONDS.labels(node, path).time():
+                response = self.session.post(url, json=payload, timeout=self.timeout)
+            BROADCAST_RESPONSES.labels(path, response.status_code).inc()
+            if response.status_code != 200:
+                return None
+            return response.json()
+        except (requests.exceptions.RequestException, ValueError):
+            BROADCAST_RESPONSES.labels(path, 'unreachable').inc()
+            return None
+
+
+    def __get(self, node, path):
+        url = 'http://{}/{}'.format(node, path)
+        try:
+            response = self.session.get(url, timeout=self.timeout)
+            if response.status_code != 200:
+                return None
+            return response.json()
+        except (requests.exceptions.RequestException, ValueError):
+            return None
+
+
+    def __start(self):
+        with self.__lock:
+            if self.__thread is None:
+                self.__thread = threading.Thread(target=self.__run, daemon=True)
+                self.__thread.start()
+
+
+    def __run(self):
+        while True:
+            nodes, path, payload, callback, data = self.__queue.get()
+            try:
+                results = self.broadcast(nodes, path, payload, data)
+                if callback is not None:
+                    callback(results)
+            except Exception as e:
+                print('Broadcasting FAILED: {}'.format(e))
+            finally:
+                self.__queue.task_done()
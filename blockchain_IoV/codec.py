@@ -0,0 +1,191 @@
+from block import Block
+from utility.hash_util import hash_block
+from utility.binary import write_varint, read_varint, write_value, read_value, write_transaction, read_transaction
+
+
+# content type of the binary encoding, the json one stays the default
+MIMETYPE = 'application/x-iov-binary'
+
+# first byte of an encoded message
+BLOCK = 1
+TRANSACTION = 2
+# a block with its transactions encoded on their own (Block.raw_transactions), as stored
+RAW_BLOCK = 3
+# a block header with the hash of its block, as archived (see archive.py)
+HEADER = 4
+
+HEADER_FIELDS = 6
+
+
+class Encoder:
+    """
+        Binary encoding of blocks and transactions
+
+        The dataOwner keys are interned: the first time a key is written it is given
+        the next key id and stored once, afterwards only its id is written. One encoder
+        is used for a whole stream (a /chain or /blocks response), so a key is sent
+        once per stream, a single message is encoded with a fresh encoder.
+
+            block:          BLOCK, index, previous_hash, timestamp, proof, difficulty,
+                            merkle_root, number of transactions, transactions
+            raw block:      RAW_BLOCK, the same header, Block.raw_transactions()
+            header:         HEADER, the same header, the block hash
+            transaction:    owner, signature, hop_count
+            owner:          varint 0 followed by the key (a new key),
+                            or varint key id + 1 (a key written before)
+
+        Values are written by utility.binary.write_value. The block log stores raw
+        blocks, their transactions are kept encoded in memory (see Block).
+    """
+
+    def __init__(self):
+        self.__owner_ids = {}
+
+
+    def encode_block(self, block):
+        out = bytearray([BLOCK])
+        write_header(out, block)
+        transactions = block.transactions
+        write_varint(out, len(transactions))
+        for tx in transactions:
+            write_transaction(out, tx, self.__owner_ids)
+        return bytes(out)
+
+
+    def encode_transaction(self, transaction):
+        out = bytearray([TRANSACTION])
+        write_transaction(out, transaction, self.__owner_ids)
+        return bytes(out)
+
+
+    @staticmethod
+    def encode_raw_block(block):
+        """ a block which decodes without its transactions being built, it needs no key table """
+        out = bytearray([RAW_BLOCK])
+        write_header(out, block)
+        return bytes(out) + block.raw_transactions()
+
+
+    @staticmethod
+    def encode_header(block):
+        """ the header alone, with the hash so that blocks without merkle root need no transactions for it """
+        out = bytearray([HEADER])
+        write_header(out, block)
+        write_value(out, hash_block(block))
+        return bytes(out)
+
+
+class Decoder:
+    """
+        Reads what an Encoder wrote, the keys interned so far are kept in self.owner_keys
+    """
+
+    def __init__(self):
+        self.owner_keys = []
+
+
+    def decode_block(self, data):
+        """ a raw block keeps its transactions encoded until they are used """
+
+        if data[0] != BLOCK and data[0] != RAW_BLOCK:
+            raise ValueError('Not an encoded block')
+        offset = 1
+        values = []
+        for _ in range(HEADER_FIELDS):
+            value, offset = read_value(data, offset)
+            values.append(value)
+        index, previous_hash, timestamp, proof, difficulty, merkle_root = values
+        if data[0] == RAW_BLOCK:
+            return Block(index, previous_hash, None, proof, timestamp, difficulty, merkle_root, raw=bytes(data[offset:]))
+        count, offset = read_varint(data, offset)
+        transactions = []
+        for _ in range(count):
+            tx, offset = read_transaction(data, offset, self.owner_keys)
+            transactions.append(tx)
+        return Block(index, previous_hash, transactions, proof, timestamp, difficulty, merkle_root)
+
+
+    @staticmethod
+    def decode_header(data):
+        """ a header-only block (see Block.header_only) """
+
+        if data[0] != HEADER:
+            raise ValueError('Not an encoded header')
+        offset = 1
+        values = []
+        for _ in range(HEADER_FIELDS + 1):
+            value, offset = read_value(data, offset)
+            values.append(value)
+        index, previous_hash, timestamp, proof, difficulty, merkle_root, block_hash = values
+        block = Block(index, previous_hash, None, proof, timestamp, difficulty, merkle_root)
+        block._hash = block_hash
+        return block
+
+
+    def decode_transaction(self, data):
+        if data[0] != TRANSACTION:
+            raise ValueError('Not an encoded transaction')
+        return read_transaction(data, 1, self.owner_keys)[0]
+
+
+def write_header(out, block):
+    for value in (block.index, block.previous_hash, block.timestamp, block.proof,
+                  block.difficulty, block.merkle_root):
+        write_value(out, value)
+
+
+def encode_frames(messages):
+    """ Length-prefix every encoded message of a stream """
+
+    for message in messages:
+        out = bytearray()
+        write_varint(out, len(message))
+        yield bytes(out) + message
+
+
+def iter_frames(chunks):
+    """ Yield the messages of a framed stream given in chunks of any size """
+
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer += chunk
+        offset = 0
+        while True:
+            try:
+                length, start = read_varint(buffer, offset)
+            except IndexError:
+                break
+            if start + length > len(buffer):
+                break
+            yield bytes(buffer[start:start + length])
+            offset = start + length
+        del buffer[:offset]
+    if len(buffer) != 0:
+        raise ValueError('Truncated frame')
+
+
+def dumps_block(block):
+    return Encoder().encode_block(block)
+
+
+def loads_block(data):
+    return Decoder().decode_block(data)
+
+
+def dumps_transaction(transaction):
+    return Encoder().encode_transaction(transaction)
+
+
+def loads_transaction(data):
+    return Decoder().decode_transaction(data)
+
+
+def dumps_transactions(transactions):
+    """ several transactions as one framed stream, every owner key is written once """
+    encoder = Encoder()
+    return b''.join(encode_frames(encoder.encode_transaction(tx) for tx in transactions))
+
+
+def loads_transactions(data):
+    decoder = Decoder()
+    return [decoder.decode_transaction(message) for message in iter_frames([data])]
@@ -0,0 +1,100 @@
+"""
+    Settings of a node
+"""
+
+# proof of work: leading zero bits the proof hash needs ('000' in hex == 12 bits)
+DIFFICULTY = 12
+MIN_DIFFICULTY = 1
+MAX_DIFFICULTY = 64
+
+# difficulty retargeting: the block time it aims for (seconds),
+# how many recent blocks are measured and how many bits it may move per block
+TARGET_BLOCK_TIME = 10
+RETARGET_WINDOW = 10
+MAX_RETARGET_STEP = 2
+
+# block timestamps: a block must be later than the median of the last MEDIAN_TIME_BLOCKS blocks
+# and at most MAX_FUTURE_BLOCK_TIME seconds ahead of the local clock
+MEDIAN_TIME_BLOCKS = 11
+MAX_FUTURE_BLOCK_TIME = 300
+
+# signature verification: number of verified signatures / parsed public keys kept in memory,
+# batches of at least VERIFY_BATCH_MIN transactions are checked in VERIFY_PROCESSES processes
+SIGNATURE_CACHE_SIZE = 100000
+PUBLIC_KEY_CACHE_SIZE = 1024
+VERIFY_BATCH_MIN = 16
+VERIFY_PROCESSES = None
+
+# signing: batches of at least SIGN_BATCH_MIN transactions are signed in SIGN_PROCESSES processes
+SIGN_BATCH_MIN = 32
+SIGN_PROCESSES = None
+
+# broadcasting to peer nodes: seconds to wait for one peer, parallel requests,
+# and how many broadcasts may wait in the outbound queue
+BROADCAST_TIMEOUT = 3
+BROADCAST_WORKERS = 16
+BROADCAST_QUEUE_SIZE = 1000
+
+# gossip: random peers a new transaction / block is announced to (all of them when None),
+# seconds transactions are collected to be announced together, how long / how many
+# hashes are remembered to drop items which come again, and seconds an item asked
+# for from one peer is waited for before it is asked for from another
+GOSSIP_FANOUT = 8
+GOSSIP_INTERVAL = 1
+GOSSIP_SEEN_TTL = 600
+GOSSIP_SEEN_SIZE = 100000
+GOSSIP_REQUEST_TTL = 5
+
+# wire format: send and ask for blocks / transactions in the binary encoding
+# of codec.py (json is still used with peers which do not know it)
+BINARY_WIRE = True
+# decoded transactions share one string per dataOwner key, for the OWNER_KEY_CACHE_SIZE keys used last
+OWNER_KEY_CACHE_SIZE = 1024
+
+# asyncio node (async_node.py): threads running the blocking blockchain / wallet calls,
+# and blocks or transactions encoded per chunk of a streamed response
+ASYNC_WORKERS = 32
+ASYNC_STREAM_BATCH = 100
+
+# sampling profiler (/profiler routes): seconds between two stack samples, frames kept per stack
+PROFILER_INTERVAL = 0.005
+PROFILER_MAX_DEPTH = 64
+
+# snapshots: blocks stored between two snapshots of the node state
+SNAPSHOT_INTERVAL = 100
+
+# pruning: full blocks kept below the tip (every block when None, at least RETARGET_WINDOW + 1),
+# the older ones only keep their header in memory and are moved out of the block log to
+# compressed archive segments of ARCHIVE_SEGMENT_BLOCKS blocks, where a block is read again
+# when it is used. A fork below the archive is refused.
+PRUNE_KEEP_BLOCKS = None
+ARCHIVE_SEGMENT_BLOCKS = 1000
+
+# chain sync: blocks per /blocks request, requests in flight at once,
+# and the most headers / blocks a node serves per request
+SYNC_BATCH_SIZE = 50
+SYNC_PIPELINE = 4
+MAX_HEADERS = 2000
+MAX_BLOCKS = 500
+# most transactions per page of /transactions and /owner/<owner>/transactions
+MAX_PAGE_TRANSACTIONS = 1000
+
+# file ingestion: output of the OMNeT++ simulation, rows waiting to be signed,
+# rows per batch, bytes per read and seconds between two looks at an idle file
+INGEST_FILE = '../tictocSimulation/dataOutput/dataTxc15.txt'
+INGEST_QUEUE_SIZE = 10000
+INGEST_BATCH_SIZE = 500
+INGEST_READ_SIZE = 1 << 20
+INGEST_POLL_INTERVAL = 1
+
+# block production: a block is mined once BLOCK_TRIGGER_TRANSACTIONS open transactions or
+# BLOCK_TRIGGER_BYTES bytes are waiting, or the oldest one waited BLOCK_MAX_WAIT seconds.
+# A block holds at most MAX_BLOCK_TRANSACTIONS transactions / MAX_BLOCK_BYTES bytes,
+# the rest waits for the next block.
+BLOCK_PRODUCER = True
+BLOCK_TRIGGER_TRANSACTIONS = 100
+BLOCK_TRIGGER_BYTES = 64 * 1024
+BLOCK_MAX_WAIT = 10
+MAX_BLOCK_TRANSACTIONS = 500
+MAX_BLOCK_BYTES = 256 * 1024
+PRODUCER_INTERVAL = 0.5
@@ -0,0 +1,265 @@
+from collections import OrderedDict
+import random
+import threading
+import time
+
+from codec import dumps_block, dumps_transactions
+from config import BINARY_WIRE, GOSSIP_FANOUT, GOSSIP_INTERVAL, GOSSIP_SEEN_TTL, GOSSIP_SEEN_SIZE, GOSSIP_REQUEST_TTL
+from metrics import GOSSIP_ANNOUNCED, GOSSIP_SENT, GOSSIP_DUPLICATES
+from utility.hash_util import hash_block
+from utility.verification import Verification
+
+
+class SeenSet:
+    """
+        Hashes seen in the last `ttl` seconds, at most `size` of them
+
+        The hashes are kept in the order they were first seen, so the expired ones
+        are always at the front and are dropped there whenever a hash is added.
+
+        self.ttl:               seconds a hash is remembered
+        self.size:              most hashes remembered, the oldest go first
+    """
+
+    def __init__(self, ttl=GOSSIP_SEEN_TTL, size=GOSSIP_SEEN_SIZE):
+        self.ttl = ttl
+        self.size = size
+        self.__seen = OrderedDict()
+        self.__lock = threading.Lock()
+
+
+    def __len__(self):
+        return len(self.__seen)
+
+
+    def __contains__(self, key):
+        seen = self.__seen.get(key)
+        return seen is not None and time.monotonic() - seen < self.ttl
+
+
+    def add(self, key):
+        """ Remember the hash, True if it was not seen (or has expired) before """
+
+        now = time.monotonic()
+        with self.__lock:
+            while len(self.__seen) != 0:
+                oldest, seen = next(iter(self.__seen.items()))
+                if now - seen < self.ttl and len(self.__seen) < self.size:
+                    break
+                del self.__seen[oldest]
+            if key in self.__seen:
+                return False
+            self.__seen[key] = now
+            return True
+
+
+    def discard(self, key):
+        """ Forget the hash, if it is remembered """
+        with self.__lock:
+            self.__seen.pop(key, None)
+
+
+class Gossip:
+    """
+        Spreads new transactions and blocks through a random part of the peers
+
+        A node announces the hashes of what it got (POST /inventory) to `fanout` random
+        peers, each answers with the hashes it lacks, and only those items are sent:
+        the blocks to /broadcast-block, the transactions in one /broadcast-transactions
+        request per peer. A hash is asked for from one peer at a time, the peers which
+        announce it meanwhile are told it is not needed, unless it did not come within
+        GOSSIP_REQUEST_TTL seconds. A node relays every item it accepts the same way,
+        so an item reaches a connected network in O(log n) hops while a node uploads
+        to `fanout` peers instead of all of them, and the peers do not need to be a
+        full mesh. Items which arrive again are dropped on their hash before they are
+        verified. A block hash is only remembered once the transactions match the merkle
+        root of the header, and forgotten again when the block is refused (see rejected()),
+        so a copy with a valid header but a tampered body does not hide the real block.
+
+        Transactions are collected for `interval` seconds and announced together,
+        blocks at once. The announcements are sent by a background thread.
+
+        self.blockchain:        the local blockchain
+        self.fanout:            peers an item is announced to, all of them when None
+        self.interval:          seconds transactions wait to be announced together
+        self.seen:              hashes of the items announced or received recently
+        self.requested:         hashes asked for from a peer and not received yet (or just received)
+    """
+
+    def __init__(self, blockchain, fanout=GOSSIP_FANOUT, interval=GOSSIP_INTERVAL):
+        self.blockchain = blockchain
+        self.fanout = fanout
+        self.interval = interval
+        self.seen = SeenSet()
+        self.requested = SeenSet(GOSSIP_REQUEST_TTL)
+        self.__random = random.Random()
+        self.__pending = []
+        self.__condition = threading.Condition()
+        self.__thread = None
+
+
+    def first_seen(self, kind, key):
+        """ True the first time the hash comes, a duplicate is counted and gives False """
+
+        if self.seen.add(key):
+            return True
+        GOSSIP_DUPLICATES.labels(kind).inc()
+        return False
+
+
+    def new_block(self, block):
+        """ True if a block from a peer was not seen yet and its transactions match its header """
+
+        block_hash = hash_block(block)
+        if block_hash in self.seen:
+            GOSSIP_DUPLICATES.labels('block').inc()
+            return False
+        if not Verification.valid_merkle_root(block):
+            self.rejected(block_hash)
+            return False
+        return self.first_seen('block', block_hash)
+
+
+    def rejected(self, key):
+        """ Forget the hash of an item which was refused, the next peer which announces it is asked for it """
+        self.seen.discard(key)
+        self.requested.discard(key)
+
+
+    def announce_transaction(self, transaction, callback=None):
+        """ Announce a transaction to the peers, callback (if any) gets the status of every peer it was sent to """
+
+        tx_id = transaction.tx_id()
+        self.seen.add(tx_id)
+        self.__push(('transaction', tx_id, transaction, callback))
+
+
+    def announce_block(self, block, callback=None):
+        """ Announce a block to the peers, callback (if any) gets the status of every peer it was sent to """
+
+        block_hash = hash_block(block)
+        self.seen.add(block_hash)
+        self.__push(('block', block_hash, block, callback))
+
+
+    def mined(self, transactions):
+        """ Remember the transactions of a new block, copies relayed late are dropped instead of mined again """
+        for tx in transactions:
+            self.seen.add(tx.tx_id())
+
+
+    def wanted(self, inventory):
+        """ the part of an announced inventory which this node does not have, in the same format """
+
+        if not isinstance(inventory, dict):
+            return {'transactions': [], 'blocks': []}
+        # mined transactions are not looked up in the (on-disk) index, a relayed one is recent enough to be seen
+        transactions = [tx_id for tx_id in inventory.get('transactions', [])
+                        if isinstance(tx_id, str) and tx_id not in self.seen and not self.blockchain.is_open_transaction(tx_id)
+                        and self.requested.add(tx_id)]
+        blocks = [entry for entry in inventory.get('blocks', [])
+                  if isinstance(entry, dict) and entry.get('hash') not in self.seen and not self.__has_block(entry)
+                  and self.requested.add(entry.get('hash'))]
+        return {'transactions': transactions, 'blocks': blocks}
+
+
+    def peers(self):
+        """ the peers of the next announcement """
+
+        nodes = self.blockchain.get_peer_nodes()
+        if self.fanout is None or len(nodes) <= self.fanout:
+            return nodes
+        return self.__random.sample(nodes, self.fanout)
+
+
+    def pending(self):
+        return len(self.__pending)
+
+
+    def __has_block(self, entry):
+        try:
+            return hash_block(self.blockchain.get_block_header(entry['index'])) == entry['hash']
+        except (IndexError, KeyError, TypeError):
+            return False
+
+
+    def __push(self, item):
+        with self.__condition:
+            if self.__thread is None:
+                self.__thread = threading.Thread(target=self.__run, daemon=True)
+                self.__thread.start()
+            self.__pending.append(item)
+            self.__condition.notify()
+
+
+    def __run(self):
+        while True:
+            with self.__condition:
+                while len(self.__pending) == 0:
+                    self.__condition.wait()
+                # let more transactions come unless a block is waiting
+                deadline = time.monotonic() + self.interval
+                while not any(item[0] == 'block' for item in self.__pending) and time.monotonic() < deadline:
+                    self.__condition.wait(deadline - time.monotonic())
+                items, self.__pending = self.__pending, []
+            try:
+                self.__announce(items)
+            except Exception as e:
+                print('Gossip FAILED: {}'.format(e))
+
+
+    def __announce(self, items):
+        nodes = self.peers()
+        if len(nodes) == 0:
+            return
+        inventory = {
+            'transactions': [key for kind, key, _, _ in items if kind == 'transaction'],
+            'blocks': [{'hash': key, 'index': block.index} for kind, key, block, _ in items if kind == 'block']
+        }
+        for kind in ('transaction', 'block'):
+            GOSSIP_ANNOUNCED.labels(kind).inc(len(inventory[kind + 's']) * len(nodes))
+        answers = self.blockchain.broadcaster.ask(nodes, 'inventory', inventory)
+
+        wanted = {}
+        for node, answer in answers.items():
+            if isinstance(answer, dict):
+                keys = set(answer.get('transactions', []))
+                keys.update(entry.get('hash') for entry in answer.get('blocks', []) if isinstance(entry, dict))
+                wanted[node] = keys
+
+        # blocks one by one and right away, not behind the transactions waiting in the broadcast queue
+        for kind, key, block, callback in items:
+            targets = [node for node, keys in wanted.items() if key in keys]
+            if kind != 'block' or len(targets) == 0:
+                continue
+            GOSSIP_SENT.labels(kind).inc(len(targets))
+            data = dumps_block(block) if BINARY_WIRE else None
+            results = self.blockchain.broadcaster.broadcast(targets, 'broadcast-block', {'block': block.to_dict()}, data)
+            if callback is not None:
+                callback(results)
+
+        # the transactions in one request per peer, peers which want the same ones get the same request
+        groups = {}
+        for node, keys in wanted.items():
+            transactions = tuple((tx, callback) for kind, key, tx, callback in items if kind == 'transaction' and key in keys)
+            if len(transactions) != 0:
+                groups.setdefault(transactions, []).append(node)
+        for transactions, targets in groups.items():
+            GOSSIP_SENT.labels('transaction').inc(len(transactions) * len(targets))
+            callbacks = set(callback for _, callback in transactions if callback is not None)
+            transactions = [tx for tx, _ in transactions]
+            data = dumps_transactions(transactions) if BINARY_WIRE else None
+            self.blockchain.broadcaster.enqueue(targets, 'broadcast-transactions',
+                                                {'transactions': [tx.to_dict() for tx in transactions]},
+                                                self.__callbacks(callbacks), data)
+
+
+    @staticmethod
+    def __callbacks(callbacks):
+        if len(callbacks) == 0:
+            return None
+
+        def call(results):
+            for callback in callbacks:
+                callback(results)
+        return call
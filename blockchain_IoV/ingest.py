@@ -0,0 +1,172 @@
+import json
+import os
+import queue
+import threading
+
+from config import INGEST_QUEUE_SIZE, INGEST_BATCH_SIZE, INGEST_READ_SIZE, INGEST_POLL_INTERVAL
+
+
+class FileIngestor:
+    """
+        Background service which turns the rows of the simulation output into transactions
+
+        A reader thread tails the file by byte offset and puts every complete row into a
+        bounded queue, a submitter thread takes the rows in batches and hands them to
+        `submit`. The offset after the last submitted row is saved as a checkpoint, so
+        a restarted node goes on where it stopped. When the queue is empty after a batch,
+        `mine` (if given) is called, like /file-check used to mine after every chunk.
+
+        self.path:              file to read
+        self.checkpoint_path:   json file holding the offset of the next row to submit
+        self.submit:            function(rows) -> number of rows submitted, stops at the first failure
+        self.mine:              function() called after the rows read so far are submitted
+    """
+
+    def __init__(self, path, checkpoint_path, submit, mine=None):
+        self.path = path
+        self.checkpoint_path = checkpoint_path
+        self.submit = submit
+        self.mine = mine
+        self.offset = self.load_checkpoint()
+        self.read_offset = self.offset
+        self.rows_read = 0
+        self.rows_submitted = 0
+        self.last_error = None
+        self.__queue = queue.Queue(INGEST_QUEUE_SIZE)
+        self.__stop = threading.Event()
+        self.__threads = []
+
+
+    def running(self):
+        return any(thread.is_alive() for thread in self.__threads)
+
+
+    def start(self):
+        if self.running():
+            return False
+        self.__stop.clear()
+        self.__queue = queue.Queue(INGEST_QUEUE_SIZE)
+        self.read_offset = self.offset
+        self.last_error = None
+        self.__threads = [threading.Thread(target=self.__read, daemon=True),
+                          threading.Thread(target=self.__submit, daemon=True)]
+        for thread in self.__threads:
+            thread.start()
+        return True
+
+
+    def stop(self):
+        self.__stop.set()
+        for thread in self.__threads:
+            thread.join()
+        self.__threads = []
+
+
+    def status(self):
+        return {
+            'running': self.running(),
+            'file': self.path,
+            'offset': self.offset,
+            'read_offset': self.read_offset,
+            'queued': self.__queue.qsize(),
+            'rows_read': self.rows_read,
+            'rows_submitted': self.rows_submitted,
+            'last_error': self.last_error
+        }
+
+
+    def load_checkpoint(self):
+        try:
+            with open(self.checkpoint_path, mode='r') as f:
+                return json.load(f)['offset']
+        except (IOError, ValueError, KeyError):
+            return 0
+
+
+    def save_checkpoint(self):
+        tmp_path = self.checkpoint_path + '.tmp'
+        with open(tmp_path, mode='w') as f:
+            json.dump({'file': self.path, 'offset': self.offset}, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+
+    def __read(self):
+        """ Tail the file from self.read_offset, one complete row at a time """
+
+        partial = b''
+        while not self.__stop.is_set():
+            try:
+                if os.path.getsize(self.path) < self.read_offset:
+                    print('{} got shorter, reading it from the start'.format(self.path))
+                    self.read_offset = 0
+                    partial = b''
+                with open(self.path, mode='rb') as f:
+                    f.seek(self.read_offset + len(partial))
+                    data = f.read(INGEST_READ_SIZE)
+            except (IOError, OSError) as e:
+                self.last_error = str(e)
+                data = b''
+
+            if len(data) == 0:
+                self.__stop.wait(INGEST_POLL_INTERVAL)
+                continue
+
+            rows = (partial + data).split(b'\n')
+            # the last piece has no newline yet, read it again with the rest of its row
+            partial = rows.pop()
+            for row in rows:
+                self.read_offset += len(row) + 1
+                # same text as a row read in text mode, e.g. '1\n'
+                try:
+                    text = row.rstrip(b'\r').decode('utf8') + '\n'
+                except UnicodeDecodeError as e:
+                    # one broken row does not stop the ingestion
+                    self.last_error = 'Skipping the row ending at byte {} of {}: {}'.format(self.read_offset, self.path, e)
+                    print(self.last_error)
+                    continue
+                if not self.__put((text, self.read_offset)):
+                    return
+                self.rows_read += 1
+
+
+    def __put(self, item):
+        """ wait while the queue is full, give up when stopped """
+        while not self.__stop.is_set():
+            try:
+                self.__queue.put(item, timeout=INGEST_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+
+    def __submit(self):
+        while not self.__stop.is_set():
+            try:
+                batch = [self.__queue.get(timeout=INGEST_POLL_INTERVAL)]
+            except queue.Empty:
+                continue
+            while len(batch) < INGEST_BATCH_SIZE:
+                try:
+                    batch.append(self.__queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            submitted = self.submit([row for row, _ in batch])
+            if submitted > 0:
+                self.offset = batch[submitted - 1][1]
+                self.rows_submitted += submitted
+                self.save_checkpoint()
+            if submitted < len(batch):
+                # keep the checkpoint at the failed row, it is read again on the next start
+                self.last_error = 'Submitting row at offset {} FAILED'.format(self.offset)
+                print(self.last_error)
+                self.__stop.set()
+                return
+
+            if self.mine is not None and self.__queue.empty():
+                try:
+                    self.mine()
+                except Exception as e:
+                    self.last_error = 'Mining FAILED: {}'.format(e)
+                    print(self.last_error)
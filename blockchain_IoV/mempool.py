@@ -0,0 +1,265 @@
+from collections import OrderedDict, deque
+from itertools import islice
+import json
+import os
+import threading
+import time
+import uuid
+
+from tinydb import TinyDB
+
+from transaction import Transaction
+from utility.hash_util import hash_transaction
+
+
+class Mempool:
+    """
+        Open transactions waiting to be mined
+
+        Transactions are kept in memory, keyed by their id, so adding,
+        confirming and evicting one costs O(1). A transaction which is already
+        pending is not queued again. Every change is appended to a
+        journal (one json line per operation) for durability, the journal is
+        compacted once it holds far more lines than there are transactions.
+        A compacted journal starts with a 'base' line naming it, so a snapshot
+        (see snapshot()) can tell whether the journal it was taken from is still there.
+
+        self.path:              journal file
+        self.version:           changes every time a transaction is added or removed
+        self.bytes:             size of all the pending transactions
+        self.__entries:         entry number -> transaction, in arrival order
+        self.__arrivals:        entry number -> (size, arrival time)
+        self.__by_id:           transaction id -> entry numbers of that transaction
+    """
+
+    COMPACT_MIN_LINES = 1024
+
+    def __init__(self, path):
+        self.path = path
+        self.version = 0
+        self.bytes = 0
+        self.__entries = OrderedDict()
+        self.__arrivals = {}
+        self.__by_id = {}
+        self.__next_entry = 0
+        self.__journal = None
+        self.__journal_lines = 0
+        self.__base = None
+        self.__lock = threading.RLock()
+
+
+    def __len__(self):
+        return len(self.__entries)
+
+
+    def __contains__(self, tx_id):
+        return tx_id in self.__by_id
+
+
+    def transactions(self, start=0, end=None):
+        """ pending transactions [start, end) in arrival order """
+        if start == 0 and end is None:
+            return list(self.__entries.values())
+        return list(islice(self.__entries.values(), start, end))
+
+
+    def select(self, max_count, max_bytes):
+        """ the oldest transactions which fit into a block of max_count transactions / max_bytes bytes """
+
+        selected = []
+        size = 0
+        for entry, tx in self.__entries.items():
+            tx_size = self.__arrivals[entry][0]
+            if len(selected) >= max_count or (size + tx_size > max_bytes and len(selected) != 0):
+                break
+            selected.append(tx)
+            size += tx_size
+        return selected
+
+
+    def oldest_age(self):
+        """ seconds the oldest pending transaction has been waiting """
+
+        for entry in self.__entries:
+            return time.time() - self.__arrivals[entry][1]
+        return 0
+
+
+    def add(self, transaction):
+        """ Queue a transaction, False if the same one (same id, so same signature) is already pending """
+
+        with self.__lock:
+            if hash_transaction(transaction) in self.__by_id:
+                return False
+            self.__add(transaction)
+            self.__write({'op': 'add', 'tx': transaction.to_dict()})
+            return True
+
+
+    def confirm(self, transactions):
+        """
+            Remove one pending copy of every given transaction (e.g. the ones of a new block).
+            Returns the number of removed transactions.
+        """
+
+        removed = []
+        with self.__lock:
+            for tx in transactions:
+                tx_id = hash_transaction(tx)
+                if self.__remove(tx_id):
+                    removed.append(tx_id)
+            if len(removed) != 0:
+                self.__write_many([{'op': 'del', 'id': tx_id} for tx_id in removed])
+        return len(removed)
+
+
+    def evict(self, tx_id):
+        """ Drop every pending copy of a transaction """
+
+        count = 0
+        with self.__lock:
+            while self.__remove(tx_id):
+                count += 1
+            if count != 0:
+                self.__write_many([{'op': 'del', 'id': tx_id}] * count)
+        return count
+
+
+    def clear(self):
+        with self.__lock:
+            self.version += 1
+            self.bytes = 0
+            self.__arrivals.clear()
+            self.__entries.clear()
+            self.__by_id.clear()
+            self.compact()
+
+
+    def snapshot(self):
+        """ (journal name, journal size, pending transactions) at one point of the journal, see load() """
+
+        with self.__lock:
+            size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+            return self.__base, size, self.transactions()
+
+
+    def load(self, legacy_path=None, snapshot=None):
+        """
+            Replay the journal, or migrate the old TinyDB file once if there is no journal yet.
+            snapshot:   (journal name, journal size, transactions) taken by snapshot(), when the
+                        journal is still the same only the lines after it are replayed
+        """
+
+        self.__entries.clear()
+        self.__arrivals.clear()
+        self.__by_id.clear()
+        self.bytes = 0
+        if not os.path.exists(self.path):
+            if legacy_path is not None and os.path.exists(legacy_path):
+                for tx in TinyDB(legacy_path).all():
+                    self.__add(Transaction(tx['dataOwner'], tx['signature'], tx['hop_count']))
+            self.compact()
+            return
+
+        lines = 0
+        with open(self.path, mode='r') as f:
+            if snapshot is not None and snapshot[0] is not None:
+                base, offset, transactions = snapshot
+                first_line = f.readline()
+                if first_line == self.__base_line(base) and os.path.getsize(self.path) >= offset:
+                    self.__base = base
+                    for tx in transactions:
+                        self.__add(tx)
+                    lines = len(transactions)
+                    f.seek(offset)
+                else:
+                    f.seek(0)
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # torn last line after a crash
+                    print('Mempool journal has a broken line, ignoring it')
+                    break
+                if entry['op'] == 'add':
+                    tx = entry['tx']
+                    self.__add(Transaction(tx['dataOwner'], tx['signature'], tx['hop_count']))
+                elif entry['op'] == 'base':
+                    self.__base = entry['id']
+                else:
+                    self.__remove(entry['id'])
+                lines += 1
+        self.__journal_lines = lines
+        if lines > len(self.__entries) * 2 + self.COMPACT_MIN_LINES:
+            self.compact()
+
+
+    def compact(self):
+        """ Rewrite the journal so it only holds the pending transactions """
+
+        self.close()
+        tmp_path = self.path + '.tmp'
+        base = uuid.uuid4().hex
+        with open(tmp_path, mode='w') as f:
+            f.write(self.__base_line(base))
+            for tx in self.__entries.values():
+                f.write(json.dumps({'op': 'add', 'tx': tx.to_dict()}) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self.__base = base
+        self.__journal_lines = len(self.__entries)
+
+
+    def sync(self):
+        if self.__journal is not None:
+            os.fsync(self.__journal.fileno())
+
+
+    def close(self):
+        if self.__journal is not None:
+            self.__journal.close()
+            self.__journal = None
+
+
+    @staticmethod
+    def __base_line(base):
+        return json.dumps({'op': 'base', 'id': base}) + '\n'
+
+
+    def __add(self, transaction):
+        entry = self.__next_entry
+        self.__next_entry += 1
+        self.version += 1
+        self.__entries[entry] = transaction
+        size = transaction.size()
+        self.__arrivals[entry] = (size, time.time())
+        self.bytes += size
+        self.__by_id.setdefault(hash_transaction(transaction), deque()).append(entry)
+
+
+    def __remove(self, tx_id):
+        entries = self.__by_id.get(tx_id)
+        if not entries:
+            return False
+        entry = entries.popleft()
+        del self.__entries[entry]
+        self.bytes -= self.__arrivals.pop(entry)[0]
+        self.version += 1
+        if len(entries) == 0:
+            del self.__by_id[tx_id]
+        return True
+
+
+    def __write(self, entry):
+        self.__write_many([entry])
+
+
+    def __write_many(self, entries):
+        if self.__journal is None:
+            self.__journal = open(self.path, mode='a')
+        self.__journal.write(''.join(json.dumps(entry) + '\n' for entry in entries))
+        self.__journal.flush()
+        self.__journal_lines += len(entries)
+        if self.__journal_lines > len(self.__entries) * 2 + self.COMPACT_MIN_LINES:
+            self.compact()
@@ -0,0 +1,264 @@
+"""
+    Counters, gauges and latency histograms of a node, rendered in the Prometheus
+    text format by node.py at /metrics
+
+    Recording a value costs a lock and an addition (a bisect for histograms),
+    about a microsecond, so it is done on every call of the hot paths.
+"""
+from bisect import bisect_left
+from functools import wraps
+import threading
+import time
+
+
+# seconds, from a cached signature check up to a slow proof of work
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Metric:
+    """
+        One metric, and its children when it has labels (see labels())
+
+        self.name:              metric name
+        self.documentation:     HELP text
+        self.labelnames:        names of the labels, the values are given to labels()
+        self.kind:              Prometheus type
+    """
+
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self.__children = {}
+
+
+    def labels(self, *values):
+        """ the child metric of these label values, created the first time """
+
+        values = tuple(str(value) for value in values)
+        child = self.__children.get(values)
+        if child is None:
+            with self._lock:
+                child = self.__children.setdefault(values, self._child())
+        return child
+
+
+    def samples(self):
+        """ (name suffix, labels, value) of the metric, or of all its children """
+
+        if len(self.labelnames) == 0:
+            for suffix, labels, value in self._samples():
+                yield suffix, labels, value
+            return
+        for values, child in list(self.__children.items()):
+            for suffix, labels, value in child._samples():
+                yield suffix, tuple(zip(self.labelnames, values)) + labels, value
+
+
+    def _child(self):
+        return type(self)(self.name, self.documentation)
+
+
+    def _samples(self):
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.value = 0
+
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+    def _samples(self):
+        yield '', (), self.value
+
+
+class Gauge(Metric):
+    """ a value which goes up and down, or the result of a function read at every scrape """
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.value = 0
+        self.function = None
+
+
+    def set(self, value):
+        self.value = value
+
+
+    def set_function(self, function):
+        self.function = function
+
+
+    def _samples(self):
+        yield '', (), self.function() if self.function is not None else self.value
+
+
+class Histogram(Metric):
+    """ counts of the observed values per bucket (upper bounds), their sum and number """
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+
+    def _child(self):
+        return Histogram(self.name, self.documentation, buckets=self.buckets)
+
+
+    def observe(self, value):
+        slot = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[slot] += 1
+            self.sum += value
+            self.count += 1
+
+
+    def time(self):
+        """ context manager observing the seconds its block takes """
+        return _Timer(self)
+
+
+    def timed(self, function):
+        """ decorator observing the seconds every call of the function takes """
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.observe(time.perf_counter() - started)
+        return wrapper
+
+
+    def _samples(self):
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += bucket_count
+            yield '_bucket', (('le', '+Inf' if bound == float('inf') else repr(float(bound))),), cumulative
+        yield '_sum', (), total
+        yield '_count', (), count
+
+
+class _Timer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started)
+        return False
+
+
+class Registry:
+    """ The metrics of the process, in the order they were registered """
+
+    def __init__(self):
+        self.metrics = []
+
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+
+    def render(self):
+        """ every metric in the Prometheus text exposition format (version 0.0.4) """
+
+        lines = []
+        for metric in self.metrics:
+            lines.append('# HELP {} {}'.format(metric.name, metric.documentation))
+            lines.append('# TYPE {} {}'.format(metric.name, metric.kind))
+            for suffix, labels, value in metric.samples():
+                if len(labels) != 0:
+                    label_text = '{' + ','.join('{}="{}"'.format(name, escape(value)) for name, value in labels) + '}'
+                else:
+                    label_text = ''
+                lines.append('{}{}{} {}'.format(metric.name, suffix, label_text, format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if value == float('-inf'):
+        return '-Inf'
+    if value != value:
+        return 'NaN'
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+registry = Registry()
+
+# transactions and blocks
+TRANSACTIONS = registry.counter('iov_transactions_total', 'Transactions added to the open transactions', ['source'])
+TRANSACTION_REJECTIONS = registry.counter('iov_transaction_rejections_total', 'Transactions refused', ['reason'])
+BLOCKS = registry.counter('iov_blocks_total', 'Blocks added to the chain', ['source'])
+BLOCK_REJECTIONS = registry.counter('iov_block_rejections_total', 'Blocks from peers refused', ['reason'])
+CHAIN_REPLACEMENTS = registry.counter('iov_chain_replacements_total', 'Times the chain was replaced by a longer one')
+MINING_CANCELLED = registry.counter('iov_mining_cancelled_total', 'Proof of work searches given up because the tip moved')
+POW_ATTEMPTS = registry.counter('iov_pow_attempts_total', 'Proofs tried by the proof of work engine')
+
+# state
+CHAIN_HEIGHT = registry.gauge('iov_chain_height', 'Index of the last block')
+MEMPOOL_TRANSACTIONS = registry.gauge('iov_mempool_transactions', 'Open transactions waiting to be mined')
+MEMPOOL_BYTES = registry.gauge('iov_mempool_bytes', 'Size of the open transactions')
+WRITER_QUEUE = registry.gauge('iov_writer_queue', 'Commands waiting for the writer thread')
+BROADCAST_QUEUE = registry.gauge('iov_broadcast_queue', 'Broadcasts waiting to be sent')
+ARCHIVED_BLOCKS = registry.gauge('iov_archived_blocks', 'Blocks moved to the compressed archive')
+ARCHIVE_BYTES = registry.gauge('iov_archive_bytes', 'Size of the archive segments')
+
+# latencies
+ADD_TRANSACTION_SECONDS = registry.histogram('iov_add_transaction_seconds', 'add_transaction, signature check included')
+ADD_BLOCK_SECONDS = registry.histogram('iov_add_block_seconds', 'add_block of a block from a peer')
+MINE_BLOCK_SECONDS = registry.histogram('iov_mine_block_seconds', 'mine_block, proof of work included')
+PROOF_OF_WORK_SECONDS = registry.histogram('iov_proof_of_work_seconds', 'Proof of work search of one block')
+SAVE_DATA_SECONDS = registry.histogram('iov_save_data_seconds', 'Writing the chain / open transactions / peers')
+RESOLVE_SECONDS = registry.histogram('iov_resolve_seconds', 'Resolving conflicts with the peers')
+
+# peers and http
+BROADCAST_SECONDS = registry.histogram('iov_broadcast_seconds', 'Posting to one peer', ['peer', 'path'])
+BROADCAST_RESPONSES = registry.counter('iov_broadcast_responses_total', 'Answers of the peers to broadcasts', ['path', 'status'])
+GOSSIP_ANNOUNCED = registry.counter('iov_gossip_announced_total', 'Hashes announced to peers', ['kind'])
+GOSSIP_SENT = registry.counter('iov_gossip_sent_total', 'Items sent to the peers which asked for them', ['kind'])
+GOSSIP_DUPLICATES = registry.counter('iov_gossip_duplicates_total', 'Items from peers dropped as already seen', ['kind'])
+HTTP_RESPONSES = registry.counter('iov_http_responses_total', 'Responses of this node', ['route', 'status'])
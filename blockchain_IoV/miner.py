@@ -0,0 +1,195 @@
+import hashlib as hl
+import multiprocessing
+import os
+import threading
+import time
+
+from config import DIFFICULTY
+
+
+# in a worker process: for every search slot, the lowest chunk a proof was found in by the
+# search using the slot (see ProofOfWork.__get_pool)
+_found_chunks = None
+
+
+def _init_worker(found_chunks):
+    global _found_chunks
+    _found_chunks = found_chunks
+
+
+def proof_prefix(transactions, last_hash):
+    """ the part of Verification.valid_proof's guess (blocks without merkle root) that does not depend on the proof """
+    return (str([tx.to_ordered_dict() for tx in transactions]) + str(last_hash)).encode()
+
+
+def search(prefix, start, end, difficulty_bits, chunk=None, slot=0):
+    """
+        Look for the smallest proof in [start, end).
+        Returns (proof or None, number of tried proofs).
+
+        The prefix is hashed once, every try only adds the proof bytes to a copy of it.
+    """
+
+    base = hl.sha256(prefix)
+    shift = 256 - difficulty_bits
+    for proof in range(start, end):
+        h = base.copy()
+        h.update(str(proof).encode())
+        if int.from_bytes(h.digest(), 'big') >> shift == 0:
+            return proof, proof - start + 1
+        # stop when another worker already found a proof in an earlier chunk
+        if chunk is not None and proof & 0x3ff == 0 and _found_chunks[slot] < chunk:
+            return None, proof - start + 1
+    return None, end - start
+
+
+def _search_chunk(prefix, chunk, chunk_size, difficulty_bits, slot):
+    start = chunk * chunk_size
+    proof, tries = search(prefix, start, start + chunk_size, difficulty_bits, chunk, slot)
+    if proof is not None:
+        with _found_chunks.get_lock():
+            if chunk < _found_chunks[slot]:
+                _found_chunks[slot] = chunk
+    return chunk, proof, tries
+
+
+class ProofOfWork:
+    """
+        Mining engine, splits the proof space into chunks and searches them in a process pool
+
+        The first chunk is searched in the current process because at the default
+        difficulty a proof is almost always found there, which is cheaper than a
+        round trip through the pool. The smallest valid proof is always returned,
+        so the result is the same as the single-threaded `proof += 1` loop.
+
+        One engine (and its pool) is shared by every node of the process. Searches can
+        run at the same time, each one takes a slot of the pool's found chunks while it
+        runs, so a proof found by one search never stops the workers of another.
+
+        self.processes:         size of the process pool
+        self.chunk_size:        proofs per task
+        self.slots:             searches which can use the pool at the same time
+        self.attempts:          counter (with inc()) the tries of every search are added to, or None
+        self.tries:             proofs tried since the engine was created
+        self.elapsed:           seconds spent in find()
+    """
+
+    def __init__(self, processes=None, chunk_size=20000, slots=64, attempts=None):
+        self.processes = processes or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.slots = slots
+        self.attempts = attempts
+        self.tries = 0
+        self.elapsed = 0.0
+        self.__pool = None
+        self.__found_chunks = None
+        self.__free_slots = list(range(slots))
+        self.__lock = threading.Condition()
+
+
+    def find(self, prefix, difficulty_bits=DIFFICULTY, cancel=None):
+        """
+            smallest proof which gives sha256(prefix + str(proof)) difficulty_bits leading zero bits,
+            None when the `cancel` event is set before one is found (checked between chunks)
+        """
+
+        started = time.perf_counter()
+        proof, tries = search(prefix, 0, self.chunk_size, difficulty_bits)
+        try:
+            if proof is None and self.processes > 1:
+                proof, more = self.__find_parallel(prefix, difficulty_bits, cancel)
+                tries += more
+            elif proof is None:
+                chunk = 1
+                while proof is None:
+                    if cancel is not None and cancel.is_set():
+                        return None
+                    start = chunk * self.chunk_size
+                    proof, more = search(prefix, start, start + self.chunk_size, difficulty_bits)
+                    tries += more
+                    chunk += 1
+            return proof
+        finally:
+            with self.__lock:
+                self.tries += tries
+                self.elapsed += time.perf_counter() - started
+            if self.attempts is not None:
+                self.attempts.inc(tries)
+
+
+    def hash_rate(self):
+        """ hashes per second, for the whole engine and per core """
+
+        if self.elapsed == 0:
+            return 0.0, 0.0
+        rate = self.tries / self.elapsed
+        return rate, rate / self.processes
+
+
+    def close(self):
+        with self.__lock:
+            if self.__pool is not None:
+                self.__pool.terminate()
+                self.__pool = None
+
+
+    def __find_parallel(self, prefix, difficulty_bits, cancel=None):
+        """ (smallest proof or None when cancelled, number of tried proofs) """
+
+        pool, found_chunks, slot = self.__take_slot()
+        found_chunks[slot] = 2 ** 62
+        pending = {}
+        results = {}
+        tries = 0
+        next_chunk = 1
+        lowest = 1
+        best = None
+        try:
+            while True:
+                if cancel is not None and cancel.is_set():
+                    # the running chunks stop as if a proof had been found before them
+                    found_chunks[slot] = 0
+                    for result in pending.values():
+                        tries += result.get()[2]
+                    return None, tries
+
+                # keep every worker busy, but never schedule past a found proof
+                while len(pending) < self.processes * 2 and (best is None or next_chunk < best[0]):
+                    pending[next_chunk] = pool.apply_async(_search_chunk, (prefix, next_chunk, self.chunk_size, difficulty_bits, slot))
+                    next_chunk += 1
+
+                for chunk in list(pending):
+                    if pending[chunk].ready():
+                        _, proof, chunk_tries = pending.pop(chunk).get()
+                        tries += chunk_tries
+                        results[chunk] = proof
+                        if proof is not None and (best is None or chunk < best[0]):
+                            best = (chunk, proof)
+
+                # the proof is the smallest one when every earlier chunk came back empty
+                while lowest in results and results[lowest] is None:
+                    lowest += 1
+                if best is not None and lowest == best[0]:
+                    for result in pending.values():
+                        result.wait()
+                    for result in pending.values():
+                        tries += result.get()[2]
+                    return best[1], tries
+                if len(pending) != 0:
+                    next(iter(pending.values())).wait(0.001)
+        finally:
+            with self.__lock:
+                self.__free_slots.append(slot)
+                self.__lock.notify()
+
+
+    def __take_slot(self):
+        """ the pool (started on first use), its found chunks and a free slot of them, waits for one """
+
+        with self.__lock:
+            while len(self.__free_slots) == 0:
+                self.__lock.wait()
+            if self.__pool is None:
+                self.__found_chunks = multiprocessing.Array('q', [2 ** 62] * self.slots)
+                self.__pool = multiprocessing.Pool(self.processes, _init_worker, (self.__found_chunks,))
+            return self.__pool, self.__found_chunks, self.__free_slots.pop()
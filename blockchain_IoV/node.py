@@ -1,16 +1,31 @@
-from flask import Flask, jsonify, request, send_from_directory
+from flask import Flask, Response, jsonify, request, send_from_directory
 from flask_cors import CORS
-import time
-import datetime
-
+import json
+import uuid
+
+from block import Block
+from codec import MIMETYPE, Encoder, encode_frames, loads_block, loads_transaction, loads_transactions
+from config import MAX_HEADERS, MAX_BLOCKS, MAX_PAGE_TRANSACTIONS, INGEST_FILE, BLOCK_PRODUCER, PRUNE_KEEP_BLOCKS
+from ingest import FileIngestor
+from metrics import registry, HTTP_RESPONSES
+from profiler import SamplingProfiler
+from producer import BlockProducer
 from wallet import Wallet
 from blockchain import Blockchain
 
 app = Flask(__name__)
 CORS(app)
-read_from = 0
 port = -1
-loop_count = 0
+# part of every ETag, so they never match after a restart (the chain may have been cut meanwhile)
+instance = uuid.uuid4().hex[:8]
+profiler = SamplingProfiler()
+
+
+@app.after_request
+def count_response(response):
+    rule = request.url_rule.rule if request.url_rule is not None else 'unknown'
+    HTTP_RESPONSES.labels(rule, response.status_code).inc()
+    return response
 
 # ui 
 @app.route('/', methods=['GET'])
@@ -27,18 +42,172 @@ def get_network_ui():
 # transaction and chain
 @app.route('/transactions', methods=['GET'])
 def get_open_transaction():
-    transactions = blockchain.get_open_transactions()
-    dict_transactions = [tx.__dict__ for tx in transactions]
-    return jsonify(dict_transactions), 200
+    """ open transactions, paginated with ?cursor=&limit= and streamed (json array or ?format=ndjson) """
+    page = page_range(MAX_PAGE_TRANSACTIONS)
+    if page is None:
+        return invalid_limit()
+    start, end = page
+    tag = '{}-{}-{}-{}-{}'.format(instance, blockchain.head()['hash'], blockchain.open_transactions_version(), start, end)
+    transactions = blockchain.get_open_transactions(start, end)
+    items = (tx.to_dict() for tx in transactions)
+    return stream_items(items, tag, end if end is not None and len(transactions) == end - start else None)
 
 
 @app.route('/chain', methods=['GET'])
 def get_chain():
-    chain_snapshot = blockchain.chain
-    dict_chain = [block.__dict__.copy() for block in chain_snapshot]
-    for dict_block in dict_chain:
-        dict_block['transactions'] = [tx.__dict__ for tx in dict_block['transactions']]
-    return jsonify(dict_chain), 200
+    """ blocks, paginated with ?cursor=&limit= and streamed (json array, ?format=ndjson or binary) """
+    page = page_range(MAX_BLOCKS)
+    if page is None:
+        return invalid_limit()
+    start, end = page
+    height = blockchain.head()['height']
+    end = height + 1 if end is None else min(end, height + 1)
+    tag = '{}-{}-{}-{}'.format(instance, blockchain.head()['hash'], start, end)
+    # no cursor unless the page moved forward, a client following it always ends
+    next_cursor = end if start < end <= height else None
+    if wants_binary():
+        return stream_blocks(blockchain.iter_blocks(start, end), tag, next_cursor)
+    items = (block.to_dict() for block in blockchain.iter_blocks(start, end))
+    return stream_items(items, tag, next_cursor)
+
+
+def page_range(max_limit):
+    """ [cursor, cursor + limit) of the request, limit is optional and at most max_limit; None when it is below 1 """
+    start = max(0, request.args.get('cursor', 0, type=int))
+    limit = request.args.get('limit', type=int)
+    if limit is None:
+        return start, None
+    if limit < 1:
+        return None
+    return start, start + min(limit, max_limit)
+
+
+def invalid_limit():
+    response = {'message': 'limit must be at least 1.'}
+    return jsonify(response), 400
+
+
+def stream_items(items, tag, next_cursor):
+    """
+        Send the items as a chunked json array, or one json object per line for ?format=ndjson
+        (or Accept: application/x-ndjson), so only one item at a time is held in memory.
+        The ETag changes with the chain tip, an unchanged poll gets an empty 304.
+        X-Next-Cursor tells where the next page starts when there may be more items.
+    """
+
+    if request.if_none_match.contains(tag):
+        response = Response(status=304)
+        response.set_etag(tag)
+        return response
+
+    ndjson = request.args.get('format') == 'ndjson' or \
+        request.accept_mimetypes.best == 'application/x-ndjson'
+
+    def generate():
+        if ndjson:
+            for item in items:
+                yield json.dumps(item) + '\n'
+            return
+        yield '['
+        for count, item in enumerate(items):
+            yield (',' if count else '') + json.dumps(item)
+        yield ']'
+
+    response = Response(generate(), status=200,
+                        mimetype='application/x-ndjson' if ndjson else 'application/json')
+    response.set_etag(tag)
+    if next_cursor is not None:
+        response.headers['X-Next-Cursor'] = str(next_cursor)
+    return response
+
+
+def wants_binary():
+    """ the client asked for the binary encoding (json wins when both are equally accepted) """
+    return request.accept_mimetypes.best_match(['application/json', MIMETYPE]) == MIMETYPE
+
+
+def stream_blocks(blocks, tag, next_cursor):
+    """
+        Send the blocks in the binary encoding of codec.py, each one length-prefixed,
+        with one Encoder for the whole response so every dataOwner key is sent once.
+    """
+
+    tag += '-bin'
+    if request.if_none_match.contains(tag):
+        response = Response(status=304)
+        response.set_etag(tag)
+        return response
+
+    encoder = Encoder()
+    response = Response(encode_frames(encoder.encode_block(block) for block in blocks),
+                        status=200, mimetype=MIMETYPE)
+    response.vary.add('Accept')
+    response.set_etag(tag)
+    if next_cursor is not None:
+        response.headers['X-Next-Cursor'] = str(next_cursor)
+    return response
+
+
+
+@app.route('/chain/head', methods=['GET'])
+def get_chain_head():
+    return jsonify(blockchain.head()), 200
+
+
+@app.route('/headers', methods=['GET'])
+def get_headers():
+    start, end = block_range(MAX_HEADERS)
+    return jsonify(blockchain.get_headers(start, end)), 200
+
+
+@app.route('/blocks', methods=['GET'])
+def get_blocks():
+    start, end = block_range(MAX_BLOCKS)
+    if wants_binary():
+        encoder = Encoder()
+        data = b''.join(encode_frames(encoder.encode_block(block) for block in blockchain.iter_blocks(start, end)))
+        return Response(data, status=200, mimetype=MIMETYPE)
+    return jsonify(blockchain.get_blocks(start, end)), 200
+
+
+def block_range(limit):
+    """ [from, to) of the request, at most `limit` blocks """
+    start = max(0, request.args.get('from', 0, type=int))
+    end = request.args.get('to', start + limit, type=int)
+    return start, min(end, start + limit)
+
+
+
+@app.route('/proof/<tx_id>', methods=['GET'])
+def get_transaction_proof(tx_id):
+    """ merkle branch of a mined transaction, check it with utility.merkle.verify_inclusion """
+    proof = blockchain.get_transaction_proof(tx_id)
+    if proof is None:
+        response = {'message': 'Transaction not found in a block.'}
+        return jsonify(response), 404
+    return jsonify(proof), 200
+
+
+@app.route('/tx/<tx_id>', methods=['GET'])
+def get_transaction(tx_id):
+    transaction = blockchain.get_transaction(tx_id)
+    if transaction is None:
+        response = {'message': 'Transaction not found in a block.'}
+        return jsonify(response), 404
+    return jsonify(transaction), 200
+
+
+@app.route('/owner/<owner>/transactions', methods=['GET'])
+def get_owner_transactions(owner):
+    """ mined transactions of a dataOwner, paginated with ?cursor=&limit= (at most MAX_PAGE_TRANSACTIONS a page) """
+    page = page_range(MAX_PAGE_TRANSACTIONS)
+    if page is None:
+        return invalid_limit()
+    start, end = page
+    limit = MAX_PAGE_TRANSACTIONS if end is None else end - start
+    tag = '{}-{}-{}-{}'.format(instance, blockchain.head()['hash'], start, limit)
+    transactions, next_cursor = blockchain.get_owner_transactions(owner, start, limit)
+    return stream_items(iter(transactions), tag, next_cursor)
 
 
 
@@ -95,8 +264,8 @@ def get_nodes():
 def create_keys():
     wallet.create_keys()
     if wallet.save_keys():
-        global blockchain
-        blockchain = Blockchain(wallet.public_key, port)
+        # the loaded chain stays, only the key the blocks are mined with changes
+        blockchain.public_key = wallet.public_key
         response = {
             'message': 'Keys created successfully',
             'public_key': wallet.public_key,
@@ -113,8 +282,7 @@ def create_keys():
 @app.route('/wallet', methods=['GET'])
 def load_keys():
     if wallet.load_keys():
-        global blockchain
-        blockchain = Blockchain(wallet.public_key, port)
+        blockchain.public_key = wallet.public_key
         response = {
             'message': 'Keys loaded successfully',
             'public_key': wallet.public_key,
@@ -132,7 +300,13 @@ def load_keys():
 # broadcast
 @app.route('/broadcast-transaction', methods=['POST'])
 def broadcast_transaction():
-    values = request.get_json()
+    if request.mimetype == MIMETYPE:
+        try:
+            values = loads_transaction(request.get_data()).to_dict()
+        except (ValueError, IndexError):
+            values = None
+    else:
+        values = request.get_json()
 
     if not values:
         response = {'message': 'No data found.'}
@@ -164,26 +338,69 @@ def broadcast_transaction():
         return jsonify(response), 500
 
 
+@app.route('/broadcast-transactions', methods=['POST'])
+def broadcast_transactions():
+    """ transactions gossiped by a peer, in one request """
+    if request.mimetype == MIMETYPE:
+        try:
+            transactions = [tx.to_dict() for tx in loads_transactions(request.get_data())]
+        except (ValueError, IndexError):
+            transactions = None
+    else:
+        values = request.get_json()
+        transactions = values.get('transactions') if isinstance(values, dict) else None
+
+    required = ['dataOwner', 'signature', 'hop_count']
+    if not isinstance(transactions, list) or \
+            not all(isinstance(values, dict) and all(key in values for key in required) for values in transactions):
+        response = {'message': 'Some data is missing.'}
+        return jsonify(response), 400
+
+    added = sum(1 for values in transactions if blockchain.add_transaction(
+        values['dataOwner'], values['signature'], values['hop_count'], is_receiving=True))
+    if added == len(transactions):
+        response = {'message': 'Successfully added transactions.', 'added': added}
+        return jsonify(response), 201
+    response = {'message': 'Creating a transaction failed.', 'added': added}
+    return jsonify(response), 500
+
+
 @app.route('/broadcast-block', methods=['POST'])
 def broadcast_block():
-    values = request.get_json()
+    if request.mimetype == MIMETYPE:
+        try:
+            values = {'block': loads_block(request.get_data())}
+        except (ValueError, IndexError):
+            values = None
+    else:
+        values = request.get_json()
     if not values:
         response = {'message': 'No data found.'}
         return jsonify(response), 400
     if 'block' not in values:
         response = {'message': 'Some data is missing.'}
         return jsonify(response), 400
-    block = values['block']
-    if block['index'] == blockchain.chain[-1].index + 1:
+    try:
+        block = values['block'] if isinstance(values['block'], Block) else Block.from_dict(values['block'])
+    except (KeyError, TypeError):
+        response = {'message': 'Some data is missing.'}
+        return jsonify(response), 400
+    # relayed by several peers, only the first copy is looked at
+    if not blockchain.gossip.new_block(block):
+        response = {'message': 'Block already known.'}
+        return jsonify(response), 200
+    local_height = blockchain.head()['height']
+    if block.index == local_height + 1:
         if blockchain.add_block(block):
             response = {'message': 'Successflly added block'}
             return jsonify(response), 201
         else:
             response = {'message': 'Block seems invalid.'}
             return jsonify(response), 409
-    elif block['index'] > blockchain.chain[-1].index:
-        response = {'message': 'Blockchain seems to differ from local blockchain.'}
+    elif block.index > local_height:
+        response = {'message': 'Blockchain seems to differ from local blockchain, syncing.'}
         blockchain.resolve_conflicts = True
+        blockchain.sync.trigger()
         return jsonify(response), 200
     else: 
         response = {'message': 'Blockchain seems to be shorter, block not added'}
@@ -191,6 +408,16 @@ def broadcast_block():
 
 
 
+@app.route('/inventory', methods=['POST'])
+def inventory():
+    """ hashes of new transactions / blocks announced by a peer, answered with the ones this node lacks """
+    values = request.get_json()
+    if not values:
+        response = {'message': 'No data found.'}
+        return jsonify(response), 400
+    return jsonify(blockchain.gossip.wanted(values)), 200
+
+
 @app.route('/transaction', methods=['POST'])
 def add_transaction():
     if wallet.public_key == None:
@@ -236,6 +463,43 @@ def add_transaction():
         return jsonify(response), 500
 
 
+@app.route('/transactions/batch', methods=['POST'])
+def add_transactions():
+    if wallet.public_key == None:
+        response = {
+            'message': 'No wallet set up.'
+        }
+        return jsonify(response), 400
+
+    values = request.get_json()
+    if not values or not isinstance(values.get('hop_counts'), list):
+        response = {
+            'message': 'Required data is missing.'
+        }
+        return jsonify(response), 400
+
+    hop_counts = values['hop_counts']
+    added = add_txs_backend(hop_counts)
+    transactions = [{
+        'dataOwner': wallet.public_key,
+        'signature': signature,
+        'hop_count': hop_count
+    } for hop_count, signature in added]
+
+    if len(added) == len(hop_counts):
+        response = {
+            'message': 'Successfully added transactions.',
+            'transactions': transactions
+        }
+        return jsonify(response), 201
+    else:
+        response = {
+            'message': 'Creating a transaction failed.',
+            'transactions': transactions
+        }
+        return jsonify(response), 500
+
+
 @app.route('/mine', methods=['POST'])
 def mine():
     if blockchain.resolve_conflicts:
@@ -244,9 +508,7 @@ def mine():
     block = blockchain.mine_block()
 
     if block is not None:
-        dict_block = block.__dict__.copy()
-
-        dict_block['transactions'] = [tx.__dict__ for tx in dict_block['transactions']]
+        dict_block = block.to_dict()
 
         response = {
             'message': 'Block added successfully.',
@@ -261,6 +523,23 @@ def mine():
         return jsonify(response), 500
 
 
+@app.route('/producer', methods=['GET'])
+def get_producer_status():
+    return jsonify(producer.status()), 200
+
+
+@app.route('/producer/start', methods=['POST'])
+def start_producer():
+    producer.start()
+    return jsonify(producer.status()), 200
+
+
+@app.route('/producer/stop', methods=['POST'])
+def stop_producer():
+    producer.stop()
+    return jsonify(producer.status()), 200
+
+
 @app.route('/resolve-conflicts', methods=['POST'])
 def resolve_conflicts():
     replaced = blockchain.resolve()
@@ -272,54 +551,100 @@ def resolve_conflicts():
 
 
 
+# instrumentation
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """ counters, gauges and latency histograms in the Prometheus text format """
+    return Response(registry.render(), status=200, mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/profiler', methods=['GET'])
+def get_profiler_status():
+    return jsonify(profiler.status()), 200
+
+
+@app.route('/profiler/start', methods=['POST'])
+def start_profiler():
+    """ sample the stacks of every thread every ?interval= seconds until /profiler/stop """
+    profiler.start(request.args.get('interval', type=float))
+    return jsonify(profiler.status()), 200
+
+
+@app.route('/profiler/stop', methods=['POST'])
+def stop_profiler():
+    profiler.stop()
+    return jsonify(profiler.status()), 200
+
+
+@app.route('/profiler/stacks', methods=['GET'])
+def get_profiler_stacks():
+    """ the most seen stacks (?limit=) in the collapsed format of flamegraph.pl """
+    return Response(profiler.report(request.args.get('limit', type=int)), status=200, mimetype='text/plain')
+
+
+
 # local file check
 @app.route('/file-check', methods=['POST'])
 def timed_check():
-    global read_from, port, loop_count
-    print('port is ', port)
-    file_directory = "../tictocSimulation/dataOutput/dataTxc15.txt"
+    """ kept for the ui: starts the ingestion service instead of polling the file in this request """
+    if wallet.public_key == None:
+        response = {'message': 'No wallet set up.'}
+        return jsonify(response), 400
+    ingestor.start()
+    response = {
+        'message': 'Successfully get checked',
+        'status': ingestor.status()
+    }
+    return jsonify(response), 200
 
-    while loop_count <= 100:
-        try:
-            with open(file_directory, mode='r') as f:
-                file_content = f.readlines()[read_from:]
-                read_from += len(file_content)
-                print('Pointer is at: ', read_from)
-
-                if len(file_content) != 0:
-                    for row in file_content:
-                        print('looping ... ', datetime.datetime.now(), ' ...')
-                        if add_tx_backend(row):
-                            print('Successfully added tx from backend at ', datetime.datetime.now())
-                        else:
-                            print('Error occurred in add_tx_backend')
-                            break
-                    print('Out of loop')
-                    mine_backend()
-                    print('======= MINED A BLOCK SUCCESSFULLY =======')
-                    print('======= ', datetime.datetime.now(), ' =======')
-        except (IOError, IndexError):
-            print("An error occurred during time_check !!")
-            return False
-
-        time.sleep(1) 
-        loop_count += 1
-        print('IT\'S LOOP ', loop_count, 'RN')
-    
+
+@app.route('/ingest/start', methods=['POST'])
+def start_ingest():
+    if wallet.public_key == None:
+        response = {'message': 'No wallet set up.'}
+        return jsonify(response), 400
+    started = ingestor.start()
     response = {
-        'message': 'Successfully get checked'
+        'message': 'Ingestion started.' if started else 'Ingestion is already running.',
+        'status': ingestor.status()
     }
     return jsonify(response), 200
 
 
-def add_tx_backend(hop_count):
-    if wallet.public_key == None or hop_count == None:
-        return False
-    signature = wallet.sign_transaction(wallet.public_key, hop_count)
-    success = blockchain.add_transaction(wallet.public_key, signature, hop_count)
-    if success:
-        return True
-    return False
+@app.route('/ingest/stop', methods=['POST'])
+def stop_ingest():
+    ingestor.stop()
+    response = {
+        'message': 'Ingestion stopped.',
+        'status': ingestor.status()
+    }
+    return jsonify(response), 200
+
+
+@app.route('/ingest/status', methods=['GET'])
+def get_ingest_status():
+    return jsonify(ingestor.status()), 200
+
+
+def submit_rows(rows):
+    """ add the rows as transactions, returns how many were added before the first failure """
+    added = add_txs_backend(rows)
+    if len(added) != len(rows):
+        print('Error occurred in add_txs_backend')
+    return len(added)
+
+
+def add_txs_backend(hop_counts):
+    """ sign the hop counts as one batch, returns (hop_count, signature) of the added ones up to the first failure """
+    if wallet.public_key == None or any(hop_count == None for hop_count in hop_counts):
+        return []
+    signatures = wallet.sign_many(hop_counts)
+    added = []
+    for hop_count, signature in zip(hop_counts, signatures):
+        if not blockchain.add_transaction(wallet.public_key, signature, hop_count):
+            break
+        added.append((hop_count, signature))
+    return added
 
 
 def mine_backend():
@@ -333,9 +658,17 @@ if __name__ == '__main__':
     from argparse import ArgumentParser
     parser = ArgumentParser()
     parser.add_argument('-p', '--port', type=int, default=5000)
+    parser.add_argument('--prune', type=int, default=PRUNE_KEEP_BLOCKS, help='full blocks kept, the older ones are archived')
     args = parser.parse_args()
     port = args.port
     wallet = Wallet(port)
-    blockchain = Blockchain(wallet.public_key, port)
-    app.run(host='0.0.0.0', port=port)
+    blockchain = Blockchain(wallet.public_key, port, args.prune)
+    producer = BlockProducer(lambda: blockchain)
+    # with the block producer on, it decides when the ingested rows are mined
+    ingestor = FileIngestor(INGEST_FILE, './db/ingest-{}.json'.format(port), submit_rows,
+                            None if BLOCK_PRODUCER else mine_backend)
+    if BLOCK_PRODUCER:
+        producer.start()
+    # requests are served by concurrent threads, the blockchain serializes the changes itself
+    app.run(host='0.0.0.0', port=port, threaded=True)
 
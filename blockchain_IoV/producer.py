@@ -0,0 +1,89 @@
+import threading
+
+from config import BLOCK_TRIGGER_TRANSACTIONS, BLOCK_TRIGGER_BYTES, BLOCK_MAX_WAIT, PRODUCER_INTERVAL, \
+    MAX_BLOCK_TRANSACTIONS, MAX_BLOCK_BYTES
+
+
+class BlockProducer:
+    """
+        Mines blocks automatically
+
+        A block is mined as soon as one of these is reached:
+            - BLOCK_TRIGGER_TRANSACTIONS open transactions
+            - BLOCK_TRIGGER_BYTES bytes of open transactions
+            - the oldest open transaction waited BLOCK_MAX_WAIT seconds
+        Blocks are capped at MAX_BLOCK_TRANSACTIONS / MAX_BLOCK_BYTES (see Blockchain.mine_block),
+        what does not fit stays open for the next block.
+
+        self.get_blockchain:    function returning the current blockchain of the node
+        self.blocks:            blocks mined by the producer
+    """
+
+    def __init__(self, get_blockchain):
+        self.get_blockchain = get_blockchain
+        self.blocks = 0
+        self.last_error = None
+        self.__stop = threading.Event()
+        self.__thread = None
+
+
+    def running(self):
+        return self.__thread is not None and self.__thread.is_alive()
+
+
+    def start(self):
+        if self.running():
+            return False
+        self.__stop.clear()
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+        return True
+
+
+    def stop(self):
+        self.__stop.set()
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+
+
+    def due(self, blockchain):
+        """ True when the open transactions of the blockchain should be mined now """
+
+        count, size, age = blockchain.open_transactions_stats()
+        if count == 0:
+            return False
+        return count >= BLOCK_TRIGGER_TRANSACTIONS or size >= BLOCK_TRIGGER_BYTES or age >= BLOCK_MAX_WAIT
+
+
+    def status(self):
+        return {
+            'running': self.running(),
+            'blocks': self.blocks,
+            'last_error': self.last_error,
+            'policy': {
+                'trigger_transactions': BLOCK_TRIGGER_TRANSACTIONS,
+                'trigger_bytes': BLOCK_TRIGGER_BYTES,
+                'max_wait': BLOCK_MAX_WAIT,
+                'max_block_transactions': MAX_BLOCK_TRANSACTIONS,
+                'max_block_bytes': MAX_BLOCK_BYTES
+            }
+        }
+
+
+    def __run(self):
+        while not self.__stop.wait(PRODUCER_INTERVAL):
+            blockchain = self.get_blockchain()
+            # a node which is behind mines on the wrong tip
+            if blockchain is None or blockchain.public_key is None or blockchain.resolve_conflicts:
+                continue
+            # keep mining while full blocks are waiting
+            while not self.__stop.is_set() and self.due(blockchain):
+                try:
+                    block = blockchain.mine_block()
+                except Exception as e:
+                    block = None
+                    self.last_error = str(e)
+                if block is None:
+                    break
+                self.blocks += 1
@@ -0,0 +1,95 @@
+from collections import Counter
+import sys
+import threading
+import time
+
+from config import PROFILER_INTERVAL, PROFILER_MAX_DEPTH
+
+
+class SamplingProfiler:
+    """
+        Samples the stacks of every thread of the process while it runs
+
+        A background thread looks at sys._current_frames() every `interval` seconds
+        and counts each stack it sees, so the threads being profiled are not slowed
+        down by tracing, and nothing at all runs while the profiler is stopped.
+        report() gives the stacks in the collapsed format of flamegraph.pl
+        ("outer;inner;innermost count" per line).
+
+        self.interval:          seconds between two samples
+        self.samples:           number of samples taken since the last start()
+        self.__stacks:          stack (tuple of 'file:function') -> times it was seen
+    """
+
+    def __init__(self):
+        self.interval = PROFILER_INTERVAL
+        self.samples = 0
+        self.started = None
+        self.__stacks = Counter()
+        self.__stop = threading.Event()
+        self.__thread = None
+        self.__lock = threading.Lock()
+
+
+    def running(self):
+        return self.__thread is not None and self.__thread.is_alive()
+
+
+    def start(self, interval=None):
+        """ Start sampling again from zero, False if it is already running """
+
+        if self.running():
+            return False
+        self.interval = interval or PROFILER_INTERVAL
+        with self.__lock:
+            self.__stacks = Counter()
+            self.samples = 0
+        self.started = time.time()
+        self.__stop.clear()
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+        return True
+
+
+    def stop(self):
+        self.__stop.set()
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+
+
+    def status(self):
+        return {
+            'running': self.running(),
+            'interval': self.interval,
+            'samples': self.samples,
+            'started': self.started
+        }
+
+
+    def report(self, limit=None):
+        """ the most seen stacks in the collapsed format, one per line """
+
+        with self.__lock:
+            stacks = self.__stacks.most_common(limit)
+        return ''.join('{} {}\n'.format(';'.join(stack), count) for stack, count in stacks)
+
+
+    def __run(self):
+        own_id = threading.get_ident()
+        while not self.__stop.wait(self.interval):
+            frames = sys._current_frames()
+            stacks = []
+            for thread_id, frame in frames.items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < PROFILER_MAX_DEPTH:
+                    code = frame.f_code
+                    stack.append('{}:{}'.format(code.co_filename.rsplit('/', 1)[-1], code.co_name))
+                    frame = frame.f_back
+                stacks.append(tuple(reversed(stack)))
+            del frames
+            with self.__lock:
+                self.__stacks.update(stacks)
+                self.samples += 1
@@ -0,0 +1,101 @@
+import json
+import mmap
+import os
+import struct
+import time
+
+from utility.binary import encode_transactions, decode_transactions
+
+
+class Snapshot:
+    """
+        State of a node at one height of its block log, so a restart only reads
+        the blocks stored after it
+
+        The file has a fixed layout, it is memory-mapped and its parts are sliced out
+        without parsing:
+
+            header:         magic, height, index of the first block in the log, block log
+                            size, time, tip hash (32 bytes), mempool journal name (16 bytes)
+                            and size, bytes of the mempool and peers parts, work of the
+                            chain up to the height (32 bytes, big-endian)
+            mempool:        pending transactions (utility.binary.encode_transactions)
+            peers:          json list of the peer nodes
+
+        The offsets of the blocks are not part of it, the block log keeps them in its
+        index file (see BlockLog), so the size of a snapshot does not grow with the chain.
+
+        The file is written to a temporary file first and then renamed, so a crash
+        leaves the previous snapshot in place.
+
+        self.path:              file of the snapshot
+        self.height:            number of blocks of the last snapshot written or loaded
+    """
+
+    MAGIC = b'IOVSNAP3'
+    HEADER = struct.Struct('<8sQQQd32s16sQQQ32s')
+
+    def __init__(self, path):
+        self.path = path
+        self.height = 0
+
+
+    def write(self, tip_hash, height, log_size, mempool, peers, log_base=0, work=0):
+        """
+            tip_hash:       hash of the last block in the log
+            height:         index after the last block in the log
+            log_size:       bytes of the block log
+            log_base:       index of the first block in the log
+            work:           work of the blocks up to the last one in the log (see utility.difficulty.chain_work)
+            mempool:        (journal name, journal size, transactions) of Mempool.snapshot()
+            peers:          peer nodes
+        """
+
+        base, journal_size, transactions = mempool
+        mempool_data = encode_transactions(transactions)
+        peers_data = json.dumps(sorted(peers)).encode()
+        header = self.HEADER.pack(self.MAGIC, height, log_base, log_size, time.time(), bytes.fromhex(tip_hash),
+                                  bytes.fromhex(base) if base is not None else bytes(16), journal_size,
+                                  len(mempool_data), len(peers_data), work.to_bytes(32, 'big'))
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, mode='wb') as f:
+            f.write(header)
+            f.write(mempool_data)
+            f.write(peers_data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self.height = height
+
+
+    def load(self):
+        """
+            The snapshot as a dictionary (height, log_base, log_size, created, tip_hash,
+            mempool, peers, work), None when there is no usable one
+        """
+
+        if not os.path.exists(self.path) or os.path.getsize(self.path) < self.HEADER.size:
+            return None
+        with open(self.path, mode='rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                magic, height, log_base, log_size, created, tip_hash, base, journal_size, mempool_size, peers_size, \
+                    work = self.HEADER.unpack_from(data, 0)
+                mempool_start = self.HEADER.size
+                peers_start = mempool_start + mempool_size
+                if magic != self.MAGIC or height < log_base or peers_start + peers_size != len(data):
+                    print('Snapshot {} is broken, ignoring it'.format(self.path))
+                    return None
+                transactions = decode_transactions(data[mempool_start:peers_start])
+                peers = json.loads(data[peers_start:].decode())
+
+        self.height = height
+        return {
+            'height': height,
+            'log_base': log_base,
+            'log_size': log_size,
+            'created': created,
+            'tip_hash': tip_hash.hex(),
+            'mempool': (base.hex() if any(base) else None, journal_size, transactions),
+            'peers': peers,
+            'work': int.from_bytes(work, 'big')
+        }
@@ -0,0 +1,157 @@
+class StoredChain:
+    """
+        The blockchain as a list whose stored blocks are read from the block log the first
+        time they are used, so opening a chain does not read its blocks.
+
+        Blocks appended to it live in memory until they are written to the log, a block
+        read from the log is kept (header and encoded transactions, see Block).
+        Blocks are only appended, a fork is a new StoredChain (see fork()) so whoever still
+        reads the old one keeps seeing the blocks it had: the old chain keeps the view of the
+        block log it had at the fork (see BlockLogView), which keeps the records the log
+        cuts for the new one.
+
+        With `keep` set only the last `keep` blocks are kept whole, the blocks before
+        `pruned` keep their header (see prune()); their transactions are read from the
+        block log, or from the archive for the blocks before block_log.base, every time
+        the block is used. header() gives a block without reading its transactions.
+
+        self.block_log:         log holding the blocks [block_log.base, block_log.count)
+        self.archive:           archive holding the blocks before block_log.base (see archive.py)
+        self.keep:              blocks kept whole below the tip, all of them when None
+        self.pruned:            blocks before it only keep their header
+        self.__blocks:          block, header-only block or None (not read yet) for every index
+        self.__log:             view of the log the blocks are read from once the chain was forked,
+                                the current view of block_log before
+    """
+
+    def __init__(self, block_log, blocks=None, archive=None, keep=None):
+        self.block_log = block_log
+        self.archive = archive
+        self.keep = keep
+        self.pruned = 0
+        self.__blocks = list(blocks) if blocks is not None else [None] * block_log.count
+        self.__log = None
+
+
+    def __len__(self):
+        return len(self.__blocks)
+
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self[index] for index in range(*key.indices(len(self)))]
+        block = self.__blocks[key]
+        if block is None or block.is_header():
+            if key < 0:
+                key += len(self.__blocks)
+            block = self.__read(key)
+        return block
+
+
+    def header(self, key):
+        """ the block, or only its header when it is pruned, without reading archived transactions """
+
+        block = self.__blocks[key]
+        if block is not None:
+            return block
+        if key < 0:
+            key += len(self.__blocks)
+        log = self.__log_view()
+        if key >= log.base:
+            return self.__read(key, log)
+        # the headers of a whole archive segment come together
+        first, headers = self.archive.headers(key)
+        for index, header in enumerate(headers, first):
+            if self.__blocks[index] is None:
+                self.__blocks[index] = header
+        return self.__blocks[key]
+
+
+    def headers(self, length=None):
+        """ the first `length` blocks as a list of headers (see header()), nothing is copied """
+        return ChainView(self, len(self) if length is None else length, headers=True)
+
+
+    def prune(self):
+        """ Keep only the header of the blocks below the last `keep` ones, they must be stored already """
+
+        if self.keep is None:
+            return
+        end = min(len(self.__blocks) - self.keep, self.block_log.count)
+        for index in range(self.pruned, end):
+            block = self.__blocks[index]
+            if block is not None and not block.is_header():
+                self.__blocks[index] = block.header_only()
+        self.pruned = max(self.pruned, end)
+
+
+    def __log_view(self):
+        return self.__log if self.__log is not None else self.block_log.view()
+
+
+    def __read(self, index, log=None):
+        if log is None:
+            log = self.__log_view()
+        if index < log.base:
+            block = self.archive.read(index)
+        else:
+            block = log.read(index)
+        block.compact()
+        self.__blocks[index] = block if index >= self.pruned else block.header_only()
+        return block
+
+
+    def fork(self, length, blocks):
+        """
+            a new chain of the first `length` blocks of this one followed by `blocks`,
+            called before the block log is cut back: this chain keeps reading the log as it is now
+        """
+
+        self.__log = self.__log_view()
+        chain = StoredChain(self.block_log, self.__blocks[:length] + list(blocks), self.archive, self.keep)
+        chain.pruned = min(self.pruned, length)
+        return chain
+
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+
+    def append(self, block):
+        self.__blocks.append(block)
+
+
+    def extend(self, blocks):
+        self.__blocks.extend(blocks)
+
+
+class ChainView:
+    """
+        The first `length` blocks of a StoredChain as a read-only list, without copying it;
+        with `headers` the pruned blocks are only their header (see StoredChain.header)
+    """
+
+    def __init__(self, chain, length, headers=False):
+        self.chain = chain
+        self.length = length
+        self.headers = headers
+
+
+    def __len__(self):
+        return self.length
+
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self[index] for index in range(*key.indices(self.length))]
+        if key < 0:
+            key += self.length
+        if not 0 <= key < self.length:
+            raise IndexError('block index out of range')
+        return self.chain.header(key) if self.headers else self.chain[key]
+
+
+    def __iter__(self):
+        for index in range(self.length):
+            yield self[index]
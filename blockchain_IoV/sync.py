@@ -0,0 +1,178 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+import requests
+
+from block import Block
+from codec import MIMETYPE, Decoder, iter_frames
+from config import SYNC_BATCH_SIZE, SYNC_PIPELINE, BINARY_WIRE
+from utility.hash_util import hash_block
+from utility.verification import Verification
+
+
+class ForkView:
+    """
+        The local chain up to `fork` followed by new blocks, looks like a list to Verification
+        without copying the local part. Only the headers of the local blocks are used.
+    """
+
+    def __init__(self, blockchain, fork, blocks):
+        self.blockchain = blockchain
+        self.fork = fork
+        self.blocks = blocks
+
+
+    def __len__(self):
+        return self.fork + len(self.blocks)
+
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self[index] for index in range(*key.indices(len(self)))]
+        if key < 0:
+            key += len(self)
+        if key < self.fork:
+            return self.blockchain.get_block_header(key)
+        return self.blocks[key - self.fork]
+
+
+class ChainSync:
+    """
+        Headers-first catch up with the peer nodes
+
+        The fork point with a peer is found by binary search over its block headers
+        (/headers), then only the missing blocks are downloaded (/blocks) in batches
+        of SYNC_BATCH_SIZE with SYNC_PIPELINE requests in flight, and verified in order.
+        A node N blocks behind needs O(log n) header requests and O(N) block downloads.
+
+        self.blockchain:        the local blockchain
+    """
+
+    def __init__(self, blockchain):
+        self.blockchain = blockchain
+        self.__running = threading.Lock()
+
+
+    def candidates(self):
+        """ (node, head) of the peers whose chain has more work, most work first """
+
+        local_work = self.blockchain.head()['work']
+        heads = self.blockchain.broadcaster.query(self.blockchain.get_peer_nodes(), 'chain/head')
+        candidates = [(node, head) for node, head in heads.items()
+                      if isinstance(head, dict) and isinstance(head.get('work'), int) and head['work'] > local_work
+                      and isinstance(head.get('height'), int)]
+        return sorted(candidates, key=lambda candidate: candidate[1]['work'], reverse=True)
+
+
+    def sync(self):
+        """ Catch up with the peer with the most work, returns True if blocks were added """
+
+        for node, head in self.candidates():
+            result = self.fetch(node, head)
+            if result is not None:
+                added = self.blockchain.replace_chain(*result)
+                if added:
+                    self.blockchain.resolve_conflicts = False
+                return added
+        return False
+
+
+    def trigger(self):
+        """ Sync in a background thread, unless a sync is already running """
+
+        if not self.__running.acquire(blocking=False):
+            return False
+
+        def run():
+            try:
+                self.sync()
+            except Exception as e:
+                print('Chain sync FAILED: {}'.format(e))
+            finally:
+                self.__running.release()
+
+        threading.Thread(target=run, daemon=True).start()
+        return True
+
+
+    def fetch(self, node, head):
+        """
+            Download and verify the blocks of `node` after the fork point.
+            Returns (fork, new blocks), or None if the node does not serve a valid chain.
+        """
+
+        try:
+            fork = self.find_fork(node, head['height'])
+            # the archived blocks are final
+            if fork is None or fork < self.blockchain.archived_blocks():
+                return None
+            blocks = []
+            view = ForkView(self.blockchain, fork, blocks)
+            for batch in self.__fetch_batches(node, fork, head['height'] + 1):
+                for block in batch:
+                    if block.index != len(view):
+                        return None
+                    blocks.append(block)
+                    if not Verification.verify_block(view, block.index):
+                        return None
+            if len(blocks) == 0:
+                return None
+            return fork, blocks
+        except (requests.exceptions.RequestException, ValueError, KeyError, IndexError, TypeError):
+            print('Error occurred when syncing with {}'.format(node))
+            return None
+
+
+    def find_fork(self, node, node_height):
+        """ Index of the first block of `node` which is not in the local chain, None if it cannot tell """
+
+        # the genesis block is always shared
+        low = 0
+        high = min(self.blockchain.head()['height'], node_height)
+        while low < high:
+            middle = (low + high + 1) // 2
+            headers = self.__get(node, 'headers', middle, middle + 1)
+            if len(headers) != 1:
+                return None
+            if headers[0]['hash'] == hash_block(self.blockchain.get_block_header(middle)):
+                low = middle
+            else:
+                high = middle - 1
+        return low + 1
+
+
+    def __fetch_batches(self, node, start, end):
+        """ Yield the blocks [start, end) batch by batch, keeping SYNC_PIPELINE requests in flight """
+
+        ranges = [(index, min(index + SYNC_BATCH_SIZE, end)) for index in range(start, end, SYNC_BATCH_SIZE)]
+        with ThreadPoolExecutor(SYNC_PIPELINE) as executor:
+            futures = [executor.submit(self.__get_blocks, node, first, last) for first, last in ranges[:SYNC_PIPELINE]]
+            for position in range(len(ranges)):
+                if position + SYNC_PIPELINE < len(ranges):
+                    first, last = ranges[position + SYNC_PIPELINE]
+                    futures.append(executor.submit(self.__get_blocks, node, first, last))
+                yield futures[position].result()
+
+
+    def __get_blocks(self, node, start, end):
+        """ the blocks [start, end) of the node, in the binary encoding when the node serves it """
+
+        response = self.__request(node, 'blocks', start, end, binary=BINARY_WIRE)
+        if response.headers.get('Content-Type', '').startswith(MIMETYPE):
+            decoder = Decoder()
+            return [decoder.decode_block(message) for message in iter_frames([response.content])]
+        return [Block.from_dict(block) for block in response.json()]
+
+
+    def __get(self, node, path, start, end):
+        return self.__request(node, path, start, end).json()
+
+
+    def __request(self, node, path, start, end, binary=False):
+        broadcaster = self.blockchain.broadcaster
+        url = 'http://{}/{}'.format(node, path)
+        headers = {'Accept': '{}, application/json;q=0.5'.format(MIMETYPE)} if binary else None
+        response = broadcaster.session.get(url, params={'from': start, 'to': end}, headers=headers,
+                                           timeout=broadcaster.timeout)
+        response.raise_for_status()
+        return response
@@ -0,0 +1,15 @@
+import os
+import sys
+
+import pytest
+
+# the modules of the node are imported flat, as node.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def node_dir(tmp_path, monkeypatch):
+    """ run the test in an empty directory with the ./db folder of a node """
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'db').mkdir()
+    return tmp_path
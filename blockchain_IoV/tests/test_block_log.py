@@ -0,0 +1,82 @@
+import os
+
+from block import Block
+from block_log import BlockLog
+from transaction import Transaction
+
+
+def make_block(index, tag='a'):
+    transactions = [Transaction('owner-{}-{}'.format(tag, i), 'signature-{}'.format(i), str(i)) for i in range(3)]
+    return Block(index, 'hash-{}-{}'.format(tag, index - 1), transactions, index, float(index))
+
+
+def test_truncate_cuts_the_file_in_place(node_dir):
+    log = BlockLog('./db/blocklog.bin')
+    log.open()
+    log.append_many([make_block(index) for index in range(10)])
+    log.close()
+    inode = os.stat(log.path).st_ino
+
+    log.truncate(6)
+
+    assert os.stat(log.path).st_ino == inode
+    assert os.path.getsize(log.path) == log.size
+    assert log.count == 6
+    assert [block.previous_hash for block in log.load()] == ['hash-a-{}'.format(index - 1) for index in range(6)]
+
+
+def test_old_view_keeps_the_blocks_cut_by_a_reorg(node_dir):
+    log = BlockLog('./db/blocklog.bin')
+    log.open()
+    log.append_many([make_block(index) for index in range(10)])
+    old = log.view()
+
+    log.truncate(6)
+    log.append_many([make_block(index, 'b') for index in range(6, 12)])
+    middle = log.view()
+    log.truncate(4)
+    log.append_many([make_block(index, 'c') for index in range(4, 8)])
+
+    assert [old.read(index).previous_hash for index in range(10)] == \
+        ['hash-a-{}'.format(index - 1) for index in range(10)]
+    assert [middle.read(index).previous_hash for index in range(12)] == \
+        ['hash-a-{}'.format(index - 1) for index in range(6)] + ['hash-b-{}'.format(index - 1) for index in range(6, 12)]
+    assert [log.read(index).previous_hash for index in range(8)] == \
+        ['hash-a-{}'.format(index - 1) for index in range(4)] + ['hash-c-{}'.format(index - 1) for index in range(4, 8)]
+    log.close()
+
+
+def test_open_cuts_a_torn_tail(node_dir):
+    log = BlockLog('./db/blocklog.bin')
+    log.open()
+    log.append_many([make_block(index) for index in range(5)])
+    log.close()
+    size = log.size
+    with open(log.path, mode='ab') as f:
+        # a record whose payload was only partly written
+        f.write(BlockLog.HEADER.pack(100, 0) + b'x' * 10)
+
+    reopened = BlockLog(log.path)
+    assert reopened.open() == 5
+    assert os.path.getsize(log.path) == size
+
+
+def test_open_cuts_a_record_with_a_bad_checksum(node_dir):
+    log = BlockLog('./db/blocklog.bin')
+    log.open()
+    log.append_many([make_block(index) for index in range(5)])
+    log.close()
+    os.remove(log.index_path)
+    with open(log.path, mode='r+b') as f:
+        # flip a byte of the payload of block 3
+        f.seek(log.offsets[3] + BlockLog.HEADER.size + 5)
+        byte = f.read(1)
+        f.seek(-1, os.SEEK_CUR)
+        f.write(bytes([byte[0] ^ 0xff]))
+
+    reopened = BlockLog(log.path)
+    assert reopened.open() == 3
+    assert os.path.getsize(log.path) == log.offsets[3]
+    assert [block.index for block in reopened.load()] == [0, 1, 2]
+    reopened.append(make_block(3, 'b'))
+    assert reopened.read(3).previous_hash == 'hash-b-2'
@@ -0,0 +1,62 @@
+import pytest
+
+from block import Block
+from codec import MIMETYPE, dumps_block, loads_block, dumps_transactions, loads_transactions
+from transaction import Transaction
+from utility.hash_util import hash_block, hash_transaction
+from utility.merkle import merkle_root
+
+
+def make_block(timestamp=1684147282.07, proof=42):
+    transactions = [Transaction('owner-{}'.format(i % 2), 'ab' * 32, i) for i in range(4)]
+    root = merkle_root([hash_transaction(tx) for tx in transactions])
+    return Block(3, 'cd' * 32, transactions, proof, timestamp, 4, root)
+
+
+def test_block_round_trip_keeps_the_hash():
+    block = make_block()
+    decoded = loads_block(dumps_block(block))
+    assert decoded.to_dict() == block.to_dict()
+    assert hash_block(decoded) == hash_block(make_block())
+
+
+def test_float_and_int_values_keep_their_type_and_hash():
+    as_float = loads_block(dumps_block(make_block(timestamp=5.0)))
+    as_int = loads_block(dumps_block(make_block(timestamp=5)))
+    assert isinstance(as_float.timestamp, float)
+    assert isinstance(as_int.timestamp, int)
+    assert hash_block(as_float) == hash_block(make_block(timestamp=5.0))
+    assert hash_block(as_int) == hash_block(make_block(timestamp=5))
+    assert hash_block(as_float) != hash_block(as_int)
+
+
+def test_transactions_round_trip():
+    transactions = [Transaction('owner', 'signature-{}'.format(i), str(i)) for i in range(3)]
+    decoded = loads_transactions(dumps_transactions(transactions))
+    assert [tx.to_dict() for tx in decoded] == [tx.to_dict() for tx in transactions]
+
+
+def test_truncated_block_is_an_error():
+    data = dumps_block(make_block())
+    for end in range(1, len(data)):
+        try:
+            block = loads_block(data[:end])
+        except (ValueError, IndexError):
+            continue
+        # a cut inside the transactions can still give a shorter, different block
+        assert block.to_dict() != make_block().to_dict()
+
+
+def test_truncated_float_is_a_value_error():
+    data = dumps_block(make_block())
+    # type byte, index, previous_hash (type, length, 32 bytes), then the float timestamp
+    end = 1 + 2 + 2 + 32 + 1 + 4
+    with pytest.raises(ValueError):
+        loads_block(data[:end])
+
+
+def test_truncated_block_is_refused_by_the_node():
+    node = pytest.importorskip('node')
+    data = dumps_block(make_block())
+    response = node.app.test_client().post('/broadcast-block', data=data[:1 + 2 + 2 + 32 + 1 + 4], content_type=MIMETYPE)
+    assert response.status_code == 400
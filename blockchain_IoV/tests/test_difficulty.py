@@ -0,0 +1,56 @@
+from time import time
+
+from block import Block
+from config import DIFFICULTY, MIN_DIFFICULTY, MAX_RETARGET_STEP, RETARGET_WINDOW, TARGET_BLOCK_TIME, MAX_FUTURE_BLOCK_TIME
+from utility.difficulty import next_difficulty, median_time, chain_work
+from utility.verification import Verification
+
+
+def make_chain(interval, difficulty, count=RETARGET_WINDOW + 2, start=1000.0):
+    """ a genesis block without a difficulty and `count` blocks mined `interval` seconds apart """
+    chain = [Block(0, '', [], 100, start)]
+    for index in range(1, count + 1):
+        chain.append(Block(index, 'hash', [], 0, start + index * interval, difficulty))
+    return chain
+
+
+def test_difficulty_stays_on_target():
+    assert next_difficulty(make_chain(TARGET_BLOCK_TIME, 16)) == 16
+
+
+def test_difficulty_moves_at_most_one_step():
+    # blocks 64 times too fast / too slow would be worth 6 bits
+    assert next_difficulty(make_chain(TARGET_BLOCK_TIME / 64, 16)) == 16 + MAX_RETARGET_STEP
+    assert next_difficulty(make_chain(TARGET_BLOCK_TIME * 64, 16)) == 16 - MAX_RETARGET_STEP
+    assert next_difficulty(make_chain(TARGET_BLOCK_TIME / 2, 16)) == 17
+
+
+def test_difficulty_stays_within_its_bounds():
+    assert next_difficulty(make_chain(TARGET_BLOCK_TIME * 64, MIN_DIFFICULTY)) == MIN_DIFFICULTY
+    # blocks with the same timestamp count as too fast
+    assert next_difficulty(make_chain(0, 16)) == 16 + MAX_RETARGET_STEP
+
+
+def test_blocks_without_difficulty_are_not_measured():
+    chain = [Block(index, 'hash', [], 0, 1000.0) for index in range(5)]
+    assert next_difficulty(chain) == DIFFICULTY
+    chain.append(Block(5, 'hash', [], 0, 1001.0, 14))
+    # a single measured block is no interval
+    assert next_difficulty(chain) == 14
+
+
+def test_work_counts_legacy_blocks_with_the_default_difficulty():
+    chain = make_chain(TARGET_BLOCK_TIME, 16, count=3)
+    assert chain_work(chain) == 2 ** DIFFICULTY + 3 * 2 ** 16
+
+
+def test_timestamp_must_pass_the_median_and_not_be_in_the_future():
+    chain = make_chain(TARGET_BLOCK_TIME, 16, count=20)
+    median = median_time(chain)
+    late = Block(len(chain), 'hash', [], 0, median + 1, 16)
+    early = Block(len(chain), 'hash', [], 0, median, 16)
+    future = Block(len(chain), 'hash', [], 0, time() + MAX_FUTURE_BLOCK_TIME + 60, 16)
+    assert Verification.valid_timestamp(late, chain, len(chain))
+    assert not Verification.valid_timestamp(early, chain, len(chain))
+    assert not Verification.valid_timestamp(future, chain, len(chain))
+    assert not Verification.valid_timestamp(Block(len(chain), 'hash', [], 0, float('nan'), 16), chain, len(chain))
@@ -0,0 +1,92 @@
+from mempool import Mempool
+from transaction import Transaction
+from utility.hash_util import hash_transaction
+
+
+def make_transactions(count, tag='a'):
+    return [Transaction('owner', 'signature-{}-{}'.format(tag, i), str(i)) for i in range(count)]
+
+
+def pending(mempool):
+    return [tx.to_dict() for tx in mempool.transactions()]
+
+
+def test_same_transaction_is_queued_once(node_dir):
+    mempool = Mempool('./db/mempool.log')
+    mempool.load()
+    tx = make_transactions(1)[0]
+    assert mempool.add(tx)
+    assert not mempool.add(Transaction(tx.dataOwner, tx.signature, tx.hop_count))
+    # another signature is another transaction
+    assert mempool.add(Transaction(tx.dataOwner, 'other', tx.hop_count))
+    assert len(mempool) == 2
+    assert len(mempool.select(10, 10 ** 6)) == 2
+
+
+def test_journal_replay(node_dir):
+    mempool = Mempool('./db/mempool.log')
+    mempool.load()
+    transactions = make_transactions(5)
+    for tx in transactions:
+        mempool.add(tx)
+    mempool.confirm(transactions[:2])
+    mempool.evict(hash_transaction(transactions[3]))
+    mempool.close()
+
+    replayed = Mempool('./db/mempool.log')
+    replayed.load()
+    assert pending(replayed) == [transactions[2].to_dict(), transactions[4].to_dict()]
+
+
+def test_replay_ignores_a_torn_last_line(node_dir):
+    mempool = Mempool('./db/mempool.log')
+    mempool.load()
+    for tx in make_transactions(3):
+        mempool.add(tx)
+    mempool.close()
+    with open('./db/mempool.log', mode='a') as f:
+        f.write('{"op": "add", "tx": {"dataOw')
+
+    replayed = Mempool('./db/mempool.log')
+    replayed.load()
+    assert pending(replayed) == [tx.to_dict() for tx in make_transactions(3)]
+
+
+def test_replay_from_a_snapshot_reads_the_lines_after_it(node_dir):
+    mempool = Mempool('./db/mempool.log')
+    mempool.load()
+    for tx in make_transactions(3):
+        mempool.add(tx)
+    snapshot = mempool.snapshot()
+    later = make_transactions(2, 'b')
+    for tx in later:
+        mempool.add(tx)
+    mempool.confirm(make_transactions(1))
+    mempool.close()
+
+    replayed = Mempool('./db/mempool.log')
+    replayed.load(snapshot=snapshot)
+    assert pending(replayed) == [tx.to_dict() for tx in make_transactions(3)[1:] + later]
+
+
+def test_compaction_keeps_the_pending_transactions(node_dir):
+    mempool = Mempool('./db/mempool.log')
+    mempool.load()
+    snapshot = mempool.snapshot()
+    kept = make_transactions(3, 'kept')
+    for tx in kept:
+        mempool.add(tx)
+    for round in range(Mempool.COMPACT_MIN_LINES // 100 + 1):
+        transactions = make_transactions(50, round)
+        for tx in transactions:
+            mempool.add(tx)
+        mempool.confirm(transactions)
+    mempool.close()
+
+    with open('./db/mempool.log') as f:
+        lines = f.readlines()
+    assert len(lines) < Mempool.COMPACT_MIN_LINES
+    replayed = Mempool('./db/mempool.log')
+    # the journal the snapshot was taken of is gone, the whole new one is replayed
+    replayed.load(snapshot=snapshot)
+    assert pending(replayed) == [tx.to_dict() for tx in kept]
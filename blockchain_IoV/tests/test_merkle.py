@@ -0,0 +1,37 @@
+import hashlib as hl
+
+import pytest
+
+from utility.merkle import merkle_root, merkle_branch, verify_merkle_branch
+
+
+def leaves(count):
+    return [hl.sha256(str(i).encode()).hexdigest() for i in range(count)]
+
+
+def parent(left, right):
+    return hl.sha256(b'\x01' + bytes.fromhex(left) + bytes.fromhex(right)).hexdigest()
+
+
+def test_odd_node_moves_up_unchanged():
+    a, b, c = leaves(3)
+    assert merkle_root([a, b, c]) == parent(parent(a, b), c)
+    assert merkle_root([a]) == a
+
+
+@pytest.mark.parametrize('count', [1, 2, 3, 5, 7, 9, 16])
+def test_every_branch_leads_to_the_root(count):
+    hashes = leaves(count)
+    root = merkle_root(hashes)
+    for index, leaf in enumerate(hashes):
+        assert verify_merkle_branch(leaf, merkle_branch(hashes, index), root)
+
+
+def test_branch_of_another_leaf_or_root_fails():
+    hashes = leaves(5)
+    root = merkle_root(hashes)
+    branch = merkle_branch(hashes, 4)
+    assert not verify_merkle_branch(hashes[3], branch, root)
+    assert not verify_merkle_branch(hashes[4], branch, merkle_root(hashes[:4]))
+    # the last leaf of an odd level is not its own sibling
+    assert not verify_merkle_branch(hashes[4], branch + [[hashes[4], 'right']], root)
@@ -0,0 +1,43 @@
+import threading
+
+from miner import ProofOfWork, search
+
+
+def smallest_proof(prefix, difficulty_bits):
+    proof = None
+    start = 0
+    while proof is None:
+        proof, _ = search(prefix, start, start + 1000, difficulty_bits)
+        start += 1000
+    return proof
+
+
+def test_searches_sharing_the_engine_find_their_smallest_proof():
+    engine = ProofOfWork(processes=2, chunk_size=64)
+    prefixes = [b'block-%d' % index for index in range(6)]
+    proofs = {}
+
+    def mine(prefix):
+        proofs[prefix] = engine.find(prefix, 12)
+
+    try:
+        threads = [threading.Thread(target=mine, args=(prefix,)) for prefix in prefixes]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        engine.close()
+
+    assert proofs == {prefix: smallest_proof(prefix, 12) for prefix in prefixes}
+
+
+def test_cancelled_search_gives_its_slot_back():
+    engine = ProofOfWork(processes=2, chunk_size=64, slots=1)
+    cancel = threading.Event()
+    cancel.set()
+    try:
+        assert engine.find(b'block', 40, cancel) is None
+        assert engine.find(b'block', 12) == smallest_proof(b'block', 12)
+    finally:
+        engine.close()
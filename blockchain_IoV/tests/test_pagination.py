@@ -0,0 +1,71 @@
+import pytest
+
+from block_log import BlockLog
+from blockchain import Blockchain
+
+from test_block_log import make_block
+
+node = pytest.importorskip('node')
+
+
+@pytest.fixture
+def client(node_dir, monkeypatch):
+    log = BlockLog('./db/blocklog-pages.bin')
+    log.open()
+    log.append_many([make_block(index) for index in range(12)])
+    log.close()
+    monkeypatch.setattr(node, 'blockchain', Blockchain(None, 'pages'), raising=False)
+    return node.app.test_client()
+
+
+def test_limit_below_one_is_refused(client):
+    for path in ('/chain', '/transactions', '/owner/owner-a-0/transactions'):
+        for limit in (0, -3):
+            response = client.get(path, query_string={'limit': limit})
+            assert response.status_code == 400
+            assert response.get_json() == {'message': 'limit must be at least 1.'}
+
+
+def test_chain_pages_follow_the_cursor_to_the_tip(client):
+    indexes = []
+    cursor = 0
+    while cursor is not None:
+        response = client.get('/chain', query_string={'cursor': cursor, 'limit': 5})
+        assert response.status_code == 200
+        indexes += [block['index'] for block in response.get_json()]
+        cursor = response.headers.get('X-Next-Cursor')
+    assert indexes == list(range(12))
+
+
+def test_chain_limit_is_capped_and_a_cursor_past_the_tip_is_empty(client, monkeypatch):
+    monkeypatch.setattr(node, 'MAX_BLOCKS', 4)
+    response = client.get('/chain', query_string={'cursor': 2, 'limit': 1000})
+    assert [block['index'] for block in response.get_json()] == [2, 3, 4, 5]
+    assert response.headers['X-Next-Cursor'] == '6'
+
+    response = client.get('/chain', query_string={'cursor': 50, 'limit': 5})
+    assert response.get_json() == []
+    assert 'X-Next-Cursor' not in response.headers
+
+
+def test_owner_pages_are_capped_and_cover_every_transaction(client, monkeypatch):
+    monkeypatch.setattr(node, 'MAX_PAGE_TRANSACTIONS', 4)
+    pages = []
+    cursor = 0
+    while cursor is not None:
+        response = client.get('/owner/owner-a-1/transactions', query_string={'cursor': cursor, 'limit': 100})
+        pages.append(response.get_json())
+        cursor = response.headers.get('X-Next-Cursor')
+    # a full page may be followed by an empty one
+    assert [len(page) for page in pages] == [4, 4, 4, 0]
+    assert [tx['block_index'] for page in pages for tx in page] == list(range(12))
+
+
+def test_etag_carries_the_instance_and_an_unchanged_page_is_not_sent(client):
+    response = client.get('/chain', query_string={'limit': 5})
+    tag = response.headers['ETag'].strip('"')
+    assert tag.startswith(node.instance + '-')
+    assert client.get('/chain', query_string={'limit': 5}, headers={'If-None-Match': '"{}"'.format(tag)}).status_code == 304
+
+    response = client.get('/owner/owner-a-1/transactions', query_string={'limit': 5})
+    assert response.headers['ETag'].strip('"').startswith(node.instance + '-')
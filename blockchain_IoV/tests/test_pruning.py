@@ -0,0 +1,63 @@
+import os
+
+import pytest
+
+from block import Block
+from blockchain import Blockchain
+from utility import difficulty
+from utility.hash_util import hash_block
+from wallet import Wallet
+
+
+@pytest.fixture
+def pruned_node(node_dir, monkeypatch):
+    """ a pruning node keeping 15 full blocks, archiving 20 blocks a segment """
+    monkeypatch.setattr(difficulty, 'MAX_DIFFICULTY', 8)
+    wallet = Wallet('pruned')
+    wallet.create_keys()
+
+    def open_node():
+        blockchain = Blockchain(wallet.public_key, 'pruned', 15)
+        blockchain._Blockchain__archive.segment_blocks = 20
+        return blockchain
+
+    blockchain = open_node()
+    for index in range(60):
+        hop_count = 'hop{}'.format(index)
+        assert blockchain.add_transaction(wallet.public_key, wallet.sign_transaction(wallet.public_key, hop_count), hop_count)
+        assert blockchain.mine_block() is not None
+    return blockchain, open_node
+
+
+def test_old_blocks_move_to_the_archive(pruned_node):
+    blockchain, _ = pruned_node
+    assert blockchain.head()['height'] == 60
+    assert blockchain.archived_blocks() == 40
+    assert len(os.listdir('./db/archive-pruned')) == 2
+    assert blockchain.verify()
+
+    block = blockchain.get_block(5)
+    assert block.transactions[0].hop_count == 'hop4'
+    assert hash_block(block) == blockchain.get_headers(5, 6)[0]['hash']
+    tx_id = block.transactions[0].tx_id()
+    assert blockchain.get_transaction(tx_id)['block_index'] == 5
+
+
+def test_pruned_node_reloads_from_the_archive(pruned_node):
+    blockchain, open_again = pruned_node
+    head = blockchain.head()
+    blocks = [blockchain.get_block(index).to_dict() for index in range(61)]
+
+    reloaded = open_again()
+    assert reloaded.head() == head
+    assert reloaded.archived_blocks() == 40
+    assert reloaded.verify()
+    assert [reloaded.get_block(index).to_dict() for index in range(61)] == blocks
+
+
+def test_fork_below_the_archive_is_refused(pruned_node):
+    blockchain, _ = pruned_node
+    head = blockchain.head()
+    fork = [Block(10 + index, 'hash', [], 0, 0, 16) for index in range(100)]
+    assert not blockchain.replace_chain(10, fork)
+    assert blockchain.head() == head
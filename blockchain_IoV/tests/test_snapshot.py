@@ -0,0 +1,104 @@
+from array import array
+import os
+
+from block_log import BlockLog
+from snapshot import Snapshot
+from transaction import Transaction
+
+from test_block_log import make_block
+
+
+def write_log(count):
+    log = BlockLog('./db/blocklog.bin')
+    log.open()
+    log.append_many([make_block(index) for index in range(count)])
+    log.close()
+    return log
+
+
+def previous_hashes(log):
+    return [block.previous_hash for block in log.load()]
+
+
+def test_snapshot_round_trip_does_not_grow_with_the_chain(node_dir):
+    snapshot = Snapshot('./db/snapshot.bin')
+    mempool = ('0f' * 16, 123, [Transaction('owner', 'signature', '3')])
+    snapshot.write('ab' * 32, 10, 4096, mempool, {'localhost:5001'}, log_base=2, work=2 ** 70)
+    size = os.path.getsize(snapshot.path)
+    snapshot.write('ab' * 32, 100000, 4096, mempool, {'localhost:5001'}, log_base=2, work=2 ** 70)
+    assert os.path.getsize(snapshot.path) == size
+
+    loaded = Snapshot(snapshot.path).load()
+    assert loaded['height'] == 100000
+    assert loaded['log_base'] == 2
+    assert loaded['log_size'] == 4096
+    assert loaded['tip_hash'] == 'ab' * 32
+    assert loaded['work'] == 2 ** 70
+    assert loaded['peers'] == ['localhost:5001']
+    assert loaded['mempool'][:2] == ('0f' * 16, 123)
+    assert [tx.to_dict() for tx in loaded['mempool'][2]] == [tx.to_dict() for tx in mempool[2]]
+
+
+def test_open_reads_the_offsets_from_the_index(node_dir):
+    log = write_log(8)
+    with open(log.index_path, mode='rb') as f:
+        assert len(f.read()) == 8 * 8
+
+    reopened = BlockLog(log.path)
+    assert reopened.open() == 8
+    assert reopened.offsets == log.offsets
+    assert previous_hashes(reopened) == ['hash-a-{}'.format(index - 1) for index in range(8)]
+
+
+def test_open_indexes_the_records_written_after_the_index(node_dir):
+    log = write_log(8)
+    with open(log.index_path, mode='r+b') as f:
+        # the last two offsets and half of the one before were not written
+        f.truncate(5 * 8 + 4)
+
+    reopened = BlockLog(log.path)
+    assert reopened.open() == 8
+    assert reopened.offsets == log.offsets
+    with open(log.index_path, mode='rb') as f:
+        assert f.read() == log.offsets.tobytes()
+
+
+def test_open_drops_offsets_past_the_end_of_the_log(node_dir):
+    log = write_log(8)
+    with open(log.path, mode='r+b') as f:
+        f.truncate(log.offsets[6])
+
+    reopened = BlockLog(log.path)
+    assert reopened.open() == 6
+    assert previous_hashes(reopened) == ['hash-a-{}'.format(index - 1) for index in range(6)]
+    reopened.append(make_block(6, 'b'))
+    reopened.close()
+    assert BlockLog(log.path).open() == 7
+
+
+def test_broken_index_is_rebuilt_from_the_log(node_dir):
+    log = write_log(8)
+    with open(log.index_path, mode='r+b') as f:
+        f.seek(7 * 8)
+        f.write(array('Q', [log.offsets[7] + 3]).tobytes())
+
+    reopened = BlockLog(log.path)
+    assert reopened.open() == 8
+    assert reopened.offsets == log.offsets
+    with open(log.index_path, mode='rb') as f:
+        assert f.read() == log.offsets.tobytes()
+
+
+def test_truncate_and_drop_before_keep_the_index(node_dir):
+    log = write_log(10)
+    log.open()
+    log.truncate(7)
+    log.drop_before(3)
+    log.append(make_block(7, 'b'))
+    log.close()
+
+    reopened = BlockLog(log.path)
+    assert reopened.open() == 8
+    assert reopened.base == 3
+    assert reopened.offsets == log.offsets
+    assert previous_hashes(reopened) == ['hash-a-{}'.format(index - 1) for index in range(3, 7)] + ['hash-b-6']
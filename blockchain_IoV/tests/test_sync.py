@@ -0,0 +1,61 @@
+import pytest
+
+from block import Block
+from sync import ChainSync
+from utility.hash_util import hash_block
+
+
+class LocalChain:
+    """ the parts of Blockchain that find_fork reads """
+
+    def __init__(self, blocks):
+        self.blocks = blocks
+
+    def head(self):
+        return {'height': len(self.blocks) - 1}
+
+    def get_block_header(self, index):
+        return self.blocks[index]
+
+
+def make_chain(length, fork=None, tag='b'):
+    """ blocks 0 .. length - 1, different from block `fork` on """
+    return [Block(index, 'a' if fork is None or index < fork else tag, [], index, float(index)) for index in range(length)]
+
+
+def find_fork(local, remote, monkeypatch):
+    requests = []
+
+    def get(self, node, path, start, end):
+        requests.append(start)
+        return [{'hash': hash_block(block)} for block in remote[start:end]]
+
+    monkeypatch.setattr(ChainSync, '_ChainSync__get', get)
+    return ChainSync(LocalChain(local)).find_fork('peer', len(remote) - 1), requests
+
+
+@pytest.mark.parametrize('fork', [1, 2, 17, 63, 99])
+def test_fork_point_is_the_first_different_block(fork, monkeypatch):
+    fork_point, requests = find_fork(make_chain(100), make_chain(120, fork), monkeypatch)
+    assert fork_point == fork
+    # a binary search over the common height
+    assert len(requests) <= 7
+
+
+def test_peer_ahead_on_the_same_chain(monkeypatch):
+    assert find_fork(make_chain(50), make_chain(80), monkeypatch)[0] == 50
+
+
+def test_peer_behind_on_the_same_chain(monkeypatch):
+    assert find_fork(make_chain(80), make_chain(50), monkeypatch)[0] == 50
+
+
+def test_missing_header_gives_no_fork_point(monkeypatch):
+    local = make_chain(40)
+    remote = make_chain(40, 20)
+
+    def get(self, node, path, start, end):
+        return []
+
+    monkeypatch.setattr(ChainSync, '_ChainSync__get', get)
+    assert ChainSync(LocalChain(local)).find_fork('peer', len(remote) - 1) is None
@@ -1,12 +1,18 @@
 from collections import OrderedDict
+import json
+from utility.hash_util import hash_transaction
 from utility.printable import Printable
 
 
 class Transaction(Printable):
     """
         Use the form and concept of transaction, but not with money transfer
+
+        Slotted to keep the many transactions small, use to_dict() for the json form.
     """
 
+    __slots__ = ('dataOwner', 'signature', 'hop_count')
+
     def __init__(self, dataOwner, signature, hop_count):
         """
             self.dataOwner:          your public key
@@ -18,6 +24,24 @@ class Transaction(Printable):
         self.hop_count = hop_count
 
 
+    def tx_id(self):
+        """ stable id: hash of the canonical form (sorted json, signature included) """
+
+        return hash_transaction(self)
+
+
+    def size(self):
+        """ bytes of the transaction in json """
+
+        return len(json.dumps(self.to_dict()))
+
+
+    def to_dict(self):
+        """ return as a dictionary, the json form of the transaction """
+
+        return {'dataOwner': self.dataOwner, 'signature': self.signature, 'hop_count': self.hop_count}
+
+
     def to_ordered_dict(self):
         """ return as a dictionary """
 
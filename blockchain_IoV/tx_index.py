@@ -0,0 +1,151 @@
+import sqlite3
+import threading
+
+from utility.hash_util import hash_block, hash_transaction
+
+
+class TransactionIndex:
+    """
+        Persistent lookup tables of the mined transactions (sqlite)
+
+            txs:        seq -> (block index, position, transaction id, owner)
+            blocks:     block index -> (block hash, seq of its first transaction)
+            owners:     dataOwner key -> small owner id, so a key is stored only once
+
+        `seq` numbers the transactions in chain order, it is the cursor of the
+        owner pages. Transaction ids and owners are indexed, so a lookup is one
+        b-tree search whatever the size of the chain. The index follows the chain
+        block by block and is cut back with it on a fork.
+
+        self.path:              file of the database
+        self.height:            number of indexed blocks
+    """
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS blocks (
+            block_index INTEGER PRIMARY KEY,
+            hash TEXT NOT NULL,
+            first_seq INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS owners (
+            owner_id INTEGER PRIMARY KEY,
+            key TEXT NOT NULL UNIQUE
+        );
+        CREATE TABLE IF NOT EXISTS txs (
+            seq INTEGER PRIMARY KEY,
+            block_index INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            tx_id BLOB NOT NULL,
+            owner_id INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS txs_by_id ON txs (tx_id);
+        CREATE INDEX IF NOT EXISTS txs_by_owner ON txs (owner_id, seq);
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.__lock = threading.Lock()
+        self.__db = sqlite3.connect(path, check_same_thread=False)
+        self.__db.execute('PRAGMA journal_mode=WAL')
+        self.__db.execute('PRAGMA synchronous=NORMAL')
+        self.__db.executescript(self.SCHEMA)
+        self.height = self.__db.execute('SELECT COUNT(*) FROM blocks').fetchone()[0]
+
+
+    def catch_up(self, chain):
+        """
+            Make the index match the chain (a StoredChain): drop the blocks the chain does not hold (anymore),
+            index the missing ones
+        """
+
+        with self.__lock:
+            fork = min(self.height, len(chain))
+            # a crash between a fork and the index update leaves a different tip behind
+            while fork > 0 and self.__block_hash(fork - 1) != hash_block(chain.header(fork - 1)):
+                fork -= 1
+            if fork < self.height:
+                print('Transaction index differs from the chain, rolling back to block {}'.format(fork))
+                self.__rollback(fork)
+        self.update(chain)
+
+
+    def update(self, chain):
+        """ Index the blocks of the chain which are not indexed yet """
+
+        with self.__lock:
+            if self.height >= len(chain):
+                return
+            seq = self.__next_seq()
+            with self.__db:
+                for block in chain[self.height:]:
+                    self.__db.execute('INSERT INTO blocks VALUES (?, ?, ?)', (block.index, hash_block(block), seq))
+                    rows = []
+                    for position, tx in enumerate(block.transactions):
+                        rows.append((seq, block.index, position, bytes.fromhex(hash_transaction(tx)), self.__owner_id(tx.dataOwner)))
+                        seq += 1
+                    self.__db.executemany('INSERT INTO txs VALUES (?, ?, ?, ?, ?)', rows)
+            self.height = len(chain)
+
+
+    def rollback(self, height):
+        """ Forget the blocks from `height` on, used before the chain is replaced after a fork """
+
+        with self.__lock:
+            self.__rollback(height)
+
+
+    def find(self, tx_id):
+        """ (block index, position) of the first mined copy of the transaction, None if it is not mined """
+
+        try:
+            key = bytes.fromhex(tx_id)
+        except ValueError:
+            return None
+        with self.__lock:
+            return self.__db.execute(
+                'SELECT block_index, position FROM txs WHERE tx_id = ? ORDER BY seq LIMIT 1', (key,)
+            ).fetchone()
+
+
+    def owner_transactions(self, owner, start=0, limit=100):
+        """ [(seq, block index, position)] of the transactions of an owner, from seq `start` on """
+
+        with self.__lock:
+            row = self.__db.execute('SELECT owner_id FROM owners WHERE key = ?', (owner,)).fetchone()
+            if row is None:
+                return []
+            return self.__db.execute(
+                'SELECT seq, block_index, position FROM txs WHERE owner_id = ? AND seq >= ? ORDER BY seq LIMIT ?',
+                (row[0], start, limit)
+            ).fetchall()
+
+
+    def close(self):
+        with self.__lock:
+            self.__db.close()
+
+
+    def __rollback(self, height):
+        if height >= self.height:
+            return
+        with self.__db:
+            row = self.__db.execute('SELECT first_seq FROM blocks WHERE block_index = ?', (height,)).fetchone()
+            self.__db.execute('DELETE FROM txs WHERE seq >= ?', (row[0],))
+            self.__db.execute('DELETE FROM blocks WHERE block_index >= ?', (height,))
+        self.height = height
+
+
+    def __block_hash(self, index):
+        return self.__db.execute('SELECT hash FROM blocks WHERE block_index = ?', (index,)).fetchone()[0]
+
+
+    def __next_seq(self):
+        row = self.__db.execute('SELECT MAX(seq) FROM txs').fetchone()
+        return 0 if row[0] is None else row[0] + 1
+
+
+    def __owner_id(self, owner):
+        row = self.__db.execute('SELECT owner_id FROM owners WHERE key = ?', (owner,)).fetchone()
+        if row is not None:
+            return row[0]
+        return self.__db.execute('INSERT INTO owners (key) VALUES (?)', (owner,)).lastrowid
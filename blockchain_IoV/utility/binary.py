@@ -0,0 +1,161 @@
+from functools import lru_cache
+import json
+import struct
+
+from config import OWNER_KEY_CACHE_SIZE
+from transaction import Transaction
+
+
+# type of an encoded value
+NONE = 0
+INT = 1
+FLOAT = 2
+HEX = 3
+TEXT = 4
+JSON = 5
+
+FLOAT_FORMAT = struct.Struct('>d')
+
+
+@lru_cache(maxsize=OWNER_KEY_CACHE_SIZE)
+def _owner_key(owner):
+    """ the same string object for a dataOwner key used again, only the recent keys are held """
+    return owner
+
+
+def write_varint(out, number):
+    while number >= 0x80:
+        out.append((number & 0x7f) | 0x80)
+        number >>= 7
+    out.append(number)
+
+
+def read_varint(data, offset):
+    """ returns (number, offset after it) """
+    number = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        number |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return number, offset
+        shift += 7
+
+
+def write_value(out, value):
+    """
+        Append a json value so that it decodes to exactly the same value (the hashes
+        depend on it): hex strings are stored as raw bytes, ints as zigzag varints.
+    """
+
+    if value is None:
+        out.append(NONE)
+    elif isinstance(value, int) and not isinstance(value, bool):
+        out.append(INT)
+        write_varint(out, value * 2 if value >= 0 else -value * 2 - 1)
+    elif isinstance(value, float):
+        out.append(FLOAT)
+        out += FLOAT_FORMAT.pack(value)
+    elif isinstance(value, str):
+        raw = None
+        if len(value) % 2 == 0:
+            try:
+                raw = bytes.fromhex(value)
+            except ValueError:
+                pass
+        # only lower case hex comes back unchanged from bytes.hex()
+        if raw is not None and raw.hex() == value:
+            out.append(HEX)
+        else:
+            out.append(TEXT)
+            raw = value.encode()
+        write_varint(out, len(raw))
+        out += raw
+    else:
+        out.append(JSON)
+        raw = json.dumps(value).encode()
+        write_varint(out, len(raw))
+        out += raw
+
+
+def read_value(data, offset):
+    """ returns (value, offset after it) """
+
+    kind = data[offset]
+    offset += 1
+    if kind == NONE:
+        return None, offset
+    if kind == INT:
+        number, offset = read_varint(data, offset)
+        return (number >> 1) if number & 1 == 0 else -((number + 1) >> 1), offset
+    if kind == FLOAT:
+        if offset + FLOAT_FORMAT.size > len(data):
+            raise ValueError('Truncated value')
+        return FLOAT_FORMAT.unpack_from(data, offset)[0], offset + FLOAT_FORMAT.size
+    length, offset = read_varint(data, offset)
+    raw = data[offset:offset + length]
+    if len(raw) != length:
+        raise ValueError('Truncated value')
+    offset += length
+    if kind == HEX:
+        return raw.hex(), offset
+    if kind == TEXT:
+        return bytes(raw).decode(), offset
+    if kind == JSON:
+        return json.loads(bytes(raw).decode()), offset
+    raise ValueError('Unknown value type {}'.format(kind))
+
+
+def write_transaction(out, transaction, owner_ids):
+    """
+        Append a transaction, its dataOwner key is only written the first time
+        (varint 0 + key), afterwards as varint key id + 1 from owner_ids
+    """
+
+    owner_id = owner_ids.get(transaction.dataOwner)
+    if owner_id is None:
+        owner_ids[transaction.dataOwner] = len(owner_ids)
+        out.append(0)
+        write_value(out, transaction.dataOwner)
+    else:
+        write_varint(out, owner_id + 1)
+    write_value(out, transaction.signature)
+    write_value(out, transaction.hop_count)
+
+
+def read_transaction(data, offset, owner_keys):
+    """ returns (transaction, offset after it), owner_keys holds the keys written so far """
+
+    owner_id, offset = read_varint(data, offset)
+    if owner_id == 0:
+        owner, offset = read_value(data, offset)
+        if isinstance(owner, str):
+            owner = _owner_key(owner)
+        owner_keys.append(owner)
+    else:
+        owner = owner_keys[owner_id - 1]
+    signature, offset = read_value(data, offset)
+    hop_count, offset = read_value(data, offset)
+    return Transaction(owner, signature, hop_count), offset
+
+
+def encode_transactions(transactions):
+    """ the transactions of one block, decodable on their own (the keys are interned within them) """
+
+    out = bytearray()
+    write_varint(out, len(transactions))
+    owner_ids = {}
+    for tx in transactions:
+        write_transaction(out, tx, owner_ids)
+    return bytes(out)
+
+
+def decode_transactions(data):
+    count, offset = read_varint(data, 0)
+    owner_keys = []
+    transactions = []
+    for _ in range(count):
+        tx, offset = read_transaction(data, offset, owner_keys)
+        transactions.append(tx)
+    return transactions
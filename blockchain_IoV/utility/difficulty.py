@@ -0,0 +1,55 @@
+from math import log2
+from statistics import median
+
+from config import DIFFICULTY, MIN_DIFFICULTY, MAX_DIFFICULTY, TARGET_BLOCK_TIME, RETARGET_WINDOW, MAX_RETARGET_STEP, \
+    MEDIAN_TIME_BLOCKS
+
+
+def next_difficulty(chain, index=None):
+    """
+        Difficulty the block at `index` needs (by default the block after the tip)
+
+        It follows the average time between the last RETARGET_WINDOW blocks:
+        every halving / doubling against TARGET_BLOCK_TIME is worth one bit,
+        and it moves at most MAX_RETARGET_STEP bits per block.
+        Blocks mined before difficulties existed (difficulty None) are not measured.
+    """
+
+    if index is None:
+        index = len(chain)
+    previous = chain[index - 1]
+    if previous.difficulty is None:
+        return DIFFICULTY
+
+    window = [block for block in chain[max(1, index - RETARGET_WINDOW - 1):index] if block.difficulty is not None]
+    if len(window) < 2:
+        return previous.difficulty
+
+    # the measured blocks were mined at their average difficulty in that average interval,
+    # so that is the difficulty which would have hit the target
+    interval = (window[-1].timestamp - window[0].timestamp) / (len(window) - 1)
+    measured = sum(block.difficulty for block in window[1:]) / (len(window) - 1)
+    if interval <= 0:
+        wanted = previous.difficulty + MAX_RETARGET_STEP
+    else:
+        wanted = round(measured + log2(TARGET_BLOCK_TIME / interval))
+    wanted = max(previous.difficulty - MAX_RETARGET_STEP, min(previous.difficulty + MAX_RETARGET_STEP, wanted))
+    return max(MIN_DIFFICULTY, min(MAX_DIFFICULTY, wanted))
+
+
+def median_time(chain, index=None):
+    """ median timestamp of the MEDIAN_TIME_BLOCKS blocks before `index` (by default before the block after the tip) """
+
+    if index is None:
+        index = len(chain)
+    return median(block.timestamp for block in chain[max(0, index - MEDIAN_TIME_BLOCKS):index])
+
+
+def block_work(block):
+    """ expected number of hashes behind a block, blocks without a difficulty count with the default one """
+    return 2 ** (block.difficulty if block.difficulty is not None else DIFFICULTY)
+
+
+def chain_work(blocks):
+    """ work of the given blocks, the chain with the most work wins a fork """
+    return sum(block_work(block) for block in blocks)
@@ -6,7 +6,34 @@ def hash_string_256(string):
     return hl.sha256(string).hexdigest()
 
 
+def header_prefix(index, previous_hash, merkle_root, timestamp, difficulty):
+    """ the block header the proof of work covers, the proof is appended to it """
+    return '{}:{}:{}:{!r}:{}:'.format(index, previous_hash, merkle_root, timestamp, difficulty).encode()
+
+
+def hash_header(header):
+    """ hash of a block header (a dictionary), which is also its proof of work hash """
+    prefix = header_prefix(header['index'], header['previous_hash'], header['merkle_root'],
+                           header['timestamp'], header['difficulty'])
+    return hash_string_256(prefix + str(header['proof']).encode())
+
+
 def hash_block(block):
-    hashable_block = block.__dict__.copy()
-    hashable_block['transactions'] = [tx.to_ordered_dict() for tx in hashable_block['transactions']]
-    return hash_string_256(json.dumps(hashable_block, sort_keys=True).encode())
\ No newline at end of file
+    """ hash of a block, computed once and then kept on the block """
+    if block._hash is None and block.merkle_root is not None:
+        block._hash = hash_header(block.header())
+    elif block._hash is None:
+        # blocks from before the merkle root hash all their transactions
+        hashable_block = block.to_dict()
+        hashable_block['transactions'] = [tx.to_ordered_dict() for tx in block.transactions]
+        hashable_block.pop('merkle_root', None)
+        # blocks from before the difficulty was stored keep their old hash
+        if hashable_block.get('difficulty') is None:
+            hashable_block.pop('difficulty', None)
+        block._hash = hash_string_256(json.dumps(hashable_block, sort_keys=True).encode())
+    return block._hash
+
+
+def hash_transaction(transaction):
+    """ id of a transaction: hash of its canonical form, signature included """
+    return hash_string_256(json.dumps(transaction.to_dict(), sort_keys=True).encode())
@@ -0,0 +1,44 @@
+import json
+
+
+def iter_json_array(chunks):
+    """
+        Yield the items of a json array while its text is still arriving
+
+        chunks:             iterable of text pieces, e.g. response.iter_content(decode_unicode=True)
+    """
+
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    started = False
+    chunks = iter(chunks)
+    finished = False
+    while True:
+        # skip whitespace, the opening bracket and separators
+        while position < len(buffer) and (buffer[position].isspace() or buffer[position] == ','
+                                          or (not started and buffer[position] == '[')):
+            if buffer[position] == '[':
+                started = True
+            position += 1
+        if position < len(buffer) and buffer[position] == ']':
+            return
+        if position < len(buffer) and started:
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+                # a number at the very end of the buffer may still be cut
+                if end < len(buffer) or finished:
+                    yield item
+                    position = end
+                    continue
+            except ValueError:
+                if finished:
+                    raise
+        elif finished:
+            raise ValueError('json array ended early')
+        # need more text
+        try:
+            buffer = buffer[position:] + next(chunks)
+            position = 0
+        except StopIteration:
+            finished = True
@@ -0,0 +1,67 @@
+import hashlib as hl
+
+from utility.hash_util import hash_header
+
+
+def _parent(left, right):
+    return hl.sha256(b'\x01' + bytes.fromhex(left) + bytes.fromhex(right)).hexdigest()
+
+
+def merkle_root(leaves):
+    """
+        Root of the merkle tree over the given leaf hashes (transaction ids, hex)
+
+        An odd node at the end of a level moves up unchanged, and inner nodes are
+        hashed with a 0x01 prefix, so they can never be confused with a leaf.
+    """
+
+    if len(leaves) == 0:
+        return hl.sha256(b'').hexdigest()
+    level = list(leaves)
+    while len(level) > 1:
+        level = [_parent(level[i], level[i + 1]) if i + 1 < len(level) else level[i]
+                 for i in range(0, len(level), 2)]
+    return level[0]
+
+
+def merkle_branch(leaves, index):
+    """
+        Sibling hashes from the leaf at `index` up to the root: a list of [hash, side],
+        side being 'left' or 'right' of the running hash.
+    """
+
+    branch = []
+    level = list(leaves)
+    while len(level) > 1:
+        sibling = index ^ 1
+        if sibling < len(level):
+            branch.append([level[sibling], 'left' if sibling < index else 'right'])
+        level = [_parent(level[i], level[i + 1]) if i + 1 < len(level) else level[i]
+                 for i in range(0, len(level), 2)]
+        index //= 2
+    return branch
+
+
+def verify_merkle_branch(leaf, branch, root):
+    """ True when the branch leads from the leaf hash to the root """
+
+    running = leaf
+    for sibling, side in branch:
+        running = _parent(sibling, running) if side == 'left' else _parent(running, sibling)
+    return running == root
+
+
+def verify_inclusion(tx_id, proof):
+    """
+        Light client check of a /proof/<txid> answer, no block download needed:
+        the branch leads from the transaction id to the merkle root of the header,
+        the header hashes to the given block hash, and that hash meets the difficulty.
+    """
+
+    header = proof['header']
+    if not verify_merkle_branch(tx_id, proof['branch'], header['merkle_root']):
+        return False
+    block_hash = hash_header(header)
+    if block_hash != proof['block_hash']:
+        return False
+    return int(block_hash, 16) >> (256 - header['difficulty']) == 0
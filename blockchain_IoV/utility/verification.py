@@ -1,4 +1,10 @@
-from utility.hash_util import hash_string_256, hash_block
+from math import isfinite
+from time import time
+
+from config import DIFFICULTY, MAX_BLOCK_TRANSACTIONS, MAX_BLOCK_BYTES, MAX_FUTURE_BLOCK_TIME
+from utility.difficulty import next_difficulty, median_time
+from utility.hash_util import hash_string_256, hash_block, hash_transaction
+from utility.merkle import merkle_root
 from wallet import Wallet
 
 
@@ -6,35 +12,124 @@ class Verification:
     """A class of verification functions"""
 
     @staticmethod
-    def valid_proof(transactions, last_hash, proof):
+    def valid_proof(transactions, last_hash, proof, difficulty=None):
         """
             Validate a proof of work number and see if it solves the puzzle algorithm
 
             transactions:      The transactions of the current block
             last_hash:         Previous block's hash 
             proof:             The proof number
+            difficulty:        Leading zero bits the hash needs, None for the default ('000')
         """
 
+        if difficulty is None:
+            difficulty = DIFFICULTY
         guess = (str([tx.to_ordered_dict() for tx in transactions]) + str(last_hash) + str(proof)).encode()
         guess_hash = hash_string_256(guess)
-        return guess_hash[0:3] == '000'
+        return int(guess_hash, 16) >> (256 - difficulty) == 0
 
 
     @classmethod
-    def verify_chain(cls, blockchain):
-        """ Verify by checking the hash """
-        for (index, block) in enumerate(blockchain):
-            if index == 0:
-                continue
-            if block.previous_hash != hash_block(blockchain[index - 1]):
-                print('previousHashErr')
-                return False
-            if not cls.valid_proof(block.transactions, block.previous_hash, block.proof):
-                print('Proof of work is invalid')
+    def verify_chain(cls, blockchain, start=1):
+        """
+            Verify by checking the hash
+
+            start:             first block to check, the blocks before it are trusted
+                               (e.g. the part shared with the local chain)
+
+            Header-only blocks (pruned, see StoredChain.headers) are checked by their header:
+            the links, difficulties and proofs of work, their transactions were checked when
+            the blocks were added.
+        """
+        for index in range(max(1, start), len(blockchain)):
+            if not cls.verify_block(blockchain, index):
                 return False
         return True
 
 
+    @classmethod
+    def verify_block(cls, blockchain, index):
+        """ Verify one block against the blocks before it, a header-only block without its transactions """
+        block = blockchain[index]
+        pruned = block.is_header()
+        if block.previous_hash != hash_block(blockchain[index - 1]):
+            print('previousHashErr')
+            return False
+        if not cls.valid_timestamp(block, blockchain, index):
+            print('Timestamp is invalid')
+            return False
+        if not pruned and not cls.valid_block_size(block.transactions):
+            print('Block is too big')
+            return False
+        if not cls.valid_difficulty(blockchain, index):
+            print('Difficulty is invalid')
+            return False
+        if not pruned and not cls.valid_merkle_root(block):
+            print('Merkle root is invalid')
+            return False
+        # the proof of blocks without merkle root covers their transactions
+        if (not pruned or block.merkle_root is not None) and not cls.valid_block_proof(block):
+            print('Proof of work is invalid')
+            return False
+        return True
+
+
+    @classmethod
+    def valid_block_proof(cls, block):
+        """ The proof of work of a block: over its header, or over its transactions for blocks without merkle root """
+
+        if block.merkle_root is None:
+            return cls.valid_proof(block.transactions, block.previous_hash, block.proof, block.difficulty)
+        return int(hash_block(block), 16) >> (256 - block.difficulty) == 0
+
+
+    @staticmethod
+    def valid_timestamp(block, blockchain, index):
+        """
+            The timestamp of the block at `index` is a number, later than the median of the
+            blocks before it and not more than MAX_FUTURE_BLOCK_TIME seconds ahead of the clock,
+            so a peer cannot stretch the retarget window with made-up times.
+            Blocks mined before difficulties existed (difficulty None) all got the same time,
+            they are not compared with the median.
+        """
+
+        timestamp = block.timestamp
+        if isinstance(timestamp, bool) or not isinstance(timestamp, (int, float)) or not isfinite(timestamp):
+            return False
+        if timestamp > time() + MAX_FUTURE_BLOCK_TIME:
+            return False
+        return block.difficulty is None or median_time(blockchain, index) < timestamp
+
+
+    @staticmethod
+    def valid_merkle_root(block):
+        if block.merkle_root is None:
+            return True
+        return block.merkle_root == merkle_root([hash_transaction(tx) for tx in block.transactions])
+
+
+    @staticmethod
+    def valid_block_size(transactions):
+        """ a block holds at most MAX_BLOCK_TRANSACTIONS transactions and MAX_BLOCK_BYTES bytes (or a single bigger one) """
+
+        if len(transactions) > MAX_BLOCK_TRANSACTIONS:
+            return False
+        return len(transactions) <= 1 or sum(tx.size() for tx in transactions) <= MAX_BLOCK_BYTES
+
+
+    @staticmethod
+    def valid_difficulty(blockchain, index):
+        """
+            Check the block at `index` has the difficulty the retargeting asks for.
+            Blocks without a difficulty are only accepted before the first block which has one.
+        """
+
+        block = blockchain[index]
+        if block.difficulty is None:
+            return blockchain[index - 1].difficulty is None
+        return block.difficulty == next_difficulty(blockchain, index)
+
+
     @staticmethod
     def verify_transaction(transaction, check_upload=True):
         """
@@ -3,11 +3,108 @@ from Crypto.Signature import PKCS1_v1_5
 from Crypto.Hash import SHA256
 import Crypto.Random
 import binascii
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+import hashlib as hl
+import os
+import threading
 from tinydb import TinyDB, Query
 
+from config import SIGNATURE_CACHE_SIZE, PUBLIC_KEY_CACHE_SIZE, VERIFY_BATCH_MIN, VERIFY_PROCESSES, \
+    SIGN_BATCH_MIN, SIGN_PROCESSES
+
+
+@lru_cache(maxsize=PUBLIC_KEY_CACHE_SIZE)
+def _verifier(dataOwner):
+    """ parsed public key of a data owner, ready to verify """
+    return PKCS1_v1_5.new(RSA.importKey(binascii.unhexlify(dataOwner)))
+
+
+def _verify(dataOwner, hop_count, signature):
+    try:
+        h = SHA256.new((str(dataOwner) + str(hop_count)).encode('utf8'))
+        return _verifier(dataOwner).verify(h, binascii.unhexlify(signature))
+    except (ValueError, TypeError, IndexError, binascii.Error):
+        return False
+
+
+# signer of a signing worker process, the private key is parsed once per process
+_worker_signer = None
+
+
+def _init_signer(private_key):
+    global _worker_signer
+    _worker_signer = PKCS1_v1_5.new(RSA.importKey(binascii.unhexlify(private_key)))
+
+
+def _sign(message):
+    return binascii.hexlify(_worker_signer.sign(SHA256.new(message))).decode('ascii')
+
+
+class SignatureCache:
+    """
+        LRU set of signatures which were already verified
+
+        Only a 32 byte digest of (dataOwner, hop_count, signature) is stored,
+        so memory stays bounded by self.size entries. Every field is prefixed with
+        its length in the digest, so moving bytes from one field to the next gives
+        another key.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+
+
+    @staticmethod
+    def key(dataOwner, hop_count, signature):
+        digest = hl.sha256()
+        for field in (dataOwner, hop_count, signature):
+            data = str(field).encode('utf8')
+            digest.update(len(data).to_bytes(8, 'big'))
+            digest.update(data)
+        return digest.digest()
+
+
+    def __contains__(self, key):
+        with self.__lock:
+            if key in self.__entries:
+                self.__entries.move_to_end(key)
+                self.hits += 1
+                return True
+            self.misses += 1
+            return False
+
+
+    def add(self, key):
+        with self.__lock:
+            self.__entries[key] = True
+            self.__entries.move_to_end(key)
+            if len(self.__entries) > self.size:
+                self.__entries.popitem(last=False)
+
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+            self.hits = 0
+            self.misses = 0
+
 
 class Wallet:
-    """ An account for user to play with transaction """
+    """
+        An account for user to play with transaction
+
+        signatures:         signatures already verified, shared by every wallet
+    """
+
+    signatures = SignatureCache(SIGNATURE_CACHE_SIZE)
+    __verify_pool = None
+    __verify_pool_lock = threading.Lock()
 
     def __init__(self, node_id):
         """
@@ -19,6 +116,10 @@ class Wallet:
         self.private_key = None
         self.public_key = None
         self.node_id = node_id
+        # parsed private key, and the signing processes holding it, for self.__signer_key
+        self.__signer_key = None
+        self.__signer = None
+        self.__sign_pool = None
 
 
     def generate_keys(self):
@@ -69,19 +170,95 @@ class Wallet:
             hop_count:          data we want to upload to the blockchain
         """
 
-        signer = PKCS1_v1_5.new(RSA.importKey(binascii.unhexlify(self.private_key)))
         h = SHA256.new((str(dataOwner) + str(hop_count)).encode('utf8'))
-        signature = signer.sign(h)
+        signature = self.__get_signer().sign(h)
         return binascii.hexlify(signature).decode('ascii')
 
 
-    @staticmethod
-    def verify_transaction(transaction):
+    def sign_many(self, hop_counts, dataOwner=None):
+        """
+            Sign a batch of transactions, returns the signatures in the same order
+
+            hop_counts:         data of every transaction
+            dataOwner:          public key of the transactions, this wallet's by default
+        """
+
+        if dataOwner is None:
+            dataOwner = self.public_key
+        if len(hop_counts) < SIGN_BATCH_MIN:
+            return [self.sign_transaction(dataOwner, hop_count) for hop_count in hop_counts]
+
+        self.__get_signer()
+        if self.__sign_pool is None:
+            self.__sign_pool = ProcessPoolExecutor(SIGN_PROCESSES, initializer=_init_signer, initargs=(self.private_key,))
+        messages = [(str(dataOwner) + str(hop_count)).encode('utf8') for hop_count in hop_counts]
+        chunksize = max(1, len(messages) // ((SIGN_PROCESSES or os.cpu_count() or 1) * 4))
+        return list(self.__sign_pool.map(_sign, messages, chunksize=chunksize))
+
+
+    def __get_signer(self):
+        """ the parsed private key, parsed again only when the key changed """
+
+        if self.__signer_key != self.private_key:
+            if self.__sign_pool is not None:
+                self.__sign_pool.shutdown(wait=False)
+                self.__sign_pool = None
+            self.__signer = PKCS1_v1_5.new(RSA.importKey(binascii.unhexlify(self.private_key)))
+            self.__signer_key = self.private_key
+        return self.__signer
+
+
+    @classmethod
+    def verify_transaction(cls, transaction):
         """
             Verify the signature of a transaction.
         """
         
-        public_key = RSA.importKey(binascii.unhexlify(transaction.dataOwner))
-        verifier = PKCS1_v1_5.new(public_key)
-        h = SHA256.new((str(transaction.dataOwner) + str(transaction.hop_count)).encode('utf8'))
-        return verifier.verify(h, binascii.unhexlify(transaction.signature))
\ No newline at end of file
+        key = SignatureCache.key(transaction.dataOwner, transaction.hop_count, transaction.signature)
+        if key in cls.signatures:
+            return True
+        if _verify(transaction.dataOwner, transaction.hop_count, transaction.signature):
+            cls.signatures.add(key)
+            return True
+        return False
+
+
+    @classmethod
+    def verify_transactions(cls, transactions):
+        """
+            Verify the signatures of a batch of transactions (e.g. a block).
+            Signatures which are not cached yet are checked in a process pool when there are enough of them.
+        """
+
+        missing = []
+        for tx in transactions:
+            key = SignatureCache.key(tx.dataOwner, tx.hop_count, tx.signature)
+            if key not in cls.signatures:
+                missing.append((key, tx))
+        if len(missing) == 0:
+            return True
+
+        owners = [tx.dataOwner for _, tx in missing]
+        hop_counts = [tx.hop_count for _, tx in missing]
+        signatures = [tx.signature for _, tx in missing]
+        if len(missing) >= VERIFY_BATCH_MIN:
+            pool = cls.__get_verify_pool()
+            chunksize = max(1, len(missing) // ((VERIFY_PROCESSES or os.cpu_count() or 1) * 4))
+            results = list(pool.map(_verify, owners, hop_counts, signatures, chunksize=chunksize))
+        else:
+            results = list(map(_verify, owners, hop_counts, signatures))
+
+        for (key, _), valid in zip(missing, results):
+            if valid:
+                cls.signatures.add(key)
+        return all(results)
+
+
+    @classmethod
+    def __get_verify_pool(cls):
+        """ the process pool of the batch verification, started once by the first batch """
+        if cls.__verify_pool is None:
+            with cls.__verify_pool_lock:
+                if cls.__verify_pool is None:
+                    cls.__verify_pool = ProcessPoolExecutor(VERIFY_PROCESSES)
+        return cls.__verify_pool
\ No newline at end of file